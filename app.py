@@ -65,6 +65,64 @@ bv_code = st.sidebar.text_input("BV 号 (例如 BV1xx411c7mD)", value="BV1xx411c
 max_pages = st.sidebar.number_input("爬取页数 (每页20条)", min_value=1, max_value=100, value=5)
 max_danmaku = st.sidebar.number_input("弹幕爬取条数 (0为不限制)", min_value=0, value=1000, step=100)
 
+backend_label = st.sidebar.selectbox(
+    "推理后端",
+    options=["PyTorch", "ONNX (int8 量化)", "本地推理服务", "蒸馏小模型"],
+    index=0,
+    help="ONNX 后端首次使用时会导出并量化模型 (缓存在 trained_models_onnx)，之后在 CPU 上推理更快。"
+         "本地推理服务需先运行 python src/analysis/inference_server.py，多个页面共用一份模型。"
+         "蒸馏小模型需先运行 python src/analysis/distill.py，层数更少、推理更快，精度略低。"
+)
+if backend_label.startswith("ONNX"):
+    inference_backend = "onnx"
+elif backend_label == "本地推理服务":
+    inference_backend = "remote"
+elif backend_label == "蒸馏小模型":
+    inference_backend = "student"
+else:
+    inference_backend = "torch"
+
+MODEL_LABELS = {"huggingface": "Hugging Face 微调模型", "local": "本地 trained_models"}
+model_name = None
+if inference_backend in ("torch", "onnx"):
+    # 与模型注册表的内置名称一致 (见 model_registry.py)；本地模型存在时默认使用
+    model_options = ["huggingface"] + (["local"] if (PROJECT_ROOT / "trained_models").exists() else [])
+    model_name = st.sidebar.selectbox(
+        "情感模型",
+        options=model_options,
+        index=len(model_options) - 1,
+        format_func=MODEL_LABELS.get,
+        help="切换模型时按需加载，已加载的模型在各页面间共享，超出内存上限时卸载最久未使用的模型。"
+    )
+memory_budget_mb = st.sidebar.number_input(
+    "模型内存上限 (MB)",
+    min_value=256,
+    value=2048,
+    step=256,
+    help="已加载模型的总大小超过该值时，卸载最久未使用的模型。"
+)
+
+if inference_backend == "remote":
+    server_url = st.sidebar.text_input("推理服务地址", value="http://127.0.0.1:8765")
+    num_workers = 1
+else:
+    server_url = None
+    num_workers = st.sidebar.number_input(
+        "推理进程数",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=1,
+        help="大于 1 时启动多个工作进程分片推理 (每个进程各加载一份模型)，适合大量弹幕。"
+    )
+
+use_bf16 = st.sidebar.checkbox(
+    "bf16 低精度推理",
+    value=False,
+    disabled=inference_backend not in ("torch", "student"),
+    help="CPU 支持 AVX512-BF16/AMX 时用 bfloat16 计算，通常快数倍；不支持时自动回退 fp32。"
+         "分析前会在抽样数据上报告与 fp32 的标签一致率。"
+)
+
 st.sidebar.markdown("---")
 st.sidebar.info("提示：先爬取数据，再进行分析。")
 
@@ -90,8 +148,11 @@ with loading_placeholder.container():
 try:
     from src.crawler.main_crawler import crawl_comments_by_bv, crawl_danmaku_by_bv, get_video_info
     from src.analysis.run_prediction import run_prediction_pipeline
+    from src.analysis.semantic_index import index_exists as semantic_index_exists
+    from src.analysis.model_registry import get_registry
     from src.visualization.distribution import plot_emotion_distribution
     from src.visualization.timeline import plot_comment_timeline, plot_video_progress_trend
+    from src.visualization.preview import plot_preview
     from src.visualization.viz_geo_heatmap import plot_geo_heatmap
     from src.visualization.wordcloud_viz import generate_wordcloud
     
@@ -102,28 +163,124 @@ except ImportError as e:
     st.error(f"Import Error: {e}")
     st.stop()
 
+# 各会话共用同一个模型注册表，这里同步侧边栏设置的内存上限
+get_registry(int(memory_budget_mb))
+
 # --- 缓存模型加载 ---
-@st.cache_resource
-def load_sentiment_model():
-    """
-    加载情感分析模型并缓存，避免重复加载
+def load_sentiment_model(model_name=None, backend="torch"):
     """
-    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+    获取情感分析模型 (经由进程内的模型注册表：各会话共享，与 run_prediction_pipeline 共用同一份实例，
+    超出内存上限时卸载最久未使用的模型)
     
-    LOCAL_MODEL_DIR = PROJECT_ROOT / "trained_models"
-    HF_MODEL_ID = "ScarletShinku/bilibili-sentiment-bert"
-    
-    model_path = LOCAL_MODEL_DIR if LOCAL_MODEL_DIR.exists() else HF_MODEL_ID
-    
-    print(f"🚀 [Cache] Loading model from: {model_path}")
+    Args:
+        model_name: 注册表中的名称 ("huggingface"、"local"、"student") 或模型路径，默认模型为 None
+        backend: "torch" 或 "onnx"
+    """
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_path)
-        model = AutoModelForSequenceClassification.from_pretrained(model_path)
-        return model, tokenizer
+        return get_registry().get(model_name, backend)
     except Exception as e:
         st.error(f"模型加载失败: {e}")
         return None, None
 
+@st.cache_resource
+def start_model_warmup():
+    """
+    在后台线程中加载并预热模型：界面先显示出来，点击分析时模型多半已经就绪
+    
+    已有本机调优结果时先应用线程设置 (避免 Streamlit 进程超额占用核心)。
+    页面里不做校准：校准会反复修改进程全局的线程数，干扰同一进程内正在运行的分析，
+    需要时在命令行运行 python src/analysis/autotune.py。
+    """
+    import threading
+    from src.analysis.model import warm_up
+    from src.analysis.autotune import load_cached_tuning, apply_tuning
+
+    apply_tuning(load_cached_tuning())
+
+    def warm_up_model():
+        get_registry().get()
+        warm_up()
+
+    thread = threading.Thread(target=warm_up_model, daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def load_semantic_index(output_path, modified_time):
+    """
+    加载语义检索索引 (按文件修改时间缓存，重新分析后自动失效)
+    """
+    from src.analysis.semantic_index import SemanticIndex
+    return SemanticIndex.load(output_path)
+
+def connect_inference_server(server_url, priority='interactive'):
+    """
+    连接本地推理服务 (模型常驻在服务进程中，本页面不加载模型)
+
+    整个文件的分析用 priority='bulk'，排在其他客户端的单条交互请求之后；单条查询保持 'interactive'。
+    """
+    from src.analysis.inference_server import RemoteSentimentModel
+    try:
+        return RemoteSentimentModel(server_url, priority=priority), None
+    except Exception as e:
+        st.error(f"无法连接推理服务 {server_url}: {e}")
+        return None, None
+
+def start_preview_analysis(pipeline_kwargs, result_state):
+    """
+    在后台线程中运行带快速预览的分析 (见 preview.py)：每轮的抽样估计写入任务状态，页面轮询显示
+    
+    Args:
+        pipeline_kwargs: 传给 run_prediction_pipeline 的参数
+        result_state: 分析完成后写入 st.session_state 的其他键值
+    
+    Returns:
+        dict，任务状态 {estimate, version, figure, done, cancel, result, error, result_state}
+    """
+    import threading
+
+    job = {
+        'estimate': None, 'version': 0, 'figure': None, 'done': False, 'cancel': False,
+        'result': None, 'error': None, 'result_state': result_state,
+    }
+
+    def on_preview(estimate):
+        job['estimate'] = estimate
+        job['version'] += 1
+        return not job['cancel']
+
+    def run():
+        try:
+            job['result'] = run_prediction_pipeline(**pipeline_kwargs, on_preview=on_preview)
+        except Exception as e:
+            job['error'] = str(e)
+        finally:
+            job['done'] = True
+
+    threading.Thread(target=run, daemon=True).start()
+    return job
+
+if inference_backend == "torch":
+    start_model_warmup()
+
+with st.sidebar.expander("🧠 模型状态"):
+    from src.analysis.model import get_load_stats
+    model_stats = get_load_stats()
+    registry_stats = get_registry().stats()
+    st.caption(
+        f"模型注册表：已加载 {len(registry_stats['models'])} 个，占用 {registry_stats['memory_used_mb']} / "
+        f"{registry_stats['memory_budget_mb']} MB；加载 {registry_stats['loads']} 次，命中 {registry_stats['hits']} 次，"
+        f"卸载 {registry_stats['evictions']} 次"
+    )
+    if model_stats:
+        for path, stats in model_stats.items():
+            st.caption(
+                f"`{Path(path).name}`：加载 {stats['load_seconds']}s ({stats.get('source', 'from_pretrained')})，参数 {stats['param_mb']} MB，"
+                f"进程内存 +{stats['rss_delta_mb']} MB，{'已预热' if stats['warmed_up'] else '预热中'}"
+            )
+    else:
+        st.caption("模型正在后台加载，首次分析时就绪。")
+
 # 清除加载动画
 loading_placeholder.empty()
 
@@ -220,31 +377,125 @@ with col2:
     
     current_raw_data = file_options.get(selected_file_name) if selected_file_name else None
 
+    build_semantic_index = st.checkbox(
+        "同时建立语义检索索引",
+        value=False,
+        disabled=inference_backend not in ("torch", "student"),
+        help="在情感推理的同一次前向计算中保存句向量，用于查找相似评论 (仅 PyTorch 后端)"
+    )
+
+    fast_preview = st.checkbox(
+        "快速预览 (先分析分层抽样)",
+        value=False,
+        disabled=build_semantic_index or num_workers > 1,
+        help="先分析按发布时间和视频进度分层抽样的一小部分数据，几秒内显示带误差范围的情感分布与趋势，"
+             "随后在后台逐轮补全到全量；看到结果后可以随时停止。不能与语义检索索引或多进程推理同时使用。"
+    )
+
     if st.button("🧠 开始分析", disabled=not current_raw_data, use_container_width=True):
         with st.spinner("正在加载模型并分析情感 (可能需要几秒钟)..."):
             try:
                 # 预加载模型
-                model, tokenizer = load_sentiment_model()
+                if inference_backend == "remote":
+                    model, tokenizer = connect_inference_server(server_url, priority='bulk')
+                elif inference_backend == "student":
+                    model, tokenizer = load_sentiment_model("student")
+                else:
+                    model, tokenizer = load_sentiment_model(model_name, inference_backend)
                 if model is None:
                     st.error("无法加载模型，分析终止。")
                 else:
                     output_csv = PROJECT_ROOT / "data" / "processed" / f"predictions_{Path(current_raw_data).stem}.csv"
                     # 传入预加载的模型
-                    df = run_prediction_pipeline(
+                    pipeline_kwargs = dict(
                         input_path=current_raw_data, 
                         output_path=output_csv,
+                        model_path=get_registry().resolve(model_name, inference_backend)[1] if inference_backend in ("torch", "onnx") else None,
                         model=model,
-                        tokenizer=tokenizer
+                        tokenizer=tokenizer,
+                        backend=inference_backend,
+                        num_workers=int(num_workers),
+                        server_url=server_url,
+                        save_embeddings=build_semantic_index and inference_backend in ("torch", "student"),
+                        # 只使用已有的调优结果，不在共享进程内校准 (见 start_model_warmup)
+                        autotune="cached" if inference_backend in ("torch", "student") else False,
+                        precision="bf16" if use_bf16 and inference_backend in ("torch", "student") else "fp32"
                     )
+                    result_state = {
+                        'analysis_output': str(output_csv),
+                        'analysis_backend': inference_backend,
+                        'analysis_model': model_name,
+                    }
+                    st.session_state.pop('preview_job', None)
                     
-                    if df is not None:
-                        st.session_state['analysis_result'] = df
-                        st.success("✅ 分析完成！")
+                    if fast_preview and not build_semantic_index and num_workers <= 1:
+                        # 后台运行，下方的快速预览区域轮询显示抽样估计
+                        st.session_state.pop('analysis_result', None)
+                        st.session_state['preview_job'] = start_preview_analysis(pipeline_kwargs, result_state)
                     else:
-                        st.error("分析失败，请检查日志。")
+                        df = run_prediction_pipeline(**pipeline_kwargs)
+                        
+                        if df is not None:
+                            st.session_state['analysis_result'] = df
+                            st.session_state.update(result_state)
+                            st.success("✅ 分析完成！")
+                        else:
+                            st.error("分析失败，请检查日志。")
             except Exception as e:
                 st.error(f"运行出错: {e}")
 
+# 快速预览：后台分析进行中时，定时刷新显示最新一轮的抽样估计
+def render_preview_estimate(preview_job):
+    """显示任务状态中最新一轮的抽样估计"""
+    # 回调先写估计再增加版本号：先读版本号，保证估计不比它旧
+    version = preview_job['version']
+    estimate = preview_job['estimate']
+    if estimate is None:
+        st.info("正在分析第一批抽样数据...")
+        return
+    if estimate['fraction'] < 1:
+        st.caption(
+            f"已分析 {estimate['sampled']} / {estimate['total']} 条，误差线为抽样误差的 95% 置信区间，"
+            f"{'正在停止...' if preview_job['cancel'] else '后台继续补全中...'}"
+        )
+    # 片段每秒重新运行一次，同一轮的估计只绘制一次
+    if preview_job['figure'] is None or preview_job['figure'][0] != version:
+        preview_job['figure'] = (version, plot_preview(estimate)[0])
+    st.pyplot(preview_job['figure'][1])
+
+@st.fragment(run_every=1)
+def show_running_preview():
+    """
+    分析进行中时每秒只重新运行这个片段 (不阻塞整个页面，停止按钮随时可用)；
+    后台任务结束后触发整页重新运行，由下方显示最终结果
+    """
+    preview_job = st.session_state.get('preview_job')
+    if preview_job is None:
+        return
+    if preview_job['done']:
+        st.rerun()
+    if st.button("⏹️ 停止完整分析", key="stop_preview", help="结果不值得全量分析时停止，当前一轮结束后生效"):
+        preview_job['cancel'] = True
+    render_preview_estimate(preview_job)
+
+preview_job = st.session_state.get('preview_job')
+if preview_job is not None:
+    st.markdown("---")
+    st.header("⚡ 快速预览")
+    if not preview_job['done']:
+        show_running_preview()
+    else:
+        render_preview_estimate(preview_job)
+        if preview_job['result'] is not None:
+            st.session_state['analysis_result'] = preview_job['result']
+            st.session_state.update(preview_job['result_state'])
+            del st.session_state['preview_job']
+            st.success("✅ 分析完成！")
+        elif preview_job['cancel']:
+            st.warning("已停止完整分析，上图为抽样估计。")
+        else:
+            st.error(f"运行出错: {preview_job['error']}" if preview_job['error'] else "分析失败，请检查日志。")
+
 st.markdown("---")
 
 # Visualization Section
@@ -259,6 +510,10 @@ if 'analysis_result' in st.session_state:
     if has_location:
         tab_names.append("地域热力图")
     tab_names.append("原始数据")
+    analysis_output = st.session_state.get('analysis_output')
+    has_semantic_index = analysis_output is not None and semantic_index_exists(analysis_output)
+    if has_semantic_index:
+        tab_names.append("相似评论搜索")
     
     tabs = st.tabs(tab_names)
     
@@ -418,3 +673,35 @@ if 'analysis_result' in st.session_state:
             file_name=f"sentiment_analysis_{st.session_state.get('current_bv', 'result')}.csv",
             mime='text/csv',
         )
+
+    if has_semantic_index:
+        with tabs[-1]:
+            st.subheader(f"相似{data_type_name}搜索")
+            query = st.text_input("输入一句话，查找语义相近的内容:", placeholder="例如：这集剧情太好哭了")
+            top_k = st.slider("返回条数", min_value=5, max_value=50, value=10, step=5)
+            if query.strip():
+                try:
+                    index = load_semantic_index(analysis_output, Path(analysis_output).stat().st_mtime)
+                    # 查询需用建索引时的同一个模型编码
+                    if st.session_state.get('analysis_backend') == "student":
+                        model, tokenizer = load_sentiment_model("student")
+                    else:
+                        model, tokenizer = load_sentiment_model(st.session_state.get('analysis_model'))
+                    if model is not None:
+                        search_start = time.perf_counter()
+                        hits = index.search([query], model, tokenizer, k=top_k)[0]
+                        search_ms = (time.perf_counter() - search_start) * 1000
+                        rows = []
+                        for text_id, score in hits:
+                            matched = index.rows_for(text_id)
+                            first = df.iloc[matched[0]]
+                            rows.append({
+                                '相似度': round(score, 3),
+                                '内容': first['content'],
+                                '情感': first.get('predicted_emotion', first['labels']),
+                                '出现次数': len(matched),
+                            })
+                        st.caption(f"在 {len(index)} 条不同文本中检索，用时 {search_ms:.0f} ms")
+                        st.dataframe(pd.DataFrame(rows), use_container_width=True)
+                except Exception as e:
+                    st.error(f"检索失败: {e}")
@@ -0,0 +1,252 @@
+"""
+推理参数自动调优
+
+首次在某台机器上运行时做一次简短校准：在合成语料上测量不同的 torch 算子内线程数 (intra-op)、
+算子间线程数 (inter-op) 与 token 预算组合的吞吐量，选出最快的一组，按主机 + 模型缓存到
+data/cache/autotune.json。之后 CLI 和 Streamlit 直接读取缓存，不再重复校准。
+"""
+import sys
+import os
+import json
+import time
+import queue
+import platform
+import threading
+from pathlib import Path
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis.inference import predict_proba, DEFAULT_MAX_LENGTH, DEFAULT_TOKEN_BUDGET
+
+AUTOTUNE_CACHE_PATH = PROJECT_ROOT / "data" / "cache" / "autotune.json"
+# 校准语料：弹幕为主，夹杂少量长评论
+CALIBRATION_DANMAKU = 384
+CALIBRATION_COMMENTS = 64
+# 候选 token 预算 (以 max_length 为单位的行数)
+BUDGET_ROWS_CANDIDATES = (16, 32, 64, 128)
+INTEROP_CANDIDATES = (1, 2)
+
+_lock = threading.Lock()
+
+def get_host_key():
+    """主机标识：主机名 + CPU 架构与核数 + torch 版本"""
+    import torch
+    return f"{platform.node()}|{platform.machine()}|{os.cpu_count()}cpu|torch{torch.__version__}"
+
+def default_thread_candidates():
+    """候选算子内线程数：1、2、4……直到全部核数，外加半数核"""
+    cpu = os.cpu_count() or 1
+    candidates = {cpu, max(1, cpu // 2)}
+    n = 1
+    while n < cpu:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+def _calibration_texts():
+    from src.analysis.benchmark import make_synthetic_corpus
+    return (
+        make_synthetic_corpus("danmaku", CALIBRATION_DANMAKU, seed=7)
+        + make_synthetic_corpus("comment", CALIBRATION_COMMENTS, seed=7)
+    )
+
+def _measure(texts, model, tokenizer, max_length, token_budget, repeat=2):
+    """多次测量取最快一次的吞吐量 (texts/s)"""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict_proba(texts, model, tokenizer, max_length=max_length, token_budget=token_budget, show_progress=False)
+        best = max(best, len(texts) / (time.perf_counter() - start))
+    return best
+
+def _measure_interop_worker(model_path, interop, intra, max_length, token_budget, result_queue):
+    """子进程入口：inter-op 线程数只能在进程开始并行计算前设置一次，因此每个候选单独起进程"""
+    try:
+        import torch
+        torch.set_num_interop_threads(interop)
+        torch.set_num_threads(intra)
+        from src.analysis.model import get_model_and_tokenizer
+        model, tokenizer = get_model_and_tokenizer(model_path)
+        texts = _calibration_texts()
+        _measure(texts[:64], model, tokenizer, max_length, token_budget, repeat=1)
+        result_queue.put(_measure(texts, model, tokenizer, max_length, token_budget))
+    except Exception as e:
+        result_queue.put(f"{type(e).__name__}: {e}")
+
+def _measure_interop(model_path, intra, max_length, token_budget):
+    """
+    在子进程中比较各 inter-op 线程数
+
+    Returns:
+        dict {interop: texts/s}
+    """
+    import multiprocessing as mp
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for interop in INTEROP_CANDIDATES:
+        result_queue = ctx.Queue()
+        proc = ctx.Process(
+            target=_measure_interop_worker,
+            args=(model_path, interop, intra, max_length, token_budget, result_queue),
+        )
+        proc.start()
+        outcome = None
+        while outcome is None:
+            try:
+                outcome = result_queue.get(timeout=1)
+            except queue.Empty:
+                if not proc.is_alive():
+                    outcome = f"worker exited with code {proc.exitcode}"
+        proc.join()
+        if isinstance(outcome, str):
+            print(f"⚠️ inter-op threads={interop}: {outcome}")
+        else:
+            results[interop] = outcome
+            print(f"   inter-op threads={interop}: {outcome:.1f} texts/s")
+    return results
+
+def calibrate(model, tokenizer, model_path=None, max_length=DEFAULT_MAX_LENGTH, thread_candidates=None, tune_interop=True):
+    """
+    在当前机器上校准推理参数
+
+    先在默认 token 预算下扫描算子内线程数，再在最快的线程数下扫描 token 预算，
+    最后 (可选) 在子进程中比较 inter-op 线程数。
+
+    Args:
+        model: 情感分类模型 (PyTorch)
+        tokenizer: 分词器
+        model_path: 模型路径 (校准 inter-op 线程时子进程按它重新加载)
+        max_length: int，截断长度
+        thread_candidates: 候选算子内线程数 (默认见 default_thread_candidates)
+        tune_interop: bool，是否校准 inter-op 线程数
+
+    Returns:
+        dict，{intra_op_threads, interop_threads, token_budget, texts_per_sec, ...}
+    """
+    import torch
+
+    texts = _calibration_texts()
+    original_threads = torch.get_num_threads()
+    thread_candidates = thread_candidates or default_thread_candidates()
+    print(f"🎛️ Calibrating inference settings on this machine ({os.cpu_count()} cores)...")
+    start = time.perf_counter()
+
+    # 预热
+    predict_proba(texts[:64], model, tokenizer, max_length=max_length, show_progress=False)
+
+    thread_results = {}
+    for n in thread_candidates:
+        torch.set_num_threads(n)
+        thread_results[n] = _measure(texts, model, tokenizer, max_length, DEFAULT_TOKEN_BUDGET)
+        print(f"   intra-op threads={n}: {thread_results[n]:.1f} texts/s")
+    best_threads = max(thread_results, key=thread_results.get)
+    torch.set_num_threads(best_threads)
+
+    budget_results = {}
+    for rows in BUDGET_ROWS_CANDIDATES:
+        budget = rows * max_length
+        budget_results[budget] = _measure(texts, model, tokenizer, max_length, budget)
+        print(f"   token budget={budget} ({rows} x {max_length}): {budget_results[budget]:.1f} texts/s")
+    best_budget = max(budget_results, key=budget_results.get)
+    torch.set_num_threads(original_threads)
+
+    interop_results = {}
+    best_interop = 1
+    if tune_interop and model_path is not None and (os.cpu_count() or 1) > 1:
+        interop_results = _measure_interop(str(model_path), best_threads, max_length, best_budget)
+        if interop_results:
+            best_interop = max(interop_results, key=interop_results.get)
+
+    tuning = {
+        'intra_op_threads': best_threads,
+        'interop_threads': best_interop,
+        'token_budget': best_budget,
+        'max_length': max_length,
+        'texts_per_sec': round(budget_results[best_budget], 1),
+        'default_texts_per_sec': round(thread_results.get(original_threads, thread_results[best_threads]), 1),
+        'calibration_seconds': round(time.perf_counter() - start, 1),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    print(
+        f"✅ Tuned: intra-op {best_threads} threads, inter-op {best_interop}, token budget {best_budget} "
+        f"-> {tuning['texts_per_sec']} texts/s ({tuning['calibration_seconds']}s calibration)"
+    )
+    return tuning
+
+def _read_cache():
+    if not AUTOTUNE_CACHE_PATH.exists():
+        return {}
+    try:
+        return json.loads(AUTOTUNE_CACHE_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+def load_cached_tuning(model_path=None, max_length=DEFAULT_MAX_LENGTH):
+    """
+    读取本机对该模型的调优结果 (不加载模型，不做校准)
+
+    Returns:
+        dict；没有缓存时返回 None
+    """
+    from src.analysis.model import resolve_model_path
+    key = f"{resolve_model_path(model_path)}|len{max_length}"
+    return _read_cache().get(get_host_key(), {}).get(key)
+
+def save_tuning(tuning, model_path=None, max_length=DEFAULT_MAX_LENGTH):
+    """写入调优缓存 (按主机 + 模型 + max_length)"""
+    from src.analysis.model import resolve_model_path
+    cache = _read_cache()
+    key = f"{resolve_model_path(model_path)}|len{max_length}"
+    cache.setdefault(get_host_key(), {})[key] = tuning
+    AUTOTUNE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = AUTOTUNE_CACHE_PATH.with_name(AUTOTUNE_CACHE_PATH.name + ".tmp")
+    tmp_path.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp_path, AUTOTUNE_CACHE_PATH)
+
+def apply_tuning(tuning):
+    """
+    把调优结果应用到当前进程的 torch 线程设置
+
+    inter-op 线程数只能在进程开始并行计算前设置，已经太晚时保持现状并给出提示。
+    """
+    import torch
+    if tuning is None:
+        return
+    torch.set_num_threads(tuning['intra_op_threads'])
+    if torch.get_num_interop_threads() != tuning['interop_threads']:
+        try:
+            torch.set_num_interop_threads(tuning['interop_threads'])
+        except RuntimeError:
+            print("⚠️ inter-op threads can only be set before any parallel work starts, keeping the current value")
+
+def get_tuning(model, tokenizer, model_path=None, max_length=DEFAULT_MAX_LENGTH, force=False, calibrate_if_missing=True):
+    """
+    获取本机调优结果：有缓存时直接读取，否则校准一次并缓存，并应用到当前进程
+
+    校准会反复修改进程全局的 torch 线程数，同一进程内还有其他推理在运行时 (如 Streamlit)
+    应传入 calibrate_if_missing=False，只使用已有的结果。
+
+    Returns:
+        dict，见 calibrate；calibrate_if_missing=False 且没有缓存时返回 None
+    """
+    if model_path is None:
+        model_path = getattr(model.config, '_name_or_path', None) or None
+    # 加锁：多个分析请求同时触发时只校准一次
+    with _lock:
+        tuning = None if force else load_cached_tuning(model_path, max_length)
+        if tuning is None:
+            if not calibrate_if_missing:
+                return None
+            tuning = calibrate(model, tokenizer, model_path=model_path, max_length=max_length)
+            save_tuning(tuning, model_path, max_length)
+    apply_tuning(tuning)
+    return tuning
+
+if __name__ == "__main__":
+    from src.analysis.model import get_model_and_tokenizer
+
+    model, tokenizer = get_model_and_tokenizer()
+    get_tuning(model, tokenizer, force=input("是否忽略缓存重新校准？(y/n，默认n): ").strip().lower() == 'y')
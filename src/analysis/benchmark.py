@@ -0,0 +1,310 @@
+"""
+情感模型推理基准测试
+
+在合成语料和从 data/raw 抽样的评论/弹幕语料上，扫描批大小、max_length、torch 线程数与推理后端，
+记录吞吐量 (texts/s)、批次延迟分位数和峰值内存，结果保存为 data/benchmarks/ 下的 JSON。
+每个配置在独立的子进程中运行，线程设置和峰值内存互不干扰。
+之后可与保存的基线对比，吞吐下降或延迟上升超过容差的配置会被标记为回退。
+"""
+import sys
+import os
+import json
+import time
+import random
+import platform
+import queue
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis.inference import DEFAULT_MAX_LENGTH, DEFAULT_MAX_BATCH_SIZE
+
+BENCHMARK_DIR = PROJECT_ROOT / "data" / "benchmarks"
+BASELINE_PATH = BENCHMARK_DIR / "baseline.json"
+DEFAULT_CORPUS_SIZE = 2000
+# 吞吐下降 / 延迟上升超过该比例视为回退
+DEFAULT_TOLERANCE = 0.10
+
+_SYNTHETIC_CHARS = "好坏哈草啊呀哭笑爱恨前方高能泪目绝了无语离谱这个视频真的太好看了吧up主辛苦"
+_SYNTHETIC_DANMAKU = ["哈哈哈", "前方高能", "awsl", "泪目", "2333", "好耶", "？？？", "来了来了", "[doge]", "妙啊"]
+
+def make_synthetic_corpus(kind="danmaku", size=DEFAULT_CORPUS_SIZE, seed=42):
+    """
+    生成合成语料：弹幕短 (2~20 字)，评论长 (20~200 字)
+
+    Returns:
+        list of str
+    """
+    rng = random.Random(seed)
+    low, high = (2, 20) if kind == "danmaku" else (20, 200)
+    texts = []
+    for _ in range(size):
+        if kind == "danmaku" and rng.random() < 0.3:
+            texts.append(rng.choice(_SYNTHETIC_DANMAKU))
+        else:
+            texts.append("".join(rng.choice(_SYNTHETIC_CHARS) for _ in range(rng.randint(low, high))))
+    return texts
+
+def sample_corpus(kind="danmaku", size=DEFAULT_CORPUS_SIZE, seed=42):
+    """
+    从 data/raw 抽样真实语料 (comments.csv / danmaku.csv)
+
+    Returns:
+        list of str；文件不存在时返回空列表
+    """
+    csv_path = PROJECT_ROOT / "data" / "raw" / ("danmaku.csv" if kind == "danmaku" else "comments.csv")
+    if not csv_path.exists():
+        return []
+    df = pd.read_csv(csv_path, encoding='utf-8-sig', on_bad_lines='skip')
+    if 'content' not in df.columns:
+        return []
+    texts = df['content'].dropna().astype(str)
+    return texts.sample(n=min(size, len(texts)), random_state=seed).tolist()
+
+def build_corpora(size=DEFAULT_CORPUS_SIZE):
+    """合成与抽样语料 {名称: texts}，没有爬取数据时只包含合成语料"""
+    corpora = {}
+    for kind in ("danmaku", "comment"):
+        corpora[f"synthetic_{kind}"] = make_synthetic_corpus(kind, size)
+        sampled = sample_corpus(kind, size)
+        if sampled:
+            corpora[f"sampled_{kind}"] = sampled
+    return corpora
+
+def get_peak_rss_mb():
+    """当前进程峰值常驻内存 (MB)"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+def _run_config(config, texts, model_path, result_queue):
+    """子进程入口：按配置加载模型并计时"""
+    try:
+        import torch
+        torch.set_num_threads(config['threads'])
+        from src.analysis.inference import predict_proba
+
+        if config['backend'] == "onnx":
+            from src.analysis.onnx_backend import load_onnx_model
+            model, tokenizer = load_onnx_model(model_path, num_threads=config['threads'])
+        else:
+            from src.analysis.model import get_model_and_tokenizer
+            model, tokenizer = get_model_and_tokenizer(model_path)
+
+        kwargs = {
+            'max_length': config['max_length'],
+            # 批大小按"每批最多 batch_size 条 max_length 长的文本"换算为 token 预算
+            'token_budget': config['batch_size'] * config['max_length'],
+            'max_batch_size': DEFAULT_MAX_BATCH_SIZE,
+            'show_progress': False,
+        }
+        # 预热，排除首次调用的初始化开销
+        predict_proba(texts[:64], model, tokenizer, **kwargs)
+
+        stats = {}
+        start = time.perf_counter()
+        predict_proba(texts, model, tokenizer, stats=stats, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        latencies_ms = np.array(stats['batch_seconds']) * 1000
+        result_queue.put({
+            'texts_per_sec': round(len(texts) / elapsed, 2),
+            'seconds': round(elapsed, 3),
+            'batches': len(latencies_ms),
+            'latency_p50_ms': round(float(np.percentile(latencies_ms, 50)), 2),
+            'latency_p95_ms': round(float(np.percentile(latencies_ms, 95)), 2),
+            'latency_p99_ms': round(float(np.percentile(latencies_ms, 99)), 2),
+            'peak_rss_mb': get_peak_rss_mb(),
+        })
+    except Exception as e:
+        result_queue.put({'error': f"{type(e).__name__}: {e}"})
+
+def config_key(result):
+    """用于与基线匹配的配置键"""
+    return (result['corpus'], result['backend'], result['batch_size'], result['max_length'], result['threads'])
+
+def run_benchmark(
+    model_path=None,
+    corpora=None,
+    batch_sizes=(16, 32, 64),
+    max_lengths=(64, DEFAULT_MAX_LENGTH),
+    threads=None,
+    backends=("torch",),
+    output_path=None,
+):
+    """
+    运行基准测试并保存结果
+
+    Args:
+        model_path: 模型路径或 Hugging Face ID (默认同 run_prediction_pipeline)
+        corpora: dict {名称: texts} (默认见 build_corpora)
+        batch_sizes: 批大小 (换算为 token 预算 = batch_size × max_length)
+        max_lengths: 截断长度
+        threads: torch 线程数 (默认 1、半数核、全部核)
+        backends: 推理后端 ("torch" / "onnx")
+        output_path: 结果文件路径 (默认 data/benchmarks/bench_<时间>.json)
+
+    Returns:
+        dict，{host, created, results}
+    """
+    import multiprocessing as mp
+    from src.analysis.model import resolve_model_path
+
+    model_path = str(resolve_model_path(model_path))
+    corpora = corpora or build_corpora()
+    if threads is None:
+        cpu = os.cpu_count() or 1
+        threads = sorted({1, max(1, cpu // 2), cpu})
+
+    if "onnx" in backends:
+        # 先在主进程确保导出产物存在，避免子进程计时中包含导出
+        from src.analysis.onnx_backend import load_onnx_model
+        load_onnx_model(model_path)
+
+    configs = [
+        {'corpus': corpus, 'backend': backend, 'batch_size': batch_size, 'max_length': max_length, 'threads': n}
+        for corpus, backend, batch_size, max_length, n in product(corpora, backends, batch_sizes, max_lengths, threads)
+    ]
+    print(f"🏁 Running {len(configs)} benchmark configurations on {model_path}...")
+
+    ctx = mp.get_context("spawn")
+    results = []
+    for i, config in enumerate(configs, 1):
+        result_queue = ctx.Queue()
+        proc = ctx.Process(target=_run_config, args=(config, corpora[config['corpus']], model_path, result_queue))
+        proc.start()
+        while True:
+            try:
+                outcome = result_queue.get(timeout=1)
+                break
+            except queue.Empty:
+                # 子进程异常退出 (如内存不足被杀) 时不会放入结果
+                if not proc.is_alive():
+                    outcome = {'error': f"worker exited with code {proc.exitcode}"}
+                    break
+        proc.join()
+        result = dict(config, **outcome)
+        results.append(result)
+        if 'error' in result:
+            print(f"❌ [{i}/{len(configs)}] {config}: {result['error']}")
+        else:
+            print(
+                f"⏱️ [{i}/{len(configs)}] {config['corpus']} {config['backend']} bs={config['batch_size']} "
+                f"len={config['max_length']} threads={config['threads']}: {result['texts_per_sec']:.1f} texts/s, "
+                f"p95 {result['latency_p95_ms']:.1f} ms, peak RSS {result['peak_rss_mb']} MB"
+            )
+
+    import torch
+    report = {
+        'host': {
+            'hostname': platform.node(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+        },
+        'model_path': model_path,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+    if output_path is None:
+        output_path = BENCHMARK_DIR / f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"💾 Benchmark results saved to {output_path}")
+    return report
+
+def latest_results_path():
+    """最近一次的结果文件"""
+    paths = sorted(BENCHMARK_DIR.glob("bench_*.json"))
+    return paths[-1] if paths else None
+
+def save_baseline(results_path=None):
+    """把一次结果保存为基线 (默认最近一次)"""
+    results_path = Path(results_path or latest_results_path())
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    BASELINE_PATH.write_text(results_path.read_text(encoding='utf-8'), encoding='utf-8')
+    print(f"📌 Saved {results_path.name} as the benchmark baseline")
+    return BASELINE_PATH
+
+def compare_results(current_path=None, baseline_path=BASELINE_PATH, tolerance=DEFAULT_TOLERANCE):
+    """
+    与基线对比，标记回退的配置
+
+    Args:
+        current_path: 本次结果文件 (默认最近一次)
+        baseline_path: 基线文件
+        tolerance: float，吞吐下降或 p95 延迟上升超过该比例视为回退
+
+    Returns:
+        list of dict，回退的配置及变化幅度
+    """
+    current = json.loads(Path(current_path or latest_results_path()).read_text(encoding='utf-8'))
+    baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))
+    if current['host'].get('hostname') != baseline['host'].get('hostname'):
+        print(f"⚠️ Baseline was recorded on {baseline['host'].get('hostname')}, results may not be comparable")
+
+    baseline_by_key = {config_key(r): r for r in baseline['results'] if 'error' not in r}
+    regressions = []
+    print("📊 config | texts/s (baseline -> now) | p95 ms (baseline -> now)")
+    for result in current['results']:
+        old = baseline_by_key.get(config_key(result))
+        if old is None or 'error' in result:
+            continue
+        throughput_change = result['texts_per_sec'] / old['texts_per_sec'] - 1
+        latency_change = result['latency_p95_ms'] / old['latency_p95_ms'] - 1 if old['latency_p95_ms'] else 0.0
+        regressed = throughput_change < -tolerance or latency_change > tolerance
+        flag = "❌" if regressed else "✅"
+        print(
+            f"{flag} {' / '.join(str(k) for k in config_key(result))} | "
+            f"{old['texts_per_sec']:.1f} -> {result['texts_per_sec']:.1f} ({throughput_change:+.1%}) | "
+            f"{old['latency_p95_ms']:.1f} -> {result['latency_p95_ms']:.1f} ({latency_change:+.1%})"
+        )
+        if regressed:
+            regressions.append({
+                'config': dict(zip(('corpus', 'backend', 'batch_size', 'max_length', 'threads'), config_key(result))),
+                'throughput_change': round(throughput_change, 4),
+                'latency_p95_change': round(latency_change, 4),
+            })
+
+    if regressions:
+        print(f"❌ {len(regressions)} configuration(s) regressed beyond {tolerance:.0%}")
+    else:
+        print(f"✅ No regressions beyond {tolerance:.0%}")
+    return regressions
+
+if __name__ == "__main__":
+    print("========================================")
+    print("   Bilibili 情感分析 - 推理基准测试")
+    print("========================================")
+    print("1. 快速测试 (默认批大小与长度，只扫描线程数)")
+    print("2. 完整扫描 (批大小 × max_length × 线程数 × 后端)")
+    print("3. 与基线对比 (最近一次结果)")
+    print("4. 将最近一次结果保存为基线")
+    choice = input("👉 请输入数字 (1-4): ").strip()
+
+    if choice == "1":
+        run_benchmark(batch_sizes=(32,), max_lengths=(DEFAULT_MAX_LENGTH,))
+    elif choice == "2":
+        run_benchmark(backends=("torch", "onnx"))
+    elif choice == "3":
+        if latest_results_path() is None or not BASELINE_PATH.exists():
+            print("❌ 需要先运行一次基准测试并保存基线。")
+        else:
+            regressions = compare_results()
+            sys.exit(1 if regressions else 0)
+    elif choice == "4":
+        if latest_results_path() is None:
+            print("❌ 还没有基准测试结果。")
+        else:
+            save_baseline()
+    else:
+        print("❌ 输入无效")
@@ -0,0 +1,234 @@
+"""
+置信度级联推理：先用廉价模型，拿不准的再交给 BERT
+
+廉价模型是字符 n-gram TF-IDF + 逻辑回归，用 BERT 自己在本项目数据上的预测结果训练，
+因此它学的是"模仿 BERT"。推理时廉价模型最大概率不低于阈值的行直接采用其结果，
+其余行才进入 BERT。阈值越高，交给 BERT 的比例越大，与全量 BERT 的一致率也越高。
+"""
+import sys
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+CASCADE_MODEL_DIR = PROJECT_ROOT / "trained_models_cascade"
+DEFAULT_CASCADE_THRESHOLD = 0.9
+# 训练廉价模型所需的最少不同文本数
+MIN_TRAIN_TEXTS = 200
+# 训练时评估的阈值
+EVAL_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+def _model_paths(model_key):
+    return CASCADE_MODEL_DIR / f"{model_key}.joblib", CASCADE_MODEL_DIR / f"{model_key}.json"
+
+def cheap_predict_proba(cheap_model, texts, num_labels):
+    """
+    廉价模型推理，返回 (len(texts), num_labels) 的概率矩阵
+
+    训练数据中没有出现过的类别概率为 0。
+    """
+    probs = np.zeros((len(texts), num_labels), dtype=np.float32)
+    if len(texts):
+        probs[:, cheap_model.classes_] = cheap_model.predict_proba(list(texts))
+    return probs
+
+def evaluate_cascade(cheap_probs, bert_labels, thresholds=EVAL_THRESHOLDS):
+    """
+    评估不同阈值下的级联效果
+
+    Args:
+        cheap_probs: np.ndarray，廉价模型概率
+        bert_labels: np.ndarray，全量 BERT 的标签
+        thresholds: 待评估的阈值
+
+    Returns:
+        list of dict，{threshold, routed_to_bert, agreement}
+    """
+    confidence = cheap_probs.max(axis=-1)
+    cheap_labels = cheap_probs.argmax(axis=-1)
+    report = []
+    for threshold in thresholds:
+        confident = confidence >= threshold
+        # 交给 BERT 的行与全量 BERT 必然一致，只有廉价模型接手的行可能不同
+        agreement = 1.0 - np.mean(confident & (cheap_labels != bert_labels)) if len(bert_labels) else 1.0
+        report.append({
+            'threshold': threshold,
+            'routed_to_bert': float(1.0 - confident.mean()) if len(bert_labels) else 0.0,
+            'agreement': float(agreement),
+        })
+    return report
+
+def print_cascade_report(report):
+    print("📐 threshold | routed to BERT | agreement with full BERT")
+    for row in report:
+        print(f"   {row['threshold']:>9.2f} | {row['routed_to_bert']:>14.1%} | {row['agreement']:.2%}")
+
+def train_cascade_model(texts, bert_labels, model_key, num_labels, validation_fraction=0.2, random_state=42):
+    """
+    用 BERT 的预测结果训练廉价模型并保存
+
+    Args:
+        texts: list of str，已规范化的文本 (见 normalize_texts)
+        bert_labels: array-like，BERT 对这些文本的预测标签
+        model_key: str，BERT 模型指纹 (见 get_model_fingerprint)，廉价模型按它保存
+        num_labels: int，类别数
+        validation_fraction: float，留出评估的比例
+        random_state: int，随机种子
+
+    Returns:
+        廉价模型 (sklearn Pipeline)；数据不足时返回 None
+    """
+    import joblib
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    # 相同文本只保留一次，避免高频弹幕淹没其他样本
+    data = pd.DataFrame({'text': list(texts), 'label': np.asarray(bert_labels)}).drop_duplicates('text')
+    if len(data) < MIN_TRAIN_TEXTS:
+        print(f"⚠️ Not enough distinct texts to train the cascade model ({len(data)} < {MIN_TRAIN_TEXTS})")
+        return None
+    if data['label'].nunique() < 2:
+        print("⚠️ BERT labels contain a single class, the cascade model would learn nothing")
+        return None
+
+    data = data.sample(frac=1.0, random_state=random_state)
+    n_val = int(len(data) * validation_fraction)
+    train, val = data.iloc[n_val:], data.iloc[:n_val]
+
+    def build():
+        return make_pipeline(
+            TfidfVectorizer(analyzer='char', ngram_range=(1, 3), min_df=2, sublinear_tf=True, max_features=200000),
+            LogisticRegression(max_iter=1000, C=4.0),
+        )
+
+    print(f"🏋️ Training cascade model on {len(train)} texts (validating on {len(val)})...")
+    start = time.perf_counter()
+    cheap_model = build().fit(train['text'], train['label'])
+    report = []
+    if n_val:
+        val_probs = cheap_predict_proba(cheap_model, val['text'].tolist(), num_labels)
+        report = evaluate_cascade(val_probs, val['label'].to_numpy())
+        print_cascade_report(report)
+        # 评估完成后用全部数据重新训练
+        cheap_model = build().fit(data['text'], data['label'])
+    print(f"✅ Cascade model trained in {time.perf_counter() - start:.1f}s")
+
+    model_path, meta_path = _model_paths(model_key)
+    CASCADE_MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    joblib.dump(cheap_model, model_path)
+    meta = {
+        'model_key': model_key,
+        'num_texts': len(data),
+        'validation': report,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+    return cheap_model
+
+def load_cascade_model(model_key):
+    """
+    加载与 BERT 模型指纹对应的廉价模型
+
+    Returns:
+        (廉价模型, meta)；不存在时返回 (None, None)
+    """
+    model_path, meta_path = _model_paths(model_key)
+    if not model_path.exists():
+        return None, None
+    import joblib
+    meta = json.loads(meta_path.read_text(encoding='utf-8')) if meta_path.exists() else {}
+    return joblib.load(model_path), meta
+
+def predict_proba_cascade(texts, predict_fn, cheap_model, num_labels, threshold=DEFAULT_CASCADE_THRESHOLD, stats=None):
+    """
+    级联推理：廉价模型有把握的行直接采用，其余行调用 predict_fn (BERT)
+
+    Args:
+        texts: list of str，待预测文本
+        predict_fn: 函数，接受 list of str 返回 (n, num_labels) 概率矩阵
+        cheap_model: 廉价模型 (见 train_cascade_model)
+        num_labels: int，类别数
+        threshold: float，廉价模型最大概率不低于该值时直接采用
+        stats: dict (可选)，传入时累加 {texts, routed_to_bert}
+
+    Returns:
+        np.ndarray，形状 (len(texts), num_labels) 的概率矩阵，行顺序与输入一致
+    """
+    texts = list(texts)
+    probs = cheap_predict_proba(cheap_model, texts, num_labels)
+    uncertain = np.flatnonzero(probs.max(axis=-1) < threshold)
+    print(
+        f"🪜 Cascade: {len(texts) - len(uncertain)} texts labelled by the cheap model, "
+        f"{len(uncertain)} ({len(uncertain) / max(1, len(texts)):.1%}) routed to BERT (threshold {threshold})"
+    )
+    if len(uncertain):
+        probs[uncertain] = predict_fn([texts[i] for i in uncertain])
+    if stats is not None:
+        stats['texts'] = stats.get('texts', 0) + len(texts)
+        stats['routed_to_bert'] = stats.get('routed_to_bert', 0) + len(uncertain)
+    return probs
+
+def wrap_with_cascade(predict_fn, model_key, num_labels, threshold=DEFAULT_CASCADE_THRESHOLD):
+    """
+    为流水线的 predict_fn 套上级联
+
+    Returns:
+        (predict_fn, cache_key, cheap_model)：找不到对应的廉价模型时原样返回 predict_fn，
+        cheap_model 为 None；cache_key 带上级联阈值，级联结果不会混入全量 BERT 的缓存
+    """
+    from functools import partial
+
+    cheap_model, meta = load_cascade_model(model_key)
+    if cheap_model is None:
+        print("⚠️ No cascade model for this BERT model yet, running full BERT this time")
+        return predict_fn, model_key, None
+
+    report = (meta or {}).get('validation', [])
+    matched = [row for row in report if abs(row['threshold'] - threshold) < 1e-9]
+    if matched:
+        print(
+            f"📐 Cascade validation at threshold {threshold}: {matched[0]['routed_to_bert']:.1%} routed to BERT, "
+            f"{matched[0]['agreement']:.2%} agreement with full BERT"
+        )
+    elif report:
+        print_cascade_report(report)
+    wrapped = partial(
+        predict_proba_cascade,
+        predict_fn=predict_fn,
+        cheap_model=cheap_model,
+        num_labels=num_labels,
+        threshold=threshold,
+    )
+    return wrapped, f"{model_key}-cascade{threshold}", cheap_model
+
+if __name__ == "__main__":
+    # 用 data/processed 下已有的预测结果 (需由当前模型生成) 训练廉价模型
+    from src.analysis.model import get_model
+    from src.analysis.inference import get_model_fingerprint, DEFAULT_MAX_LENGTH
+    from src.utils import normalize_texts
+
+    processed_dir = PROJECT_ROOT / "data" / "processed"
+    frames = []
+    for csv_path in sorted(processed_dir.glob("*predict*.csv")):
+        df = pd.read_csv(csv_path, encoding='utf-8-sig', on_bad_lines='skip')
+        if {'content', 'predicted_label_id'} <= set(df.columns):
+            frames.append(df[['content', 'predicted_label_id']])
+    if not frames:
+        print(f"❌ {processed_dir} 中没有预测结果，请先运行 run_prediction.py。")
+        raise SystemExit(1)
+    data = pd.concat(frames, ignore_index=True).dropna()
+
+    model = get_model()
+    train_cascade_model(
+        normalize_texts(data['content'].astype(str)).tolist(),
+        data['predicted_label_id'].astype(int).to_numpy(),
+        get_model_fingerprint(model, DEFAULT_MAX_LENGTH),
+        model.config.num_labels,
+    )
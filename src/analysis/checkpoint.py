@@ -0,0 +1,77 @@
+"""
+流式推理的断点续跑
+
+每写完一块结果就 fsync 输出文件，并原子地更新一个小的进度清单 (*.progress.json)，
+清单以输入文件哈希 + 模型指纹为键。再次运行同一命令时，从最后一个已提交的块继续。
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+def hash_file(path, block_size=1 << 20):
+    """计算文件内容的 SHA1 (分块读取，不占用大量内存)"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def progress_path_for(output_path):
+    """输出文件对应的进度清单路径"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.name + ".progress.json")
+
+def load_progress(output_path, run_key):
+    """
+    读取进度清单，只有键完全一致 (同一输入、同一模型、同一分块) 时才可续跑
+
+    Args:
+        output_path: 输出文件路径
+        run_key: dict，本次运行的键 {input_hash, model_fingerprint, chunksize}
+
+    Returns:
+        dict，{chunks_committed, rows_written, output_bytes, ...}；无法续跑时返回 None
+    """
+    path = progress_path_for(output_path)
+    if not path.exists() or not Path(output_path).exists():
+        return None
+    try:
+        progress = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    if any(progress.get(k) != v for k, v in run_key.items()):
+        return None
+    if Path(output_path).stat().st_size < progress.get('output_bytes', 0):
+        # 输出文件比清单记录的还短，说明文件被改动过，不能续跑
+        return None
+    return progress
+
+def save_progress(output_path, run_key, chunks_committed, rows_written, output_bytes, **extra):
+    """
+    原子地写入进度清单 (先写临时文件再替换)
+
+    extra 中的字段 (如概率文件的字节数) 一并写入清单
+    """
+    path = progress_path_for(output_path)
+    progress = dict(run_key)
+    progress.update({
+        'chunks_committed': chunks_committed,
+        'rows_written': rows_written,
+        'output_bytes': output_bytes,
+        'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    progress.update(extra)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def clear_progress(output_path):
+    """运行完成后删除进度清单"""
+    path = progress_path_for(output_path)
+    if path.exists():
+        path.unlink()
@@ -0,0 +1,318 @@
+"""
+知识蒸馏：训练一个更小、更快的学生模型
+
+学生模型与教师 (情感 BERT) 结构相同但只保留少数几层编码层，从教师中均匀间隔地挑选几层作初始化
+(词向量、池化层和分类头原样复制)，再在 CPU 上用预处理好的数据集 (见 load_dataset) 蒸馏：
+损失为教师概率 (温度软化) 上的 KL 散度与教师标签上的交叉熵的加权和。
+数据集的 input_ids 由教师的分词器生成，学生直接沿用。
+
+训练好的学生模型按教师来源保存在 trained_models_student/ 下，连同与教师对比的速度、
+一致率和 (数据集带标注时) 准确率报告；run_prediction_pipeline 的 backend="student" 即使用它。
+"""
+import sys
+import copy
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from tqdm import tqdm
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis.inference import get_model_fingerprint, make_length_batches, collate_batch, DEFAULT_MAX_LENGTH
+
+STUDENT_DIR = PROJECT_ROOT / "trained_models_student"
+REPORT_NAME = "distill_report.json"
+DEFAULT_STUDENT_LAYERS = 4
+# 训练与评估使用的最大样本数 (从数据集中随机抽取)
+DEFAULT_MAX_TRAIN_SAMPLES = 100000
+DEFAULT_EVAL_SAMPLES = 5000
+DEFAULT_EPOCHS = 2
+DEFAULT_LEARNING_RATE = 1e-4
+# 蒸馏温度，以及软目标 (KL) 损失所占的权重
+KD_TEMPERATURE = 2.0
+KD_ALPHA = 0.7
+# 训练批次的 token 上限与最大行数
+TRAIN_TOKEN_BUDGET = 64 * 64
+TRAIN_MAX_BATCH_SIZE = 64
+EVAL_TOKEN_BUDGET = 32 * 128
+
+def student_path_for(teacher_path=None):
+    """教师模型对应的学生模型目录"""
+    from src.analysis.model import resolve_model_path
+    from src.analysis.onnx_backend import _source_signature
+    dir_name, _ = _source_signature(resolve_model_path(teacher_path))
+    return STUDENT_DIR / dir_name
+
+def find_student_model(teacher_path=None):
+    """
+    查找为该教师模型蒸馏的学生模型
+
+    Returns:
+        Path；尚未蒸馏时返回 None (教师已更新时仍返回，并给出提示)
+    """
+    from src.analysis.model import resolve_model_path
+    from src.analysis.onnx_backend import _source_signature
+
+    path = student_path_for(teacher_path)
+    report_path = path / REPORT_NAME
+    if not (path / "config.json").exists() or not report_path.exists():
+        return None
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    _, signature = _source_signature(resolve_model_path(teacher_path))
+    if report.get('teacher_source') != signature:
+        print("⚠️ The teacher model changed after this student was distilled, consider re-running distill.py")
+    return path
+
+def pick_student_layers(num_layers, student_layers):
+    """从教师的 num_layers 层中均匀挑选 student_layers 层 (含第一层和最后一层) 的下标"""
+    student_layers = max(1, min(student_layers, num_layers))
+    return sorted({int(round(i)) for i in np.linspace(0, num_layers - 1, student_layers)})
+
+def make_student(teacher, student_layers=DEFAULT_STUDENT_LAYERS):
+    """
+    按教师结构构造层数更少的学生模型，并用教师的权重初始化
+
+    Args:
+        teacher: BERT 类 PyTorch 情感分类模型
+        student_layers: int，学生模型的编码层数
+
+    Returns:
+        (student, kept_layers)：学生模型，以及初始化所用的教师层下标
+    """
+    prefix = f"{teacher.base_model_prefix}.encoder.layer."
+    kept = pick_student_layers(teacher.config.num_hidden_layers, student_layers)
+    config = copy.deepcopy(teacher.config)
+    config.num_hidden_layers = len(kept)
+    student = type(teacher)(config)
+
+    state = {}
+    for name, value in teacher.state_dict().items():
+        if name.startswith(prefix):
+            index, rest = name[len(prefix):].split('.', 1)
+            if int(index) in kept:
+                state[f"{prefix}{kept.index(int(index))}.{rest}"] = value.clone()
+        else:
+            state[name] = value.clone()
+    student.load_state_dict(state)
+    return student, kept
+
+def _truncate(input_ids, max_length):
+    """超长样本截断到 max_length，保留末尾的 [SEP]"""
+    return [ids if len(ids) <= max_length else ids[:max_length - 1] + ids[-1:] for ids in input_ids]
+
+def load_distill_split(data_type, split, max_samples, max_length=DEFAULT_MAX_LENGTH, random_state=42):
+    """
+    从预处理好的数据集中随机抽取一个划分的样本
+
+    Returns:
+        (input_ids, labels)：labels 为数据集中的标注 (np.ndarray)，数据集没有 labels 列时为 None
+    """
+    from src.utils import load_dataset
+
+    ds = load_dataset(data_type, splits=(split,), as_arrow=True)
+    columns = [name for name in ('input_ids', 'labels') if name in ds.column_names]
+    ds = ds.select_columns(columns)
+    if len(ds) > max_samples:
+        ds = ds.shuffle(seed=random_state).select(range(max_samples))
+    input_ids = _truncate(ds['input_ids'], max_length)
+    labels = np.fromiter(ds['labels'], dtype=np.int64, count=len(ds)) if 'labels' in columns else None
+    return input_ids, labels
+
+def forward_probs(model, input_ids, pad_token_id=0, token_budget=EVAL_TOKEN_BUDGET, show_progress=False, desc="Predicting"):
+    """
+    对已分词的样本按长度分桶推理
+
+    Returns:
+        np.ndarray，形状 (len(input_ids), num_labels) 的 float32 概率矩阵
+    """
+    device = getattr(model, 'device', torch.device("cpu"))
+    lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+    probs = np.empty((len(input_ids), model.config.num_labels), dtype=np.float32)
+    with torch.no_grad(), tqdm(total=len(input_ids), desc=desc, disable=not show_progress) as pbar:
+        for indices in make_length_batches(lengths, token_budget, TRAIN_MAX_BATCH_SIZE * 4):
+            inputs = {k: v.to(device) for k, v in collate_batch(input_ids, indices, pad_token_id).items()}
+            probs[indices] = torch.softmax(model(**inputs).logits.float(), dim=-1).cpu().numpy()
+            pbar.update(len(indices))
+    return probs
+
+def distillation_loss(student_logits, teacher_probs, temperature=KD_TEMPERATURE, alpha=KD_ALPHA):
+    """
+    蒸馏损失：alpha × T² × KL(教师软化概率 ‖ 学生软化概率) + (1 - alpha) × 教师标签上的交叉熵
+    """
+    teacher_probs = teacher_probs.clamp_min(1e-8)
+    soft_targets = torch.softmax(torch.log(teacher_probs) / temperature, dim=-1)
+    soft_loss = torch.nn.functional.kl_div(
+        torch.log_softmax(student_logits / temperature, dim=-1), soft_targets, reduction='batchmean'
+    ) * temperature ** 2
+    hard_loss = torch.nn.functional.cross_entropy(student_logits, teacher_probs.argmax(dim=-1))
+    return alpha * soft_loss + (1 - alpha) * hard_loss
+
+def evaluate_student(student, teacher, input_ids, labels=None, pad_token_id=0):
+    """
+    在留出样本上对比学生与教师的速度、一致率和准确率
+
+    Returns:
+        dict，{samples, teacher_seconds, student_seconds, speedup, agreement,
+        teacher_accuracy, student_accuracy, teacher_param_mb, student_param_mb}
+    """
+    def param_mb(model):
+        return round(sum(p.numel() * p.element_size() for p in model.parameters()) / 2**20, 1)
+
+    student.eval()
+    # 预热，避免首次调用的初始化计入耗时
+    forward_probs(teacher, input_ids[:32], pad_token_id)
+    forward_probs(student, input_ids[:32], pad_token_id)
+    start = time.perf_counter()
+    teacher_labels = forward_probs(teacher, input_ids, pad_token_id).argmax(axis=-1)
+    teacher_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    student_labels = forward_probs(student, input_ids, pad_token_id).argmax(axis=-1)
+    student_seconds = time.perf_counter() - start
+
+    report = {
+        'samples': len(input_ids),
+        'teacher_seconds': round(teacher_seconds, 2),
+        'student_seconds': round(student_seconds, 2),
+        'speedup': round(teacher_seconds / max(student_seconds, 1e-9), 2),
+        'agreement': float(np.mean(teacher_labels == student_labels)) if len(input_ids) else 1.0,
+        'teacher_accuracy': None,
+        'student_accuracy': None,
+        'teacher_param_mb': param_mb(teacher),
+        'student_param_mb': param_mb(student),
+    }
+    if labels is not None and len(labels):
+        report['teacher_accuracy'] = float(np.mean(teacher_labels == labels))
+        report['student_accuracy'] = float(np.mean(student_labels == labels))
+    return report
+
+def print_distill_report(report):
+    print(
+        f"⚡ Teacher {report['teacher_seconds']}s ({report['teacher_param_mb']} MB) vs student "
+        f"{report['student_seconds']}s ({report['student_param_mb']} MB) on {report['samples']} samples: "
+        f"speedup x{report['speedup']:.2f}"
+    )
+    print(f"🤝 Label agreement with the teacher: {report['agreement']:.2%}")
+    if report['teacher_accuracy'] is not None:
+        print(
+            f"🎯 Accuracy on dataset labels: teacher {report['teacher_accuracy']:.2%}, "
+            f"student {report['student_accuracy']:.2%}"
+        )
+
+def distill_student(
+    data_type="danmaku",
+    teacher_path=None,
+    student_layers=DEFAULT_STUDENT_LAYERS,
+    epochs=DEFAULT_EPOCHS,
+    max_train_samples=DEFAULT_MAX_TRAIN_SAMPLES,
+    eval_samples=DEFAULT_EVAL_SAMPLES,
+    max_length=DEFAULT_MAX_LENGTH,
+    learning_rate=DEFAULT_LEARNING_RATE,
+    temperature=KD_TEMPERATURE,
+    alpha=KD_ALPHA,
+    random_state=42,
+):
+    """
+    蒸馏学生模型并保存
+
+    Args:
+        data_type: str，数据集类型 "comment" 或 "danmaku" (见 load_dataset)，train 划分用于训练，
+            validation 划分用于评估
+        teacher_path: 教师模型路径 (默认见 resolve_model_path)
+        student_layers: int，学生模型的编码层数
+        epochs: int，训练轮数
+        max_train_samples / eval_samples: int，训练与评估最多使用的样本数
+        max_length: int，截断长度
+        learning_rate: float，AdamW 学习率 (线性衰减)
+        temperature / alpha: 蒸馏温度与软目标损失的权重
+        random_state: int，随机种子
+
+    Returns:
+        (Path, dict)：学生模型目录，以及与教师的对比报告
+    """
+    from transformers import AutoTokenizer
+    from src.analysis.model import get_torch_model, resolve_model_path
+    from src.analysis.onnx_backend import _source_signature
+
+    torch.manual_seed(random_state)
+    teacher_path = resolve_model_path(teacher_path)
+    teacher = get_torch_model(teacher_path).eval()
+    tokenizer = AutoTokenizer.from_pretrained(teacher_path)
+    pad_token_id = tokenizer.pad_token_id or 0
+
+    print(f"📖 Loading the {data_type} dataset...")
+    train_ids, _ = load_distill_split(data_type, "train", max_train_samples, max_length, random_state)
+    eval_ids, eval_labels = load_distill_split(data_type, "validation", eval_samples, max_length, random_state)
+
+    print(f"👩‍🏫 Computing teacher probabilities for {len(train_ids)} training samples...")
+    teacher_probs = torch.from_numpy(forward_probs(teacher, train_ids, pad_token_id, show_progress=True, desc="Teacher"))
+
+    student, kept = make_student(teacher, student_layers)
+    print(f"🎓 Student: {len(kept)} of {teacher.config.num_hidden_layers} layers, initialised from teacher layers {kept}")
+    lengths = np.fromiter((len(ids) for ids in train_ids), dtype=np.int64, count=len(train_ids))
+    rng = np.random.default_rng(random_state)
+    steps_per_epoch = len(make_length_batches(lengths, TRAIN_TOKEN_BUDGET, TRAIN_MAX_BATCH_SIZE))
+    total_steps = max(1, epochs * steps_per_epoch)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=learning_rate, weight_decay=0.01)
+    scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lambda step: max(0.0, 1.0 - step / total_steps))
+
+    start = time.perf_counter()
+    student.train()
+    for epoch in range(epochs):
+        # 长度分桶后打乱批次顺序，每轮的批次划分随样本顺序变化
+        order = rng.permutation(len(train_ids))
+        batches = [order[b] for b in make_length_batches(lengths[order], TRAIN_TOKEN_BUDGET, TRAIN_MAX_BATCH_SIZE)]
+        rng.shuffle(batches)
+        running = []
+        with tqdm(batches, desc=f"Epoch {epoch + 1}/{epochs}") as pbar:
+            for indices in pbar:
+                inputs = collate_batch(train_ids, indices, pad_token_id)
+                loss = distillation_loss(student(**inputs).logits, teacher_probs[indices], temperature, alpha)
+                optimizer.zero_grad()
+                loss.backward()
+                torch.nn.utils.clip_grad_norm_(student.parameters(), 1.0)
+                optimizer.step()
+                scheduler.step()
+                running.append(loss.item())
+                pbar.set_postfix(loss=f"{np.mean(running[-50:]):.4f}")
+    student.eval()
+    train_seconds = time.perf_counter() - start
+    print(f"✅ Student trained in {train_seconds:.1f}s")
+
+    report = evaluate_student(student, teacher, eval_ids, eval_labels, pad_token_id)
+    print_distill_report(report)
+
+    output_dir = student_path_for(teacher_path)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    student.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    _, signature = _source_signature(teacher_path)
+    meta = {
+        'teacher_source': signature,
+        'teacher_fingerprint': get_model_fingerprint(teacher),
+        'data_type': data_type,
+        'student_layers': len(kept),
+        'teacher_layers_kept': kept,
+        'train_samples': len(train_ids),
+        'epochs': epochs,
+        'train_seconds': round(train_seconds, 1),
+        'evaluation': report,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    (output_dir / REPORT_NAME).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"💾 Student model saved to {output_dir}")
+    return output_dir, report
+
+if __name__ == "__main__":
+    data_type = 'comment' if input("请选择训练数据 (comments/danmaku，按Enter使用 danmaku): ").strip().lower() in ['comments', 'comment'] else 'danmaku'
+    layers_input = input(f"请输入学生模型层数 (按Enter使用默认值 {DEFAULT_STUDENT_LAYERS}): ").strip()
+    samples_input = input(f"请输入最多使用的训练样本数 (按Enter使用默认值 {DEFAULT_MAX_TRAIN_SAMPLES}): ").strip()
+    distill_student(
+        data_type,
+        student_layers=int(layers_input) if layers_input else DEFAULT_STUDENT_LAYERS,
+        max_train_samples=int(samples_input) if samples_input else DEFAULT_MAX_TRAIN_SAMPLES,
+    )
@@ -0,0 +1,391 @@
+"""
+提前退出 (early exit) 推理
+
+很多短弹幕在前几层编码之后就已经能判断情感，没必要跑完全部 12 层。这里在若干中间层的 [CLS]
+隐状态上各接一个线性分类头，用模型最后一层的输出 (软标签) 离线在 CPU 上校准。推理时逐层前向，
+每到一个出口，该出口分类头最大概率不低于阈值的样本直接输出并移出批次，其余样本继续向后计算。
+阈值越高，提前退出的样本越少，与完整模型的一致率越高。
+
+分类头按模型指纹保存在 trained_models_early_exit/ 下，模型更新后需重新校准。
+"""
+import sys
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis.inference import (
+    get_model_fingerprint,
+    make_length_batches,
+    collate_batch,
+    DEFAULT_MAX_LENGTH,
+    DEFAULT_TOKEN_BUDGET,
+    DEFAULT_MAX_BATCH_SIZE,
+)
+
+EARLY_EXIT_DIR = PROJECT_ROOT / "trained_models_early_exit"
+DEFAULT_EXIT_THRESHOLD = 0.9
+# 每隔多少层设一个出口 (最后一层本身就是完整模型，不设出口)
+EXIT_STRIDE = 2
+# 校准最多使用的不同文本数，以及所需的最少文本数
+CALIBRATION_TEXTS = 4000
+MIN_CALIBRATION_TEXTS = 200
+# 分类头训练：L-BFGS 迭代次数与 L2 正则系数
+HEAD_MAX_ITER = 200
+HEAD_L2 = 1e-4
+# 校准时评估的阈值
+EVAL_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+def _head_paths(model_key):
+    return EARLY_EXIT_DIR / f"{model_key}.pt", EARLY_EXIT_DIR / f"{model_key}.json"
+
+def _encoder_parts(model):
+    """
+    取出 BERT 类模型逐层计算所需的部件
+
+    Returns:
+        (embeddings, layers, pooler, classifier)
+
+    Raises:
+        ValueError：不是可以逐层计算的 transformers 模型 (如 ONNX、冷启动缓存的追踪图)
+    """
+    base = getattr(model, 'base_model', None)
+    encoder = getattr(base, 'encoder', None)
+    classifier = getattr(model, 'classifier', None)
+    if not isinstance(model, torch.nn.Module) or encoder is None or not hasattr(encoder, 'layer') or classifier is None:
+        raise ValueError("提前退出需要 BERT 类的 PyTorch 模型 (见 get_torch_model)")
+    return base.embeddings, encoder.layer, getattr(base, 'pooler', None), classifier
+
+def default_exit_layers(num_layers, stride=EXIT_STRIDE):
+    """出口位置 (从 1 开始的层号)：每 stride 层一个，不含最后一层"""
+    layers = [i for i in range(1, num_layers) if i % stride == 0]
+    return layers or list(range(1, num_layers))
+
+def _additive_mask(attention_mask, dtype):
+    """(batch, seq) 的 0/1 掩码 -> 注意力层使用的 (batch, 1, 1, seq) 加性掩码"""
+    mask = attention_mask[:, None, None, :].to(dtype)
+    return (1.0 - mask) * torch.finfo(dtype).min
+
+def _run_layer(layer, hidden, attention_mask):
+    output = layer(hidden, attention_mask=_additive_mask(attention_mask, hidden.dtype))
+    # transformers 4.x 的编码层返回元组，5.x 直接返回张量
+    return output[0] if isinstance(output, tuple) else output
+
+def collect_exit_features(model, tokenizer, texts, exit_layers, max_length=DEFAULT_MAX_LENGTH, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    完整前向一遍，收集各出口层的 [CLS] 隐状态和最后一层的类别概率
+
+    Returns:
+        (features, final_probs)：features 为 {层号: (n, hidden_size) float32}，
+        final_probs 为 (n, num_labels) float32
+    """
+    embeddings, layers, pooler, classifier = _encoder_parts(model)
+    device = getattr(model, 'device', torch.device("cpu"))
+    encodings = tokenizer(list(texts), truncation=True, max_length=max_length)
+    input_ids = encodings['input_ids']
+    lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+    pad_token_id = tokenizer.pad_token_id or 0
+
+    features = {layer: np.empty((len(texts), model.config.hidden_size), dtype=np.float32) for layer in exit_layers}
+    final_probs = np.empty((len(texts), model.config.num_labels), dtype=np.float32)
+    with torch.no_grad():
+        for indices in make_length_batches(lengths, token_budget, DEFAULT_MAX_BATCH_SIZE):
+            inputs = {k: v.to(device) for k, v in collate_batch(input_ids, indices, pad_token_id).items()}
+            hidden = embeddings(input_ids=inputs['input_ids'], token_type_ids=inputs['token_type_ids'])
+            for depth, layer in enumerate(layers, 1):
+                hidden = _run_layer(layer, hidden, inputs['attention_mask'])
+                if depth in features:
+                    features[depth][indices] = hidden[:, 0].float().cpu().numpy()
+            pooled = pooler(hidden) if pooler is not None else hidden
+            final_probs[indices] = torch.softmax(classifier(pooled).float(), dim=-1).cpu().numpy()
+    return features, final_probs
+
+def _fit_head(features, target_probs):
+    """在 [CLS] 隐状态上拟合线性分类头，目标为最后一层的概率 (软标签交叉熵)"""
+    x = torch.from_numpy(features)
+    y = torch.from_numpy(target_probs)
+    head = torch.nn.Linear(x.shape[1], y.shape[1])
+    optimizer = torch.optim.LBFGS(head.parameters(), max_iter=HEAD_MAX_ITER, history_size=20, line_search_fn='strong_wolfe')
+
+    def closure():
+        optimizer.zero_grad()
+        loss = -(y * torch.log_softmax(head(x), dim=-1)).sum(dim=-1).mean() + HEAD_L2 * head.weight.square().sum()
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return head.eval()
+
+def _head_probs(head, features):
+    with torch.no_grad():
+        return torch.softmax(head(torch.from_numpy(features)), dim=-1).numpy()
+
+def evaluate_early_exit(exit_probs, final_labels, num_layers, thresholds=EVAL_THRESHOLDS):
+    """
+    评估不同阈值下的提前退出效果
+
+    Args:
+        exit_probs: dict {层号: (n, num_labels) 概率}，各出口分类头的输出
+        final_labels: np.ndarray，完整模型的标签
+        num_layers: int，模型总层数
+        thresholds: 待评估的阈值
+
+    Returns:
+        list of dict，{threshold, average_layers, exited_early, agreement}
+    """
+    n = len(final_labels)
+    report = []
+    for threshold in thresholds:
+        labels = np.array(final_labels, copy=True)
+        depth = np.full(n, num_layers, dtype=np.int64)
+        exited = np.zeros(n, dtype=bool)
+        for layer in sorted(exit_probs):
+            probs = exit_probs[layer]
+            leaving = ~exited & (probs.max(axis=-1) >= threshold)
+            labels[leaving] = probs[leaving].argmax(axis=-1)
+            depth[leaving] = layer
+            exited |= leaving
+        report.append({
+            'threshold': threshold,
+            'average_layers': float(depth.mean()) if n else float(num_layers),
+            'exited_early': float(exited.mean()) if n else 0.0,
+            'agreement': float(np.mean(labels == final_labels)) if n else 1.0,
+        })
+    return report
+
+def print_early_exit_report(report, num_layers):
+    print(f"📐 threshold | avg layers (of {num_layers}) | exited early | agreement with full depth")
+    for row in report:
+        print(
+            f"   {row['threshold']:>9.2f} | {row['average_layers']:>20.2f} | "
+            f"{row['exited_early']:>12.1%} | {row['agreement']:.2%}"
+        )
+
+def calibrate_early_exit(model, tokenizer, texts, max_length=DEFAULT_MAX_LENGTH, validation_fraction=0.2, random_state=42):
+    """
+    在 CPU 上校准出口分类头并保存
+
+    Args:
+        model: BERT 类 PyTorch 情感分类模型 (见 get_torch_model)
+        tokenizer: 分词器
+        texts: list of str，已规范化的文本 (最多抽取 CALIBRATION_TEXTS 条不同文本)
+        max_length: int，截断长度
+        validation_fraction: float，留出评估的比例
+        random_state: int，随机种子
+
+    Returns:
+        (heads, meta)：heads 为 {层号: torch.nn.Linear}；数据不足时返回 (None, None)
+    """
+    texts = list(dict.fromkeys(texts))
+    if len(texts) < MIN_CALIBRATION_TEXTS:
+        print(f"⚠️ Not enough distinct texts to calibrate early exit ({len(texts)} < {MIN_CALIBRATION_TEXTS})")
+        return None, None
+    rng = np.random.default_rng(random_state)
+    texts = [texts[i] for i in rng.permutation(len(texts))[:CALIBRATION_TEXTS]]
+
+    _, layers, _, _ = _encoder_parts(model)
+    num_layers = len(layers)
+    exit_layers = default_exit_layers(num_layers)
+    print(f"🏋️ Calibrating early-exit heads at layers {exit_layers} of {num_layers} on {len(texts)} texts...")
+    start = time.perf_counter()
+    features, final_probs = collect_exit_features(model, tokenizer, texts, exit_layers, max_length)
+    final_labels = final_probs.argmax(axis=-1)
+
+    n_val = int(len(texts) * validation_fraction)
+    report = []
+    if n_val:
+        train, val = slice(n_val, None), slice(None, n_val)
+        exit_probs = {
+            layer: _head_probs(_fit_head(features[layer][train], final_probs[train]), features[layer][val])
+            for layer in exit_layers
+        }
+        report = evaluate_early_exit(exit_probs, final_labels[val], num_layers)
+        print_early_exit_report(report, num_layers)
+    # 评估完成后用全部数据重新拟合
+    heads = {layer: _fit_head(features[layer], final_probs) for layer in exit_layers}
+    print(f"✅ Early-exit heads calibrated in {time.perf_counter() - start:.1f}s")
+
+    model_key = get_model_fingerprint(model)
+    head_path, meta_path = _head_paths(model_key)
+    EARLY_EXIT_DIR.mkdir(parents=True, exist_ok=True)
+    torch.save({str(layer): head.state_dict() for layer, head in heads.items()}, head_path)
+    meta = {
+        'model_key': model_key,
+        'num_layers': num_layers,
+        'exit_layers': exit_layers,
+        'num_texts': len(texts),
+        'validation': report,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+    return heads, meta
+
+def load_early_exit_heads(model_key, hidden_size, num_labels):
+    """
+    加载与模型指纹对应的出口分类头
+
+    Returns:
+        (heads, meta)；不存在时返回 (None, None)
+    """
+    head_path, meta_path = _head_paths(model_key)
+    if not head_path.exists() or not meta_path.exists():
+        return None, None
+    meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    heads = {}
+    for layer, state in torch.load(head_path, map_location="cpu").items():
+        head = torch.nn.Linear(hidden_size, num_labels)
+        head.load_state_dict(state)
+        heads[int(layer)] = head.eval()
+    return heads, meta
+
+class EarlyExitModel:
+    """
+    逐层前向、在出口处让有把握的样本提前离开批次的模型包装，调用方式与 Hugging Face 模型一致
+
+    提前退出的样本返回出口分类头概率的对数作为 logits (softmax 后即为该概率)。
+    指纹带上阈值，提前退出的结果不会混入完整模型的预测缓存。
+    stats 累计 {texts, layers, exited}，可据此计算平均执行层数。
+    """
+
+    def __init__(self, model, heads, threshold=DEFAULT_EXIT_THRESHOLD):
+        self.model = model
+        self.embeddings, self.layers, self.pooler, self.classifier_head = _encoder_parts(model)
+        self.heads = {layer: head.to(model.device) for layer, head in heads.items() if layer < len(self.layers)}
+        self.threshold = threshold
+        self.config = model.config
+        self.fingerprint = f"{get_model_fingerprint(model)}-exit{threshold}"
+        self.stats = {'texts': 0, 'layers': 0, 'exited': 0}
+
+    @property
+    def device(self):
+        return self.model.device
+
+    @property
+    def num_layers(self):
+        return len(self.layers)
+
+    def reset_stats(self):
+        self.stats = {'texts': 0, 'layers': 0, 'exited': 0}
+
+    def average_layers(self):
+        """平均每条文本执行的编码层数"""
+        return self.stats['layers'] / self.stats['texts'] if self.stats['texts'] else float(self.num_layers)
+
+    def __call__(self, input_ids, attention_mask, token_type_ids=None, **kwargs):
+        from types import SimpleNamespace
+
+        logits = torch.empty((len(input_ids), self.config.num_labels), dtype=torch.float32, device=input_ids.device)
+        active = torch.arange(len(input_ids), device=input_ids.device)
+        hidden = self.embeddings(input_ids=input_ids, token_type_ids=token_type_ids)
+        executed = 0
+        for depth, layer in enumerate(self.layers, 1):
+            hidden = _run_layer(layer, hidden, attention_mask)
+            executed += len(active)
+            head = self.heads.get(depth)
+            if head is None:
+                continue
+            probs = torch.softmax(head(hidden[:, 0]).float(), dim=-1)
+            leaving = probs.max(dim=-1).values >= self.threshold
+            if not leaving.any():
+                continue
+            logits[active[leaving]] = torch.log(probs[leaving].clamp_min(1e-12))
+            self.stats['exited'] += int(leaving.sum())
+            staying = ~leaving
+            active, hidden, attention_mask = active[staying], hidden[staying], attention_mask[staying]
+            if len(active) == 0:
+                break
+            # 剩余样本可能更短，去掉全为补齐的尾部列
+            width = int(attention_mask.sum(dim=-1).max())
+            hidden, attention_mask = hidden[:, :width], attention_mask[:, :width]
+
+        if len(active):
+            pooled = self.pooler(hidden) if self.pooler is not None else hidden
+            logits[active] = self.classifier_head(pooled).float()
+        self.stats['texts'] += len(input_ids)
+        self.stats['layers'] += executed
+        return SimpleNamespace(logits=logits)
+
+    def to(self, device):
+        self.model.to(device)
+        for head in self.heads.values():
+            head.to(device)
+        return self
+
+    def eval(self):
+        self.model.eval()
+        return self
+
+def wrap_with_early_exit(model, tokenizer, threshold=DEFAULT_EXIT_THRESHOLD, calibration_texts=None, max_length=DEFAULT_MAX_LENGTH):
+    """
+    为模型套上提前退出
+
+    Args:
+        model: BERT 类 PyTorch 情感分类模型 (见 get_torch_model)
+        tokenizer: 分词器
+        threshold: float，出口分类头最大概率不低于该值时提前输出
+        calibration_texts: list of str (可选)，尚未校准时用它们校准一次；不传时不校准
+        max_length: int，截断长度
+
+    Returns:
+        EarlyExitModel；尚无出口分类头且无法校准时返回 None
+    """
+    model_key = get_model_fingerprint(model)
+    heads, meta = load_early_exit_heads(model_key, model.config.hidden_size, model.config.num_labels)
+    if heads is None and calibration_texts is not None:
+        heads, meta = calibrate_early_exit(model, tokenizer, calibration_texts, max_length)
+    if heads is None:
+        print("⚠️ No early-exit heads for this model yet, running full depth this time")
+        return None
+
+    report = meta.get('validation', [])
+    matched = [row for row in report if abs(row['threshold'] - threshold) < 1e-9]
+    if matched:
+        print(
+            f"📐 Early-exit validation at threshold {threshold}: {matched[0]['average_layers']:.2f} of "
+            f"{meta['num_layers']} layers on average, {matched[0]['agreement']:.2%} agreement with full depth"
+        )
+    elif report:
+        print_early_exit_report(report, meta['num_layers'])
+    return EarlyExitModel(model, heads, threshold)
+
+if __name__ == "__main__":
+    # 用 data/processed 下已有的预测结果中的文本校准，并对比完整模型的速度与一致率
+    import pandas as pd
+    from src.analysis.model import get_tokenizer, get_torch_model
+    from src.analysis.inference import predict_proba
+    from src.utils import normalize_texts
+
+    processed_dir = PROJECT_ROOT / "data" / "processed"
+    frames = [
+        pd.read_csv(csv_path, encoding='utf-8-sig', on_bad_lines='skip', usecols=['content'])
+        for csv_path in sorted(processed_dir.glob("*predict*.csv"))
+    ]
+    if not frames:
+        print(f"❌ {processed_dir} 中没有预测结果，请先运行 run_prediction.py。")
+        raise SystemExit(1)
+    texts = normalize_texts(pd.concat(frames, ignore_index=True)['content'].dropna().astype(str)).tolist()
+
+    model, tokenizer = get_torch_model(), get_tokenizer()
+    calibrate_early_exit(model, tokenizer, texts)
+    threshold_input = input(f"请输入提前退出阈值 (按Enter使用默认值 {DEFAULT_EXIT_THRESHOLD}): ").strip()
+    early_exit_model = wrap_with_early_exit(model, tokenizer, float(threshold_input) if threshold_input else DEFAULT_EXIT_THRESHOLD)
+
+    sample = list(dict.fromkeys(texts))[:2000]
+    start = time.perf_counter()
+    full_probs = predict_proba(sample, model, tokenizer, show_progress=False)
+    full_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    exit_probs = predict_proba(sample, early_exit_model, tokenizer, show_progress=False)
+    exit_seconds = time.perf_counter() - start
+    print(
+        f"⏩ {len(sample)} texts: full depth {full_seconds:.2f}s, early exit {exit_seconds:.2f}s "
+        f"({full_seconds / max(exit_seconds, 1e-9):.2f}x), {early_exit_model.average_layers():.2f} of "
+        f"{early_exit_model.num_layers} layers on average, "
+        f"agreement {np.mean(full_probs.argmax(axis=-1) == exit_probs.argmax(axis=-1)):.2%}"
+    )
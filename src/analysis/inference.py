@@ -0,0 +1,362 @@
+"""
+情感模型批量推理引擎
+
+按 token 长度对输入排序分桶，再依据 token 预算 (batch_size × 补齐长度) 动态组批，
+避免一条长评论拖着几十条短弹幕一起补齐到 max_length。输出按原始顺序还原。
+
+分词与组批在后台线程中按窗口进行，结果放入有界队列，模型前向计算的同时
+下一批已在准备，分词开销被前向计算掩盖。
+"""
+import hashlib
+import queue
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+import pandas as pd
+import torch
+from tqdm import tqdm
+
+DEFAULT_MAX_LENGTH = 128
+# 每个批次的 token 上限 (行数 × 补齐后长度)，等价于旧实现 32 条 × 128 的最坏情况
+DEFAULT_TOKEN_BUDGET = 32 * 128
+# 每个批次的最大行数，防止超短文本组出过大的批次
+DEFAULT_MAX_BATCH_SIZE = 256
+# 后台分词的窗口大小：每个窗口内按长度分桶，窗口越大分桶越充分
+DEFAULT_BUCKET_WINDOW = 8192
+# 预取队列长度：最多提前准备好的批次数
+DEFAULT_PREFETCH_BATCHES = 4
+
+def get_model_fingerprint(model, max_length=None):
+    """
+    生成模型指纹，用作缓存、导出产物等的键
+
+    由模型名称/路径、配置以及分类头权重摘要组成；截断长度会影响结果，
+    用于缓存时需传入 max_length 一并计入。
+    包装后的模型 (如其他推理后端) 可通过 fingerprint 属性自行提供。
+    """
+    base = getattr(model, 'fingerprint', None)
+    if base is None:
+        h = hashlib.sha1()
+        config = model.config
+        h.update(str(getattr(config, '_name_or_path', '')).encode())
+        h.update(config.to_json_string(use_diff=True).encode())
+        # 分类头很小，对其权重取摘要可以区分同名但重新训练过的模型
+        for name, param in model.named_parameters():
+            if 'classifier' in name:
+                h.update(param.detach().float().cpu().numpy().tobytes())
+        base = h.hexdigest()[:16]
+    if max_length is None:
+        return base
+    return f"{base}-len{max_length}"
+
+def make_length_batches(lengths, token_budget=DEFAULT_TOKEN_BUDGET, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    """
+    按长度升序排列样本，贪心地切分批次，使每批 行数 × 最大长度 不超过 token 预算
+
+    Args:
+        lengths: array-like，每条样本的 token 长度
+        token_budget: int，每批 token 上限
+        max_batch_size: int，每批最大行数
+
+    Returns:
+        list of np.ndarray，每个元素为一个批次内样本的原始下标
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(lengths, kind='stable')
+    sorted_lengths = lengths[order]
+
+    batches = []
+    start = 0
+    n = len(order)
+    while start < n:
+        end = start + 1
+        # 升序排列，批次补齐长度即为最后一条的长度
+        while (
+            end < n
+            and end - start < max_batch_size
+            and (end - start + 1) * sorted_lengths[end] <= token_budget
+        ):
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+def collate_batch(input_ids, indices, pad_token_id=0, with_token_type_ids=True):
+    """
+    将一个批次的变长 input_ids 右侧补齐为张量
+
+    Args:
+        input_ids: list of list[int]，全部样本的 token id
+        indices: 本批次样本下标
+        pad_token_id: int，补齐用的 token id
+        with_token_type_ids: bool，是否生成全 0 的 token_type_ids
+
+    Returns:
+        dict，{input_ids, attention_mask[, token_type_ids]} -> torch.Tensor
+    """
+    rows = [input_ids[i] for i in indices]
+    max_len = max(len(ids) for ids in rows)
+
+    batch_ids = np.full((len(rows), max_len), pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(rows), max_len), dtype=np.int64)
+    for r, ids in enumerate(rows):
+        batch_ids[r, :len(ids)] = ids
+        attention_mask[r, :len(ids)] = 1
+
+    inputs = {
+        'input_ids': torch.from_numpy(batch_ids),
+        'attention_mask': torch.from_numpy(attention_mask),
+    }
+    if with_token_type_ids:
+        inputs['token_type_ids'] = torch.zeros_like(inputs['input_ids'])
+    return inputs
+
+def _put_until_stopped(batch_queue, item, stop_event):
+    """队列满时等待消费，同时响应停止信号；放入成功返回 True"""
+    while not stop_event.is_set():
+        try:
+            batch_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _produce_batches(texts, tokenizer, batch_queue, stop_event, stage_times, max_length, token_budget, max_batch_size, window_size):
+    """
+    预取阶段 (后台线程)：按窗口分词、分桶并组批，放入有界队列
+
+    下一个窗口的分词在辅助线程中提前进行，窗口切换时消费者不必等待。
+    队列元素为 (原始下标, 输入张量)；结束时放入 None，出错时放入异常对象。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def tokenize_window(window_start):
+        start = time.perf_counter()
+        encodings = tokenizer(texts[window_start:window_start + window_size], truncation=True, max_length=max_length)
+        stage_times['tokenize'] += time.perf_counter() - start
+        return encodings
+
+    try:
+        pad_token_id = tokenizer.pad_token_id or 0
+        window_starts = list(range(0, len(texts), window_size))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            future = pool.submit(tokenize_window, window_starts[0])
+            for k, window_start in enumerate(window_starts):
+                encodings = future.result()
+                if k + 1 < len(window_starts):
+                    future = pool.submit(tokenize_window, window_starts[k + 1])
+
+                start = time.perf_counter()
+                input_ids = encodings['input_ids']
+                with_token_type_ids = 'token_type_ids' in encodings
+                lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+                batches = make_length_batches(lengths, token_budget, max_batch_size)
+                stage_times['collate'] += time.perf_counter() - start
+
+                for indices in batches:
+                    start = time.perf_counter()
+                    inputs = collate_batch(input_ids, indices, pad_token_id, with_token_type_ids)
+                    stage_times['collate'] += time.perf_counter() - start
+                    if not _put_until_stopped(batch_queue, (indices + window_start, inputs), stop_event):
+                        return
+        _put_until_stopped(batch_queue, None, stop_event)
+    except Exception as e:
+        # 结束标记与异常同样不能阻塞：消费者出错退出后队列可能一直是满的
+        _put_until_stopped(batch_queue, e, stop_event)
+
+@contextmanager
+def capture_pooled_output(model):
+    """
+    在前向计算中截取分类头的输入 (即池化后的句向量)，不增加额外的模型计算
+
+    BERT 类模型的分类头输入为 [CLS] 经 pooler 后的向量；若分类头接收的是整段隐状态
+    (如 RoBERTa)，取第一个位置。eval 模式下 dropout 不起作用，截取的即为原始池化输出。
+
+    Yields:
+        list，每次前向计算后追加一个 (batch, hidden) 的张量
+    """
+    captured = []
+    if hasattr(model, 'pooled_output_sink'):
+        # 冷启动缓存的 TorchScript 图 (见 model_cache.py) 自己输出句向量
+        model.pooled_output_sink = captured
+        try:
+            yield captured
+        finally:
+            model.pooled_output_sink = None
+        return
+    head = getattr(model, 'classifier', None)
+    if head is None:
+        raise ValueError("模型没有 classifier 分类头，无法提取句向量 (仅支持 PyTorch 后端)")
+
+    def hook(module, args):
+        features = args[0]
+        captured.append(features[:, 0] if features.dim() == 3 else features)
+
+    handle = head.register_forward_pre_hook(hook)
+    try:
+        yield captured
+    finally:
+        handle.remove()
+
+def predict_proba(
+    texts,
+    model,
+    tokenizer,
+    device=None,
+    max_length=DEFAULT_MAX_LENGTH,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+    window_size=DEFAULT_BUCKET_WINDOW,
+    prefetch_batches=DEFAULT_PREFETCH_BATCHES,
+    show_progress=True,
+    stats=None,
+    return_embeddings=False,
+):
+    """
+    对文本列表做批量情感推理，返回各类别概率
+
+    Args:
+        texts: list of str，待预测文本
+        model: 情感分类模型
+        tokenizer: 分词器
+        device: torch.device (默认取模型所在设备)
+        max_length: int，截断长度
+        token_budget: int，每批 token 上限
+        max_batch_size: int，每批最大行数
+        window_size: int，后台分词/分桶的窗口大小
+        prefetch_batches: int，预取队列长度
+        show_progress: bool，是否显示进度条和各阶段耗时
+        stats: dict (可选)，传入时写入各阶段耗时 (秒)：
+            tokenize 分词, collate 分桶组批, forward 前向计算, wait 等待预取, total 总耗时，
+            以及 batch_seconds (每个批次前向计算耗时的列表)
+        return_embeddings: bool，是否同时返回同一次前向计算中的池化句向量 (见 capture_pooled_output)
+
+    Returns:
+        np.ndarray，形状 (len(texts), num_labels) 的 float32 概率矩阵，行顺序与输入一致；
+        return_embeddings=True 时返回 (概率矩阵, 形状 (len(texts), hidden_size) 的 float16 句向量)
+    """
+    texts = list(texts)
+    num_labels = model.config.num_labels
+    if not texts:
+        probs = np.zeros((0, num_labels), dtype=np.float32)
+        if return_embeddings:
+            return probs, np.zeros((0, model.config.hidden_size), dtype=np.float16)
+        return probs
+
+    if device is None:
+        device = getattr(model, 'device', torch.device("cpu"))
+
+    stage_times = {'tokenize': 0.0, 'collate': 0.0, 'forward': 0.0, 'wait': 0.0}
+    batch_queue = queue.Queue(maxsize=max(1, prefetch_batches))
+    stop_event = threading.Event()
+    producer = threading.Thread(
+        target=_produce_batches,
+        args=(texts, tokenizer, batch_queue, stop_event, stage_times, max_length, token_budget, max_batch_size, window_size),
+        daemon=True,
+    )
+
+    probs = np.empty((len(texts), num_labels), dtype=np.float32)
+    embeddings = np.empty((len(texts), model.config.hidden_size), dtype=np.float16) if return_embeddings else None
+    batch_seconds = []
+    total_start = time.perf_counter()
+    with ExitStack() as hooks:
+        captured = hooks.enter_context(capture_pooled_output(model)) if return_embeddings else None
+        producer.start()
+        try:
+            with tqdm(total=len(texts), desc="Predicting", disable=not show_progress) as pbar:
+                while True:
+                    start = time.perf_counter()
+                    item = batch_queue.get()
+                    stage_times['wait'] += time.perf_counter() - start
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+
+                    indices, inputs = item
+                    start = time.perf_counter()
+                    inputs = {k: v.to(device) for k, v in inputs.items()}
+                    with torch.no_grad():
+                        logits = model(**inputs).logits
+                    # 按原始下标写回，完成顺序还原
+                    probs[indices] = torch.softmax(logits.float(), dim=-1).cpu().numpy()
+                    if captured is not None:
+                        embeddings[indices] = captured.pop().float().cpu().numpy()
+                    batch_seconds.append(time.perf_counter() - start)
+                    stage_times['forward'] += batch_seconds[-1]
+                    pbar.update(len(indices))
+        finally:
+            stop_event.set()
+            producer.join()
+
+    stage_times['total'] = time.perf_counter() - total_start
+    if stats is not None:
+        stats.update(stage_times)
+        stats['batch_seconds'] = batch_seconds
+    if show_progress:
+        print(
+            f"⏱️ tokenize {stage_times['tokenize']:.2f}s + collate {stage_times['collate']:.2f}s (background) | "
+            f"forward {stage_times['forward']:.2f}s | "
+            f"waiting for batches {stage_times['wait']:.2f}s | total {stage_times['total']:.2f}s"
+        )
+    if return_embeddings:
+        return probs, embeddings
+    return probs
+
+def predict_labels(texts, model, tokenizer, **kwargs):
+    """
+    对文本列表做批量情感推理，返回类别编号 (参数同 predict_proba)
+
+    Returns:
+        np.ndarray，形状 (len(texts),) 的 int64 标签
+    """
+    return predict_proba(texts, model, tokenizer, **kwargs).argmax(axis=-1)
+
+def predict_proba_deduplicated(texts, predict_fn, num_labels, cache=None, model_key=None):
+    """
+    去重 + 缓存地执行推理
+
+    相同文本只推理一次；若提供缓存，先查询缓存，只对未命中的文本调用 predict_fn，
+    并把新结果写回缓存。
+
+    Args:
+        texts: list of str，待预测文本 (应已完成清洗/规范化)
+        predict_fn: 函数，接受 list of str 返回 (n, num_labels) 概率矩阵
+        num_labels: int，类别数
+        cache: PredictionCache (可选)
+        model_key: str，缓存键中的模型指纹 (使用缓存时必填，见 get_model_fingerprint)
+
+    Returns:
+        np.ndarray，形状 (len(texts), num_labels) 的概率矩阵，行顺序与输入一致
+    """
+    from src.analysis.prediction_cache import hash_text
+
+    codes, uniques = pd.factorize(pd.Series(list(texts), dtype=object))
+    uniques = list(uniques)
+    unique_probs = np.empty((len(uniques), num_labels), dtype=np.float32)
+
+    missing = list(range(len(uniques)))
+    hashes = None
+    if cache is not None and uniques:
+        hashes = [hash_text(t) for t in uniques]
+        hits = cache.get_many(model_key, hashes)
+        missing = []
+        for i, h in enumerate(hashes):
+            if h in hits:
+                unique_probs[i] = hits[h]
+            else:
+                missing.append(i)
+
+    print(
+        f"🧮 {len(codes)} rows -> {len(uniques)} unique texts, "
+        f"{len(uniques) - len(missing)} cache hits, {len(missing)} to run through the model"
+    )
+
+    if missing:
+        unique_probs[missing] = predict_fn([uniques[i] for i in missing])
+        if cache is not None:
+            cache.put_many(model_key, [hashes[i] for i in missing], unique_probs[missing])
+
+    return unique_probs[codes]
@@ -0,0 +1,385 @@
+"""
+本地推理服务
+
+常驻进程只加载一次模型，通过 HTTP 对外提供推理。并发到达的请求在服务端合并为微批次：
+凑够 max_batch_texts 条或最早的请求已等待 max_latency_ms 时立即执行一次前向计算。
+请求分为 interactive (交互，如 Streamlit 页面) 和 bulk (批量任务) 两个优先级，
+大的批量请求按微批次逐段执行，交互请求可以插队，不必等批量任务整体跑完。
+
+启动：python src/analysis/inference_server.py
+接口：
+    GET  /health   -> {fingerprint, num_labels, id2label, backend, stats}
+    POST /predict  {"texts": [...], "priority": "interactive" | "bulk", "max_length": 128}
+                   -> {"probs": [[...], ...]}
+"""
+import sys
+import json
+import heapq
+import itertools
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis.inference import predict_proba, get_model_fingerprint, DEFAULT_MAX_LENGTH
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_SERVER_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+# 每个微批次的最大文本数
+DEFAULT_MAX_BATCH_TEXTS = 512
+# 最早到达的请求最多等待多久就必须开跑 (毫秒)
+DEFAULT_MAX_LATENCY_MS = 20
+# 客户端每个请求携带的文本数，以及同时在途的请求数
+DEFAULT_REQUEST_SIZE = 256
+DEFAULT_CLIENT_CONCURRENCY = 4
+
+PRIORITIES = {'interactive': 0, 'bulk': 1}
+
+class _PendingRequest:
+    """一个等待推理的请求；大请求可能被拆到多个微批次中完成"""
+
+    def __init__(self, texts, priority, max_length, seq):
+        self.texts = texts
+        self.priority = priority
+        self.max_length = max_length
+        self.seq = seq
+        self.arrived = time.perf_counter()
+        self.offset = 0                # 下一条待调度文本的位置
+        self.remaining = len(texts)    # 尚未完成的文本数
+        self.probs = None
+        self.error = None
+        self.done = threading.Event()
+
+    def sort_key(self):
+        # 优先级高的先执行，同优先级先到先执行
+        return (self.priority, self.seq)
+
+class MicroBatcher:
+    """
+    跨请求的微批次调度器：请求进入优先队列，后台线程合并后调用模型
+
+    Args:
+        model: 情感分类模型
+        tokenizer: 分词器
+        max_batch_texts: int，每个微批次的最大文本数
+        max_latency_ms: float，最早的请求最多等待的毫秒数
+        **predict_kwargs: 透传给 predict_proba 的参数 (如 token_budget)
+    """
+
+    def __init__(self, model, tokenizer, max_batch_texts=DEFAULT_MAX_BATCH_TEXTS,
+                 max_latency_ms=DEFAULT_MAX_LATENCY_MS, **predict_kwargs):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.num_labels = model.config.num_labels
+        self.max_batch_texts = max_batch_texts
+        self.max_latency = max_latency_ms / 1000
+        self.predict_kwargs = predict_kwargs
+
+        self._heap = []
+        self._pending_texts = 0
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._stopped = False
+        self.stats = {'requests': 0, 'texts': 0, 'batches': 0, 'forward_seconds': 0.0}
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts, priority='bulk', max_length=DEFAULT_MAX_LENGTH, timeout=None):
+        """
+        提交请求并等待结果
+
+        Returns:
+            np.ndarray，形状 (len(texts), num_labels) 的概率矩阵
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority!r} (expected one of {list(PRIORITIES)})")
+        request = _PendingRequest(list(texts), PRIORITIES[priority], int(max_length), next(self._seq))
+        request.probs = np.empty((len(request.texts), self.num_labels), dtype=np.float32)
+        if not request.texts:
+            return request.probs
+
+        with self._cond:
+            heapq.heappush(self._heap, (request.sort_key(), request))
+            self._pending_texts += len(request.texts)
+            self.stats['requests'] += 1
+            self._cond.notify()
+
+        if not request.done.wait(timeout):
+            raise TimeoutError("Inference request timed out")
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.probs
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _collect(self):
+        """
+        在锁内调用：按优先级取出一个微批次
+
+        只合并与队首请求 max_length 相同的请求；部分取用的请求放回队列，下一批继续。
+
+        Returns:
+            (max_length, list of (request, start, end))
+        """
+        head = self._heap[0][1]
+        segments = []
+        skipped = []
+        budget = self.max_batch_texts
+        while self._heap and budget > 0:
+            key, request = heapq.heappop(self._heap)
+            if request.error is not None:
+                # 之前的分段已失败，剩余部分不再计算
+                self._pending_texts -= len(request.texts) - request.offset
+                continue
+            if request.max_length != head.max_length:
+                skipped.append((key, request))
+                continue
+            start = request.offset
+            end = min(len(request.texts), start + budget)
+            segments.append((request, start, end))
+            request.offset = end
+            budget -= end - start
+            if end < len(request.texts):
+                skipped.append((key, request))
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        self._pending_texts -= self.max_batch_texts - budget
+        return head.max_length, segments
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # 凑不满一个批次时，最多等到最早请求的延迟上限
+                deadline = min(r.arrived for _, r in self._heap) + self.max_latency
+                while self._pending_texts < self.max_batch_texts and not self._stopped:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                max_length, segments = self._collect()
+            if not segments:
+                continue
+
+            texts = [t for request, start, end in segments for t in request.texts[start:end]]
+            start_time = time.perf_counter()
+            try:
+                probs = predict_proba(
+                    texts, self.model, self.tokenizer,
+                    max_length=max_length, show_progress=False, **self.predict_kwargs
+                )
+                error = None
+            except Exception as e:
+                probs, error = None, f"{type(e).__name__}: {e}"
+            self.stats['forward_seconds'] += time.perf_counter() - start_time
+            self.stats['batches'] += 1
+            self.stats['texts'] += len(texts)
+
+            pos = 0
+            for request, start, end in segments:
+                if error is not None:
+                    request.error = error
+                    request.done.set()
+                    continue
+                request.probs[start:end] = probs[pos:pos + end - start]
+                pos += end - start
+                request.remaining -= end - start
+                if request.remaining == 0:
+                    request.done.set()
+
+def _make_handler(batcher, info):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/health':
+                self._send_json(404, {'error': 'not found'})
+                return
+            stats = dict(batcher.stats)
+            stats['avg_batch_texts'] = round(stats['texts'] / stats['batches'], 1) if stats['batches'] else 0
+            self._send_json(200, dict(info, stats=stats))
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length).decode('utf-8'))
+                probs = batcher.submit(
+                    payload['texts'],
+                    priority=payload.get('priority', 'bulk'),
+                    max_length=payload.get('max_length', DEFAULT_MAX_LENGTH),
+                )
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {'probs': probs.tolist()})
+
+        def log_message(self, format, *args):
+            # 逐请求日志太多，关闭默认输出
+            pass
+
+    return InferenceHandler
+
+def serve(
+    model_path=None,
+    backend="torch",
+    host=DEFAULT_HOST,
+    port=DEFAULT_PORT,
+    max_batch_texts=DEFAULT_MAX_BATCH_TEXTS,
+    max_latency_ms=DEFAULT_MAX_LATENCY_MS,
+):
+    """
+    启动推理服务 (阻塞，Ctrl+C 退出)
+
+    Args:
+        model_path: 模型路径或 Hugging Face ID (默认同 run_prediction_pipeline)
+        backend: str，"torch" 或 "onnx"
+        host / port: 监听地址
+        max_batch_texts: int，每个微批次的最大文本数
+        max_latency_ms: float，最早的请求最多等待的毫秒数
+    """
+    if backend == "onnx":
+        from src.analysis.onnx_backend import load_onnx_model
+        model, tokenizer = load_onnx_model(model_path)
+    else:
+        from src.analysis.model import get_model_and_tokenizer
+        model, tokenizer = get_model_and_tokenizer(model_path)
+
+    batcher = MicroBatcher(model, tokenizer, max_batch_texts=max_batch_texts, max_latency_ms=max_latency_ms)
+    id2label = getattr(model.config, 'id2label', None) or {}
+    info = {
+        'fingerprint': get_model_fingerprint(model),
+        'num_labels': model.config.num_labels,
+        'id2label': {str(k): v for k, v in id2label.items()},
+        'backend': backend,
+    }
+
+    server = ThreadingHTTPServer((host, port), _make_handler(batcher, info))
+    server.daemon_threads = True
+    print(f"🛰️ Inference server listening on http://{host}:{port} ({backend}, "
+          f"micro-batch <= {max_batch_texts} texts / {max_latency_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Shutting down inference server...")
+    finally:
+        server.server_close()
+        batcher.stop()
+
+class RemoteSentimentModel:
+    """
+    推理服务的客户端，接口与流水线使用的模型对象保持一致 (config、fingerprint)，
+    推理通过 predict_proba 发送文本，不需要本地分词器。
+
+    Args:
+        server_url: 推理服务地址
+        priority: str，默认请求优先级；交互界面用 "interactive"，离线任务用 "bulk"
+        timeout: float，单个请求的超时秒数
+    """
+
+    device = torch.device("cpu")
+
+    def __init__(self, server_url=DEFAULT_SERVER_URL, priority='bulk', timeout=600):
+        self.server_url = server_url.rstrip('/')
+        self.priority = priority
+        self.timeout = timeout
+        info = self.health()
+        id2label = {int(k): v for k, v in info.get('id2label', {}).items()}
+        self.config = SimpleNamespace(num_labels=info['num_labels'], id2label=id2label)
+        self.fingerprint = info['fingerprint']
+
+    def _request(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        req = urllib.request.Request(
+            self.server_url + path,
+            data=data,
+            headers={'Content-Type': 'application/json; charset=utf-8'},
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+
+    def health(self):
+        """服务状态与统计"""
+        return self._request('/health')
+
+    def predict_proba(
+        self,
+        texts,
+        priority=None,
+        max_length=DEFAULT_MAX_LENGTH,
+        request_size=DEFAULT_REQUEST_SIZE,
+        concurrency=DEFAULT_CLIENT_CONCURRENCY,
+    ):
+        """
+        远程推理，返回各类别概率
+
+        大列表按 request_size 拆成多个请求并发发送，服务端会与其他客户端的请求一起组批。
+
+        Returns:
+            np.ndarray，形状 (len(texts), num_labels) 的 float32 概率矩阵，行顺序与输入一致
+        """
+        texts = list(texts)
+        priority = priority or self.priority
+        probs = np.empty((len(texts), self.config.num_labels), dtype=np.float32)
+        if not texts:
+            return probs
+
+        def send(start):
+            result = self._request('/predict', {
+                'texts': texts[start:start + request_size],
+                'priority': priority,
+                'max_length': max_length,
+            })
+            probs[start:start + request_size] = result['probs']
+
+        starts = range(0, len(texts), request_size)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            list(pool.map(send, starts))
+        return probs
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+if __name__ == "__main__":
+    print("========================================")
+    print("   Bilibili 情感分析 - 本地推理服务")
+    print("========================================")
+    backend_choice = input("请选择推理后端 torch / onnx (按Enter使用默认值 torch): ").strip().lower()
+    port_input = input(f"请输入监听端口 (按Enter使用默认值 {DEFAULT_PORT}): ").strip()
+    serve(
+        backend="onnx" if backend_choice in ['2', 'onnx'] else "torch",
+        port=int(port_input) if port_input.isdigit() else DEFAULT_PORT,
+    )
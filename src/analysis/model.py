@@ -1,18 +1,262 @@
 # 推理示例：model_predict.py
+"""
+情感模型的共享提供者
+
+模型与分词器在第一次使用时才加载 (导入本模块不会触发任何加载)，
+同一进程内的 predict、run_prediction_pipeline 与 app.py 共用同一份实例。
+兼容旧用法：`from src.analysis.model import model, tokenizer` 仍然可用，此时才触发加载。
+"""
+import os
+import threading
+import time
 from pathlib import Path
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 MODEL_ID = "ScarletShinku/bilibili-sentiment-bert"  # 使用 Hugging Face 上的微调模型
+LOCAL_MODEL_DIR = PROJECT_ROOT / "trained_models"     # 本地训练的模型 (存在时优先使用)
+# 冷启动缓存 (TorchScript 图 + 内存映射的 safetensors 权重，见 model_cache.py)：CPU 上优先加载缓存，
+# 没有时正常加载并生成一份 (此时共享模型不是 nn.Module，见 get_torch_model)；设置环境变量 SENTIMENT_FAST_LOAD=0 关闭
+USE_COMPILED_CACHE = os.environ.get("SENTIMENT_FAST_LOAD", "1") != "0"
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
-model = AutoModelForSequenceClassification.from_pretrained(MODEL_ID).to(device)
+_lock = threading.Lock()
+_loaded = {}      # {模型路径: (model, tokenizer)}
+_load_stats = {}  # {模型路径: 加载耗时与内存统计}
+_torch_models = {}  # {模型路径: transformers 模型}，共享模型为追踪图时按需加载
+
+def resolve_model_path(model_path=None):
+    """未指定模型路径时，优先使用本地 trained_models，否则使用 Hugging Face 模型"""
+    if model_path is not None:
+        return model_path
+    return LOCAL_MODEL_DIR if LOCAL_MODEL_DIR.exists() else MODEL_ID
+
+def get_rss_bytes():
+    """当前进程常驻内存 (字节)，仅 Linux 可用，其他平台返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def get_model_and_tokenizer(model_path=None):
+    """
+    获取共享的模型与分词器，首次调用时加载 (线程安全)
+
+    Args:
+        model_path: 模型路径或 Hugging Face ID (默认见 resolve_model_path)
+
+    Returns:
+        (model, tokenizer)
+    """
+    key = str(resolve_model_path(model_path))
+    with _lock:
+        if key not in _loaded:
+            print(f"🚀 Loading model from: {key}")
+            rss_before = get_rss_bytes()
+            start = time.perf_counter()
+            compiled = None
+            if USE_COMPILED_CACHE and device.type == "cpu":
+                from src.analysis.model_cache import load_compiled_model
+                compiled = load_compiled_model(key)
+
+            if compiled is not None:
+                model, tokenizer, meta = compiled
+                param_mb = meta['param_mb']
+                source = "fast-load cache"
+            else:
+                from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+                tokenizer = AutoTokenizer.from_pretrained(key)
+                model = AutoModelForSequenceClassification.from_pretrained(key).to(device)
+                model.eval()
+                param_mb = round(sum(p.numel() * p.element_size() for p in model.parameters()) / 2**20, 1)
+                source = "from_pretrained"
+            load_seconds = time.perf_counter() - start
+            rss_after = get_rss_bytes()
+
+            _load_stats[key] = {
+                'load_seconds': round(load_seconds, 3),
+                'param_mb': param_mb,
+                'rss_delta_mb': round((rss_after - rss_before) / 2**20, 1) if rss_before is not None else None,
+                'source': source,
+                'warmed_up': False,
+            }
+            _loaded[key] = (model, tokenizer)
+            print(f"✅ Model loaded in {load_seconds:.1f}s via {source} ({param_mb} MB parameters)")
+
+            if compiled is None and USE_COMPILED_CACHE and device.type == "cpu":
+                # 为之后的进程生成冷启动缓存 (本进程继续使用原模型)
+                from src.analysis.model_cache import build_compiled_model
+                build_compiled_model(model, tokenizer, key)
+    return _loaded[key]
+
+def get_model(model_path=None):
+    """获取共享模型 (首次调用时加载)"""
+    return get_model_and_tokenizer(model_path)[0]
+
+def get_tokenizer(model_path=None):
+    """获取共享分词器 (首次调用时加载)"""
+    return get_model_and_tokenizer(model_path)[1]
+
+def get_torch_model(model_path=None):
+    """
+    获取可以访问内部结构 (编码层、分类头) 的 transformers 模型
+
+    共享模型来自冷启动缓存 (追踪图) 时，按同一来源用 from_pretrained 另外加载一份并缓存；
+    否则直接返回共享模型。用于提前退出等需要逐层计算的场景。
+    """
+    model = get_model(model_path)
+    if isinstance(model, torch.nn.Module):
+        return model
+    key = str(resolve_model_path(model_path))
+    with _lock:
+        if key not in _torch_models:
+            from transformers import AutoModelForSequenceClassification
+            print(f"🚀 Loading the eager PyTorch model from: {key}")
+            _torch_models[key] = AutoModelForSequenceClassification.from_pretrained(key).to(device).eval()
+    return _torch_models[key]
+
+def is_loaded(model_path=None):
+    """模型是否已经加载"""
+    return str(resolve_model_path(model_path)) in _loaded
+
+def unload(model_path=None):
+    """
+    从共享提供者中移除模型 (连同按需加载的 transformers 模型)，使其内存可以被回收
+
+    仍在使用该模型的调用方不受影响，用完后内存才会真正释放。
+
+    Returns:
+        bool，模型此前是否已加载
+    """
+    import gc
+
+    key = str(resolve_model_path(model_path))
+    with _lock:
+        removed = _loaded.pop(key, None) is not None
+        _torch_models.pop(key, None)
+        _load_stats.pop(key, None)
+    if removed:
+        gc.collect()
+    return removed
+
+def warm_up(model_path=None, texts=("预热一下", "前方高能")):
+    """
+    预热：加载模型并跑一次前向，让首个真实请求不必等待初始化
+
+    Returns:
+        dict，该模型的加载统计 (见 get_load_stats)
+    """
+    model, tokenizer = get_model_and_tokenizer(model_path)
+    key = str(resolve_model_path(model_path))
+    start = time.perf_counter()
+    inputs = tokenizer(list(texts), return_tensors="pt", truncation=True, padding=True).to(device)
+    with torch.no_grad():
+        model(**inputs)
+    _load_stats[key]['warmed_up'] = True
+    _load_stats[key]['warmup_seconds'] = round(time.perf_counter() - start, 3)
+    return dict(_load_stats[key])
+
+def get_load_stats(model_path=None):
+    """
+    获取模型加载统计：加载耗时、参数内存、加载前后进程内存增量
+
+    Args:
+        model_path: 指定模型；为 None 时返回所有已加载模型的统计
+
+    Returns:
+        dict
+    """
+    if model_path is None:
+        return {k: dict(v) for k, v in _load_stats.items()}
+    return dict(_load_stats.get(str(resolve_model_path(model_path)), {}))
+
+def __getattr__(name):
+    # 兼容旧代码的 `from src.analysis.model import model, tokenizer`，访问时才加载
+    if name == 'model':
+        return get_model()
+    if name == 'tokenizer':
+        return get_tokenizer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-model.eval()
 def predict(text):
+    """单条预测，返回标签编号 (多条文本请用 predict_many / predict_stream)"""
+    model, tokenizer = get_model_and_tokenizer()
     inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True).to(device)
     with torch.no_grad():
         logits = model(**inputs).logits
     pred = torch.argmax(logits, dim=-1).item()
-    return pred
\ No newline at end of file
+    return pred
+
+def predict_many(texts, return_probs=False, model_path=None, max_length=None, token_budget=None, max_batch_size=None):
+    """
+    批量预测：按 token 长度分桶动态组批，分词、截断和设备放置都在内部完成
+
+    与逐条调用 predict 相比，一次前向处理一整批文本，吞吐量高得多。
+
+    Args:
+        texts: 可迭代的 str
+        return_probs: bool，为 True 时返回各类别概率，否则返回标签编号
+        model_path: 模型路径 (默认见 resolve_model_path)
+        max_length: int，截断长度 (默认 DEFAULT_MAX_LENGTH)
+        token_budget: int，每批 token 上限 (默认 DEFAULT_TOKEN_BUDGET)
+        max_batch_size: int，每批最大行数 (默认 DEFAULT_MAX_BATCH_SIZE)
+
+    Returns:
+        np.ndarray：标签编号 (n,)；return_probs=True 时为 (n, num_labels) 的 float32 概率矩阵，
+        行顺序与输入一致
+
+    Example:
+        labels = predict_many(["哈哈哈哈", "这也太感人了吧"])
+    """
+    from src.analysis.inference import predict_proba, DEFAULT_MAX_LENGTH, DEFAULT_TOKEN_BUDGET, DEFAULT_MAX_BATCH_SIZE
+
+    if isinstance(texts, str):
+        texts = [texts]
+    model, tokenizer = get_model_and_tokenizer(model_path)
+    probs = predict_proba(
+        list(texts),
+        model,
+        tokenizer,
+        max_length=max_length or DEFAULT_MAX_LENGTH,
+        token_budget=token_budget or DEFAULT_TOKEN_BUDGET,
+        max_batch_size=max_batch_size or DEFAULT_MAX_BATCH_SIZE,
+        show_progress=False,
+    )
+    return probs if return_probs else probs.argmax(axis=-1)
+
+def predict_stream(texts, chunk_size=1024, return_probs=False, model_path=None, **kwargs):
+    """
+    流式预测：从迭代器中按块读取文本，批量推理后按输入顺序逐条产出结果
+
+    内存占用只与 chunk_size 有关，适合逐行读取的大文件或持续到达的数据。
+    每凑满一块 (或迭代器结束) 才推理一次，块越大吞吐越高、首条结果的延迟也越大。
+
+    Args:
+        texts: 可迭代的 str (可以是生成器)
+        chunk_size: int，每次推理的文本数
+        return_probs: bool，为 True 时产出各类别概率 (np.ndarray)，否则产出标签编号 (int)
+        model_path: 模型路径 (默认见 resolve_model_path)
+        **kwargs: 传给 predict_many 的其他参数 (max_length、token_budget、max_batch_size)
+
+    Yields:
+        int 或 np.ndarray，与输入一一对应
+
+    Example:
+        with open("danmaku.txt", encoding="utf-8") as f:
+            for label in predict_stream(line.strip() for line in f):
+                ...
+    """
+    from itertools import islice
+
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        results = predict_many(chunk, return_probs=return_probs, model_path=model_path, **kwargs)
+        if return_probs:
+            yield from results
+        else:
+            yield from (int(label) for label in results)
@@ -0,0 +1,318 @@
+"""
+模型冷启动缓存
+
+首次在 CPU 上加载某个模型后，把它追踪 (torch.jit.trace) 为 TorchScript 图，权重另存为 safetensors，
+连同分词器文件和配置保存到 trained_models_cache/ 下。图只记录计算结构，权重作为图的输入传入，
+因此图文件只有几十 KB。之后的进程直接加载这份产物：不再导入 transformers (它本身的导入就要数秒)，
+不再构建 Python 模型对象；权重文件以内存映射方式打开，实际用到时才由操作系统按页读入，
+多个进程加载同一模型时共享同一份页缓存。分词改用 tokenizers 库。
+原始模型更新后 (本地目录的修改时间、Hugging Face 模型的快照提交变化) 产物自动失效重建。
+默认开启，设置环境变量 SENTIMENT_FAST_LOAD=0 关闭 (见 model.py 的 USE_COMPILED_CACHE)。
+
+追踪图同时输出 logits 和分类头的输入 (池化句向量)，因此语义索引 (见 semantic_index.py) 照常可用。
+"""
+import sys
+import json
+import time
+import threading
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import torch
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+MODEL_CACHE_DIR = PROJECT_ROOT / "trained_models_cache"
+TRACE_INPUT_NAMES = ('input_ids', 'attention_mask', 'token_type_ids')
+# 追踪与校验用的示例：含补齐位置，覆盖带 mask 的分支
+TRACE_TEXTS = ("导出示例", "这是一条用于追踪计算图的示例弹幕，长度和上一条不同")
+CHECK_TEXTS = ("哈哈哈", "前方高能预警", "这个视频真的太好看了吧我哭死", "好耶")
+CHECK_TOLERANCE = 1e-4
+
+def _state_tensors(model):
+    """模型的全部参数与缓冲区 (共享的权重按各自名称分别列出)，顺序即追踪图的权重输入顺序"""
+    tensors = dict(model.named_parameters(remove_duplicate=False))
+    tensors.update(model.named_buffers(remove_duplicate=False))
+    return tensors
+
+@contextmanager
+def _swapped_state(model, names, tensors):
+    """临时把模型的参数与缓冲区换成给定张量，追踪时它们就成为图的输入而不是常量"""
+    swapped = []
+    try:
+        for name, tensor in zip(names, tensors):
+            module_name, _, attr = name.rpartition('.')
+            module = model.get_submodule(module_name)
+            slots = module._parameters if attr in module._parameters else module._buffers
+            swapped.append((slots, attr, slots[attr]))
+            slots[attr] = tensor
+        yield
+    finally:
+        for slots, attr, original in reversed(swapped):
+            slots[attr] = original
+
+class _TracedOutputs(torch.nn.Module):
+    """追踪用的包装：第一个参数为权重元组，其后按位置传入模型输入，输出 (logits, 池化句向量)"""
+
+    def __init__(self, model, weight_names, input_names):
+        super().__init__()
+        self.model = model
+        self.weight_names = weight_names
+        self.input_names = input_names
+
+    def forward(self, weights, *args):
+        from src.analysis.inference import capture_pooled_output
+        with _swapped_state(self.model, self.weight_names, weights), capture_pooled_output(self.model) as captured:
+            logits = self.model(**dict(zip(self.input_names, args))).logits
+        return logits, captured[0]
+
+class FastTokenizer:
+    """
+    tokenizers 库的轻量包装，调用方式与 Hugging Face 分词器的常用部分一致：
+    tokenizer(texts, truncation=True, max_length=...)，以及 return_tensors="pt" + padding=True
+    """
+
+    def __init__(self, tokenizer_path, pad_token_id=0, model_max_length=512):
+        from tokenizers import Tokenizer
+        self._tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self._tokenizer.no_padding()
+        self._tokenizer.no_truncation()
+        self.pad_token_id = pad_token_id
+        self.model_max_length = model_max_length
+        # 截断设置是分词器的内部状态，后台预取线程与其他线程可能同时分词
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, truncation=False, max_length=None, padding=False, return_tensors=None):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        with self._lock:
+            if truncation:
+                self._tokenizer.enable_truncation(max_length or self.model_max_length)
+            else:
+                self._tokenizer.no_truncation()
+            encodings = self._tokenizer.encode_batch(texts)
+
+        batch = _Encoding(
+            input_ids=[e.ids for e in encodings],
+            token_type_ids=[e.type_ids for e in encodings],
+            attention_mask=[e.attention_mask for e in encodings],
+        )
+        if return_tensors == "pt":
+            width = max((len(ids) for ids in batch['input_ids']), default=0)
+            pads = {'input_ids': self.pad_token_id, 'token_type_ids': 0, 'attention_mask': 0}
+            for name, rows in batch.items():
+                if padding:
+                    rows = [row + [pads[name]] * (width - len(row)) for row in rows]
+                batch[name] = torch.tensor(rows, dtype=torch.long)
+        elif single:
+            for name in batch:
+                batch[name] = batch[name][0]
+        return batch
+
+class _Encoding(dict):
+    """分词结果，支持 .to(device)"""
+
+    def to(self, device):
+        return _Encoding({k: v.to(device) if torch.is_tensor(v) else v for k, v in self.items()})
+
+class CompiledSentimentModel:
+    """
+    TorchScript 图 + 内存映射权重的包装，调用方式与 Hugging Face 模型一致：model(**inputs).logits
+    """
+
+    device = torch.device("cpu")
+
+    def __init__(self, graph_path, weights_path, weight_names, config, fingerprint, input_names):
+        from safetensors import safe_open
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.graph = torch.jit.load(str(graph_path), map_location="cpu")
+        # safe_open 对 PyTorch 张量使用内存映射，这里不会读入权重数据
+        with safe_open(str(weights_path), framework="pt") as f:
+            self.weights = tuple(f.get_tensor(name) for name in weight_names)
+        self.graph_path = Path(graph_path)
+        self.weights_path = Path(weights_path)
+        self.config = config
+        self.fingerprint = fingerprint
+        self.input_names = list(input_names)
+        # 由 capture_pooled_output 设置：非 None 时每次前向把池化句向量追加进去
+        self.pooled_output_sink = None
+
+    def __call__(self, **inputs):
+        args = [
+            inputs[name] if name in inputs else torch.zeros_like(inputs['input_ids'])
+            for name in self.input_names
+        ]
+        logits, pooled = self.graph(self.weights, *args)
+        if self.pooled_output_sink is not None:
+            self.pooled_output_sink.append(pooled)
+        return SimpleNamespace(logits=logits)
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+def _cache_dir_for(model_path):
+    from src.analysis.onnx_backend import _source_signature
+    dir_name, signature = _source_signature(model_path)
+    return MODEL_CACHE_DIR / dir_name, signature
+
+def build_compiled_model(model, tokenizer, model_path):
+    """
+    追踪模型并保存冷启动产物 (计算图 + safetensors 权重)；与原模型的输出核对不一致时放弃保存
+
+    Args:
+        model: 已加载的 Hugging Face 情感分类模型 (CPU)
+        tokenizer: 对应的 Hugging Face 快速分词器
+        model_path: 模型来源 (路径或 Hugging Face ID)，用于判断产物是否过期
+
+    Returns:
+        Path，产物目录；失败时返回 None
+    """
+    from safetensors.torch import save_file
+    from src.analysis.inference import get_model_fingerprint
+
+    output_dir, signature = _cache_dir_for(model_path)
+    start = time.perf_counter()
+    try:
+        example = tokenizer(list(TRACE_TEXTS), return_tensors="pt", padding=True)
+        input_names = tuple(name for name in TRACE_INPUT_NAMES if name in example)
+        state = _state_tensors(model.eval())
+        weight_names = list(state)
+        weights = tuple(t.detach() for t in state.values())
+        wrapper = _TracedOutputs(model, weight_names, input_names).eval()
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            # 追踪函数而不是模块：图里不保存任何子模块的权重
+            graph = torch.jit.trace(
+                lambda weights, *args: wrapper(weights, *args),
+                (weights, *(example[name] for name in input_names)),
+            )
+
+            # 在不同批大小、不同长度的输入上核对追踪图与原模型
+            check = tokenizer(list(CHECK_TEXTS), return_tensors="pt", padding=True)
+            expected = model(**{name: check[name] for name in input_names}).logits
+            actual, _ = graph(weights, *(check[name] for name in input_names))
+        max_diff = (expected - actual).abs().max().item()
+        if max_diff > CHECK_TOLERANCE:
+            print(f"⚠️ Traced model differs from the original (max diff {max_diff:.2e}), not caching it")
+            return None
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            torch.jit.save(graph, str(output_dir / "graph.pt"))
+        # safetensors 不允许多个名称共享存储，逐个复制
+        save_file({name: t.contiguous().clone() for name, t in zip(weight_names, weights)}, str(output_dir / "model.safetensors"))
+        tokenizer.backend_tokenizer.save(str(output_dir / "tokenizer.json"))
+        config = model.config.to_dict()
+        config['_name_or_path'] = str(model_path)
+        config['num_labels'] = model.config.num_labels
+        meta = {
+            'source': signature,
+            'fingerprint': get_model_fingerprint(model),
+            'input_names': list(input_names),
+            'weight_names': weight_names,
+            'pad_token_id': tokenizer.pad_token_id or 0,
+            'model_max_length': min(int(tokenizer.model_max_length), 1 << 20),
+            'param_mb': round(sum(p.numel() * p.element_size() for p in model.parameters()) / 2**20, 1),
+            'config': config,
+            'torch_version': torch.__version__,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        (output_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+    except Exception as e:
+        print(f"⚠️ Could not build the fast-load model cache: {type(e).__name__}: {e}")
+        return None
+    print(f"📦 Fast-load model cache saved to {output_dir} ({time.perf_counter() - start:.1f}s)")
+    return output_dir
+
+def load_compiled_model(model_path):
+    """
+    加载冷启动产物 (不导入 transformers)
+
+    Returns:
+        (CompiledSentimentModel, FastTokenizer, meta)；产物不存在、已过期或由其他 torch 版本生成时返回 None
+    """
+    output_dir, signature = _cache_dir_for(model_path)
+    meta_path = output_dir / "meta.json"
+    if not all(p.exists() for p in (meta_path, output_dir / "graph.pt", output_dir / "model.safetensors")):
+        return None
+    meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    if meta.get('source') != signature or meta.get('torch_version') != torch.__version__:
+        return None
+    try:
+        model = CompiledSentimentModel(
+            output_dir / "graph.pt",
+            output_dir / "model.safetensors",
+            meta['weight_names'],
+            SimpleNamespace(**meta['config']),
+            fingerprint=meta['fingerprint'],
+            input_names=meta['input_names'],
+        )
+        tokenizer = FastTokenizer(output_dir / "tokenizer.json", meta['pad_token_id'], meta['model_max_length'])
+    except Exception as e:
+        print(f"⚠️ Fast-load model cache is unusable, falling back to from_pretrained: {type(e).__name__}: {e}")
+        return None
+    return model, tokenizer, meta
+
+def measure_cold_start(model_path=None, use_cache=True):
+    """
+    在全新的 Python 进程中测量冷启动：从解释器启动到第一条预测完成的各阶段耗时
+
+    Args:
+        model_path: 模型路径 (默认见 resolve_model_path)
+        use_cache: bool，是否使用冷启动产物
+
+    Returns:
+        dict，{import_seconds, load_seconds, first_prediction_seconds, total_seconds}
+    """
+    import subprocess
+
+    code = f"""
+import time, json, sys
+start = time.perf_counter()
+sys.path.insert(0, {str(PROJECT_ROOT)!r})
+import src.analysis.model as model_module
+from src.analysis.inference import predict_proba
+model_module.USE_COMPILED_CACHE = {bool(use_cache)!r}
+imported = time.perf_counter()
+model, tokenizer = model_module.get_model_and_tokenizer({None if model_path is None else str(model_path)!r})
+loaded = time.perf_counter()
+predict_proba(["这个视频太好看了"], model, tokenizer, show_progress=False)
+done = time.perf_counter()
+print("__RESULT__" + json.dumps({{
+    'import_seconds': imported - start,
+    'load_seconds': loaded - imported,
+    'first_prediction_seconds': done - loaded,
+    'total_seconds': done - start,
+}}))
+"""
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("__RESULT__"):
+            return {k: round(v, 2) for k, v in json.loads(line[len("__RESULT__"):]).items()}
+    raise RuntimeError(f"cold start measurement failed:\n{result.stderr[-2000:]}")
+
+if __name__ == "__main__":
+    from src.analysis.model import resolve_model_path
+
+    model_path = input("请输入模型路径 (按Enter使用默认模型): ").strip() or None
+    if load_compiled_model(resolve_model_path(model_path)) is None:
+        # 第一次按常规方式加载时会自动生成产物
+        print("📦 No fast-load cache yet, building it...")
+        measure_cold_start(model_path, use_cache=True)
+    for use_cache in (False, True):
+        timings = measure_cold_start(model_path, use_cache=use_cache)
+        label = "fast-load cache" if use_cache else "from_pretrained"
+        print(
+            f"⏱️ {label:>15}: import {timings['import_seconds']}s + load {timings['load_seconds']}s + "
+            f"first prediction {timings['first_prediction_seconds']}s = {timings['total_seconds']}s"
+        )
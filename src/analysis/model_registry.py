@@ -0,0 +1,237 @@
+"""
+多模型注册表：按名称或指纹按需加载，内存超出预算时淘汰最久未使用的模型
+
+同一进程内只有一个注册表 (见 get_registry)，Streamlit 的各个会话共用其中已加载的模型。
+PyTorch 模型经由 model.py 的共享提供者加载，run_prediction_pipeline 拿到的是同一份实例；
+淘汰时同时从共享提供者中移除，内存在最后一个使用者用完后释放。
+
+内置名称：
+    huggingface  Hugging Face 上的微调模型
+    local        本地 trained_models 目录 (存在时)
+    student      为默认模型蒸馏的学生模型 (见 distill.py，存在时)
+也可以直接传入模型路径，或已加载过的模型的指纹 (见 get_model_fingerprint)。
+"""
+import sys
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis import model as shared_models
+
+# 默认内存预算 (MB，按模型参数 / 产物文件大小计)
+DEFAULT_MEMORY_BUDGET_MB = 2048
+BACKENDS = ("torch", "onnx")
+
+def _model_size_mb(model, model_path):
+    """估算模型常驻内存 (MB)：PyTorch 模型按参数，冷启动缓存与 ONNX 按权重文件大小"""
+    import torch
+
+    if isinstance(model, torch.nn.Module):
+        return sum(p.numel() * p.element_size() for p in model.parameters()) / 2**20
+    for attr in ('weights_path', 'onnx_path'):
+        path = getattr(model, attr, None)
+        if path is not None and Path(path).exists():
+            return Path(path).stat().st_size / 2**20
+    stats = shared_models.get_load_stats(model_path)
+    return float(stats.get('param_mb') or 0.0)
+
+class ModelRegistry:
+    """
+    按需加载、LRU 淘汰的模型注册表 (线程安全)
+
+    Example:
+        registry = get_registry()
+        model, tokenizer = registry.get("huggingface")
+        model, tokenizer = registry.get("local", backend="onnx")
+        print(registry.stats())
+    """
+
+    def __init__(self, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+        self.memory_budget_mb = memory_budget_mb
+        self._entries = OrderedDict()  # {(backend, 模型路径): entry}，按最近使用排序
+        self._fingerprints = {}        # {指纹: (backend, 模型路径)}，淘汰后仍保留以便重新加载
+        self._lock = threading.RLock()
+        self._counters = {'loads': 0, 'hits': 0, 'evictions': 0, 'load_seconds': 0.0}
+
+    def available_models(self):
+        """当前可用的内置名称"""
+        from src.analysis.distill import find_student_model
+
+        names = ["huggingface"]
+        if shared_models.LOCAL_MODEL_DIR.exists():
+            names.append("local")
+        if find_student_model() is not None:
+            names.append("student")
+        return names
+
+    def resolve(self, name=None, backend="torch"):
+        """
+        把名称、指纹或路径解析为 (backend, 模型路径)
+
+        Raises:
+            ValueError：未知后端，或名称对应的模型不存在
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"未知后端: {backend}，可选 {BACKENDS}")
+        if name is None:
+            return backend, str(shared_models.resolve_model_path())
+        if name == "huggingface":
+            return backend, shared_models.MODEL_ID
+        if name == "local":
+            if not shared_models.LOCAL_MODEL_DIR.exists():
+                raise ValueError(f"本地模型不存在: {shared_models.LOCAL_MODEL_DIR}")
+            return backend, str(shared_models.LOCAL_MODEL_DIR)
+        if name == "student":
+            from src.analysis.distill import find_student_model
+            student_path = find_student_model()
+            if student_path is None:
+                raise ValueError("还没有蒸馏的学生模型，请先运行 python src/analysis/distill.py")
+            return backend, str(student_path)
+        with self._lock:
+            if name in self._fingerprints:
+                return self._fingerprints[name]
+        return backend, str(shared_models.resolve_model_path(name))
+
+    def get(self, name=None, backend="torch"):
+        """
+        获取模型与分词器：已加载时直接返回 (命中)，否则加载，并在超出内存预算时淘汰
+
+        Args:
+            name: 内置名称、模型路径、Hugging Face ID 或已加载过的模型指纹 (默认见 resolve_model_path)
+            backend: "torch" 或 "onnx"
+
+        Returns:
+            (model, tokenizer)
+        """
+        key = self.resolve(name, backend)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry['hits'] += 1
+                entry['last_used'] = time.time()
+                self._counters['hits'] += 1
+                return entry['model'], entry['tokenizer']
+
+            # 加载期间持有锁：多个会话同时请求同一模型时只加载一次
+            start = time.perf_counter()
+            model, tokenizer = self._load(*key)
+            load_seconds = time.perf_counter() - start
+            from src.analysis.inference import get_model_fingerprint
+            fingerprint = get_model_fingerprint(model)
+            self._entries[key] = {
+                'model': model,
+                'tokenizer': tokenizer,
+                'fingerprint': fingerprint,
+                'size_mb': round(_model_size_mb(model, key[1]), 1),
+                'load_seconds': round(load_seconds, 3),
+                'hits': 0,
+                'last_used': time.time(),
+            }
+            self._fingerprints[fingerprint] = key
+            self._counters['loads'] += 1
+            self._counters['load_seconds'] += load_seconds
+            self._evict(keep=key)
+            return model, tokenizer
+
+    def _load(self, backend, model_path):
+        if backend == "onnx":
+            from src.analysis.onnx_backend import load_onnx_model
+            return load_onnx_model(model_path)
+        return shared_models.get_model_and_tokenizer(model_path)
+
+    def memory_used_mb(self):
+        with self._lock:
+            return sum(entry['size_mb'] for entry in self._entries.values())
+
+    def _evict(self, keep=None):
+        """淘汰最久未使用的模型，直到总内存不超过预算 (刚加载的模型不淘汰)"""
+        with self._lock:
+            while self.memory_used_mb() > self.memory_budget_mb:
+                victim = next((key for key in self._entries if key != keep), None)
+                if victim is None:
+                    break
+                self.unload(*victim, _count=True)
+
+    def unload(self, backend, model_path, _count=False):
+        """从注册表中移除模型；PyTorch 模型同时从共享提供者中移除"""
+        with self._lock:
+            entry = self._entries.pop((backend, model_path), None)
+            if entry is None:
+                return False
+            if _count:
+                self._counters['evictions'] += 1
+                print(f"♻️ Evicted model {Path(model_path).name} ({backend}, {entry['size_mb']} MB) to stay within {self.memory_budget_mb} MB")
+        if backend == "torch":
+            shared_models.unload(model_path)
+        return True
+
+    def set_memory_budget(self, memory_budget_mb):
+        """调整内存预算，必要时立即淘汰"""
+        with self._lock:
+            self.memory_budget_mb = memory_budget_mb
+            keep = next(reversed(self._entries), None) if self._entries else None
+            self._evict(keep=keep)
+
+    def stats(self):
+        """
+        注册表统计
+
+        Returns:
+            dict，{loads, hits, evictions, load_seconds, memory_used_mb, memory_budget_mb, models}，
+            models 按最近使用排序，每项为 {backend, path, fingerprint, size_mb, load_seconds, hits, last_used}
+        """
+        with self._lock:
+            return {
+                **{k: (round(v, 3) if isinstance(v, float) else v) for k, v in self._counters.items()},
+                'memory_used_mb': round(self.memory_used_mb(), 1),
+                'memory_budget_mb': self.memory_budget_mb,
+                'models': [
+                    {'backend': backend, 'path': path, **{k: v for k, v in entry.items() if k not in ('model', 'tokenizer')}}
+                    for (backend, path), entry in reversed(self._entries.items())
+                ],
+            }
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry(memory_budget_mb=None):
+    """
+    获取进程内共享的注册表 (首次调用时创建)
+
+    Args:
+        memory_budget_mb: 内存预算 (MB，可选)，传入时更新预算
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(memory_budget_mb or DEFAULT_MEMORY_BUDGET_MB)
+    if memory_budget_mb is not None and memory_budget_mb != _registry.memory_budget_mb:
+        _registry.set_memory_budget(memory_budget_mb)
+    return _registry
+
+if __name__ == "__main__":
+    registry = get_registry()
+    print(f"可用模型: {', '.join(registry.available_models())} (也可输入模型路径或指纹)")
+    while True:
+        name = input("请输入要加载的模型 (可加 :onnx 后缀，按Enter退出): ").strip()
+        if not name:
+            break
+        name, _, backend = name.partition(":")
+        try:
+            registry.get(name, backend or "torch")
+        except Exception as e:
+            print(f"❌ {e}")
+            continue
+        stats = registry.stats()
+        print(
+            f"📊 loads {stats['loads']}, hits {stats['hits']}, evictions {stats['evictions']}, "
+            f"memory {stats['memory_used_mb']} / {stats['memory_budget_mb']} MB"
+        )
+        for entry in stats['models']:
+            print(f"   {entry['backend']:>5} | {entry['size_mb']:>7} MB | hits {entry['hits']} | {entry['path']}")
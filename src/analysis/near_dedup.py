@@ -0,0 +1,198 @@
+"""
+近似重复文本合并 (SimHash + 分段索引)
+
+弹幕刷屏时大量文本只差几个标点或语气词。这里先按"去掉标点和空白后的核心文本"做精确合并，
+再对较长的文本计算 64 位 SimHash，用分段 (band) 索引找出汉明距离不超过阈值的候选对，
+连通分量即为一个近似重复簇。每个簇只把代表文本送入模型，结果复制给簇内所有成员。
+
+整个过程由 numpy 向量化完成：特征哈希、SimHash 投票、分段排序和候选比较都是整列操作，
+耗时随文本数近似线性增长。
+"""
+import hashlib
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# 64 位 SimHash，默认汉明距离不超过 3 视为近似重复
+SIMHASH_BITS = 64
+DEFAULT_MAX_DISTANCE = 3
+# 核心文本短于该长度时只做精确合并 (短文本的 SimHash 不可靠)
+DEFAULT_MIN_CHARS = 6
+# 同一分段桶内，每条文本最多与排序后相邻的多少条比较
+DEFAULT_WINDOW = 8
+# 每次向量化处理的文本数，控制中间矩阵的内存
+SIMHASH_CHUNK = 20000
+
+# 标点、符号与空白：不参与相似度判断
+NON_CORE_PATTERN = re.compile(r'[\W_]+')
+
+def core_text(text):
+    """去掉标点、符号和空白后的核心文本"""
+    return NON_CORE_PATTERN.sub('', text)
+
+def _popcount(x):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    # numpy < 2.0 没有 bitwise_count，按字节查表
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+@lru_cache(maxsize=1 << 20)
+def feature_hash(feature):
+    """
+    特征的 64 位哈希 (blake2b)
+
+    不能用内置 hash()：它随 PYTHONHASHSEED 在每个进程中变化，同一文本的签名、分组和代表文本都会变。
+    """
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def simhash(texts, ngram=2):
+    """
+    计算 64 位 SimHash
+
+    特征为字符 n-gram (文本短于 n 时用整段文本)，按特征哈希 (见 feature_hash) 的每一位投票，
+    同一文本在任何进程中的签名都相同。
+
+    Args:
+        texts: list of str
+        ngram: int，字符 n-gram 长度
+
+    Returns:
+        np.ndarray，形状 (len(texts),) 的 uint64
+    """
+    shifts = np.arange(SIMHASH_BITS, dtype=np.uint64)
+    signatures = np.zeros(len(texts), dtype=np.uint64)
+    for chunk_start in range(0, len(texts), SIMHASH_CHUNK):
+        chunk = texts[chunk_start:chunk_start + SIMHASH_CHUNK]
+        features = []
+        starts = []
+        for text in chunk:
+            starts.append(len(features))
+            if len(text) <= ngram:
+                features.append(feature_hash(text))
+            else:
+                features.extend(feature_hash(text[i:i + ngram]) for i in range(len(text) - ngram + 1))
+        hashes = np.array(features, dtype=np.uint64)
+        # 每个特征的每一位：1 记 +1，0 记 -1，再按文本求和
+        bits = ((hashes[:, None] >> shifts) & np.uint64(1)).astype(np.int32) * 2 - 1
+        votes = np.add.reduceat(bits, np.array(starts), axis=0)
+        chunk_signatures = ((votes > 0).astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+        signatures[chunk_start:chunk_start + len(chunk)] = chunk_signatures
+    return signatures
+
+def _signature_pairs(signatures, max_distance, window):
+    """
+    分段索引找候选对：汉明距离 ≤ k 的两个签名，分成 k+1 段后至少有一段完全相同
+
+    Returns:
+        (np.ndarray, np.ndarray)：候选对两端的下标
+    """
+    n_bands = max_distance + 1
+    band_bits = SIMHASH_BITS // n_bands
+    mask = np.uint64((1 << band_bits) - 1)
+    left, right = [], []
+    for band in range(n_bands):
+        keys = (signatures >> np.uint64(band * band_bits)) & mask
+        # 先按分段值、再按完整签名排序，相近的签名在桶内相邻
+        order = np.lexsort((signatures, keys))
+        for w in range(1, min(window, len(order) - 1) + 1):
+            a, b = order[w:], order[:-w]
+            close = (keys[a] == keys[b]) & (_popcount(signatures[a] ^ signatures[b]) <= max_distance)
+            left.append(a[close])
+            right.append(b[close])
+    if not left:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+def group_near_duplicates(texts, max_distance=DEFAULT_MAX_DISTANCE, min_chars=DEFAULT_MIN_CHARS, window=DEFAULT_WINDOW):
+    """
+    将近似重复的文本分组
+
+    Args:
+        texts: list of str (应已去掉完全相同的文本)
+        max_distance: int，SimHash 汉明距离阈值 (0~63)，越大合并越激进；为 0 时只合并核心文本相同的文本
+        min_chars: int，核心文本不短于该长度才参与 SimHash 合并
+        window: int，桶内比较窗口
+
+    Returns:
+        (group_ids, representatives)：
+            group_ids 为每条文本所属簇的编号 (np.ndarray)，
+            representatives 为每个簇代表文本的下标 (簇内第一条)
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(texts)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    cores = [core_text(t) for t in texts]
+    left, right = [], []
+
+    # 1. 核心文本完全相同 (只差标点/空白) 的直接合并
+    _, core_codes = np.unique(np.array(cores, dtype=object), return_inverse=True)
+    order = np.argsort(core_codes, kind='stable')
+    same = core_codes[order[1:]] == core_codes[order[:-1]]
+    nonempty = np.array([len(cores[i]) > 0 for i in order[1:]], dtype=bool)
+    left.append(order[1:][same & nonempty])
+    right.append(order[:-1][same & nonempty])
+
+    # 2. 较长的文本按 SimHash 近似合并
+    if max_distance > 0:
+        long_idx = np.array([i for i, c in enumerate(cores) if len(c) >= min_chars], dtype=np.int64)
+        if len(long_idx) > 1:
+            signatures = simhash([cores[i] for i in long_idx])
+            a, b = _signature_pairs(signatures, max_distance, window)
+            left.append(long_idx[a])
+            right.append(long_idx[b])
+
+    left, right = np.concatenate(left), np.concatenate(right)
+    graph = coo_matrix((np.ones(len(left), dtype=np.int8), (left, right)), shape=(n, n))
+    _, group_ids = connected_components(graph, directed=False)
+    # 每个簇取第一次出现的文本作代表
+    _, representatives = np.unique(group_ids, return_index=True)
+    return group_ids, representatives
+
+def predict_proba_near_dedup(texts, predict_fn, max_distance=DEFAULT_MAX_DISTANCE, min_chars=DEFAULT_MIN_CHARS, stats=None):
+    """
+    近似去重地执行推理：每个簇只推理代表文本，结果复制给簇内所有成员
+
+    Args:
+        texts: list of str，待预测文本 (应已去掉完全相同的文本)
+        predict_fn: 函数，接受 list of str 返回 (n, num_labels) 概率矩阵
+        max_distance / min_chars: 同 group_near_duplicates
+        stats: dict (可选)，传入时累加 {texts, clusters}
+
+    Returns:
+        np.ndarray，形状 (len(texts), num_labels) 的概率矩阵，行顺序与输入一致
+    """
+    texts = list(texts)
+    start = time.perf_counter()
+    group_ids, representatives = group_near_duplicates(texts, max_distance, min_chars)
+    elapsed = time.perf_counter() - start
+    saved = len(texts) - len(representatives)
+    print(
+        f"🧬 Near-duplicate grouping: {len(texts)} texts -> {len(representatives)} clusters, "
+        f"{saved} forward passes saved ({saved / max(1, len(texts)):.1%}) in {elapsed:.2f}s"
+    )
+    if stats is not None:
+        stats['texts'] = stats.get('texts', 0) + len(texts)
+        stats['clusters'] = stats.get('clusters', 0) + len(representatives)
+
+    representative_probs = predict_fn([texts[i] for i in representatives])
+    # group_ids 与 np.unique 的顺序一致，可直接按簇编号取代表结果
+    return np.asarray(representative_probs)[group_ids]
+
+def wrap_with_near_dedup(predict_fn, model_key, max_distance=DEFAULT_MAX_DISTANCE, min_chars=DEFAULT_MIN_CHARS):
+    """
+    为流水线的 predict_fn 套上近似去重
+
+    Returns:
+        (predict_fn, cache_key)：cache_key 带上阈值，近似结果不会混入逐条推理的缓存
+    """
+    from functools import partial
+
+    wrapped = partial(predict_proba_near_dedup, predict_fn=predict_fn, max_distance=max_distance, min_chars=min_chars)
+    return wrapped, f"{model_key}-simhash{max_distance}"
@@ -0,0 +1,291 @@
+"""
+ONNX Runtime CPU 推理后端
+
+首次使用时把情感模型导出为 ONNX 并做动态 int8 量化，产物缓存在
+trained_models_onnx/ 下；之后的进程直接加载量化模型，无需再加载 PyTorch 权重。
+"""
+import sys
+import json
+import re
+import time
+import hashlib
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis.inference import get_model_fingerprint, predict_proba
+from src.analysis.model import resolve_model_path
+
+ONNX_CACHE_DIR = PROJECT_ROOT / "trained_models_onnx"
+
+ONNX_INPUT_NAMES = ['input_ids', 'attention_mask', 'token_type_ids']
+ONNX_OPSET = 17
+
+# {模型 ID: 快照提交}，同一进程内只解析一次
+_hub_revisions = {}
+
+def _hub_revision(model_id):
+    """
+    Hugging Face 模型的快照提交：先查本地缓存 (不联网)，本地没有时才向 Hub 查询；同一进程内只解析一次
+
+    本地缓存的版本随 from_pretrained 等联网加载刷新，Hub 上的更新在那之后生效。
+
+    Returns:
+        str；离线且本地没有缓存时返回 None
+    """
+    model_id = str(model_id)
+    if model_id not in _hub_revisions:
+        try:
+            from huggingface_hub import hf_hub_download
+        except ImportError:
+            return None
+        revision = None
+        for local_files_only in (True, False):
+            try:
+                config_path = Path(hf_hub_download(model_id, "config.json", local_files_only=local_files_only))
+            except Exception:
+                continue
+            # 缓存布局为 .../snapshots/<commit>/config.json
+            revision = config_path.parent.name
+            break
+        if revision is None:
+            return None
+        _hub_revisions[model_id] = revision
+    return _hub_revisions[model_id]
+
+def _source_signature(model_path):
+    """
+    计算模型来源的标识：本地目录用绝对路径 + 最新修改时间，HF 模型用模型 ID + 快照提交
+    (Hub 上的模型更新后签名随之变化，派生的产物失效重建)
+
+    Returns:
+        (str, str)：(产物目录名, 来源签名)
+    """
+    path = Path(model_path)
+    if path.exists():
+        path = path.resolve()
+        mtime = max((f.stat().st_mtime for f in path.rglob('*') if f.is_file()), default=0)
+        digest = hashlib.sha1(str(path).encode()).hexdigest()[:8]
+        return f"{path.name}-{digest}", f"{path}@{mtime:.0f}"
+    return re.sub(r'[^\w.-]+', '--', str(model_path)), f"{model_path}@{_hub_revision(model_path) or 'unknown'}"
+
+class OnnxSentimentModel:
+    """
+    ONNX Runtime 会话的包装，调用方式与 Hugging Face 模型一致：model(**inputs).logits
+    """
+
+    device = torch.device("cpu")
+
+    def __init__(self, onnx_path, config, fingerprint, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("使用 ONNX 后端需要安装 onnxruntime: pip install onnxruntime") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.onnx_path = Path(onnx_path)
+        self.config = config
+        self.fingerprint = fingerprint
+
+    def __call__(self, **inputs):
+        feed = {
+            name: (value.cpu().numpy() if torch.is_tensor(value) else np.asarray(value)).astype(np.int64)
+            for name, value in inputs.items()
+            if name in self.input_names
+        }
+        logits = self.session.run(['logits'], feed)[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+class _LogitsOnly(torch.nn.Module):
+    """导出用：按位置参数调用，只输出 logits，避免 ModelOutput 结构进入 ONNX 图"""
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *args):
+        return self.model(**dict(zip(self.input_names, args))).logits
+
+def export_onnx_model(model, tokenizer, output_dir, quantize=True):
+    """
+    将 PyTorch 模型导出为 ONNX，并可选进行动态 int8 量化
+
+    Args:
+        model: Hugging Face 情感分类模型
+        tokenizer: 分词器 (一并保存，之后可脱离 PyTorch 权重加载)
+        output_dir: 产物目录
+        quantize: bool，是否做动态 int8 量化
+
+    Returns:
+        Path，最终使用的 ONNX 文件路径
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    fp32_path = output_dir / "model.onnx"
+
+    model = model.to("cpu").eval()
+    dummy = tokenizer(["导出示例", "这是一条用于导出的示例弹幕"], return_tensors="pt", padding=True)
+    # 只声明分词器实际给出的输入 (RoBERTa、DistilBERT 等模型没有 token_type_ids)
+    input_names = [name for name in ONNX_INPUT_NAMES if name in dummy]
+    example = tuple(dummy[name] for name in input_names)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch'}
+
+    print(f"📦 Exporting ONNX model to {fp32_path}...")
+    with torch.no_grad():
+        # 包装本身也设为 eval：导出结束时会恢复包装原来的模式，连带把传入的模型切回训练模式
+        torch.onnx.export(
+            _LogitsOnly(model, input_names).eval(),
+            example,
+            str(fp32_path),
+            input_names=input_names,
+            output_names=['logits'],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        )
+
+    onnx_path = fp32_path
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        onnx_path = output_dir / "model.int8.onnx"
+        print(f"🗜️ Quantizing ONNX model (dynamic int8) to {onnx_path}...")
+        quantize_dynamic(str(fp32_path), str(onnx_path), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    return onnx_path
+
+def load_onnx_model(model_path=None, model=None, tokenizer=None, quantize=True, num_threads=None):
+    """
+    加载 ONNX 后端模型；缓存不存在或来源已更新时自动导出
+
+    Args:
+        model_path: 原始模型路径或 Hugging Face ID (默认同 run_prediction_pipeline)
+        model: 已加载的 PyTorch 模型 (可选，需要导出时直接使用，省去重复加载)
+        tokenizer: 已加载的分词器 (可选)
+        quantize: bool，是否使用 int8 量化模型
+        num_threads: int，ONNX Runtime 线程数 (默认由运行时决定)
+
+    Returns:
+        (OnnxSentimentModel, tokenizer)
+    """
+    from transformers import AutoConfig, AutoTokenizer
+
+    if model is not None and model_path is None:
+        model_path = getattr(model.config, '_name_or_path', None) or None
+    model_path = resolve_model_path(model_path)
+    dir_name, signature = _source_signature(model_path)
+    output_dir = ONNX_CACHE_DIR / dir_name
+    onnx_name = "model.int8.onnx" if quantize else "model.onnx"
+    meta_path = output_dir / "meta.json"
+
+    meta = None
+    if meta_path.exists() and (output_dir / onnx_name).exists():
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        if meta.get('source') != signature:
+            print(f"♻️ Source model changed, re-exporting ONNX model: {model_path}")
+            meta = None
+
+    if meta is None:
+        # 导出需要原始的 PyTorch 模型 (冷启动缓存中的追踪图不能再导出)
+        if model is None or tokenizer is None or not isinstance(model, torch.nn.Module):
+            from transformers import AutoModelForSequenceClassification
+            print(f"🚀 Loading PyTorch model for ONNX export from: {model_path}")
+            tokenizer = AutoTokenizer.from_pretrained(model_path)
+            model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        export_onnx_model(model, tokenizer, output_dir, quantize=quantize)
+        meta = {
+            'source': signature,
+            'fingerprint': get_model_fingerprint(model),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    print(f"🚀 Loading ONNX model from: {output_dir / onnx_name}")
+    config = AutoConfig.from_pretrained(output_dir)
+    suffix = "onnx-int8" if quantize else "onnx"
+    onnx_model = OnnxSentimentModel(
+        output_dir / onnx_name,
+        config,
+        fingerprint=f"{meta['fingerprint']}-{suffix}",
+        num_threads=num_threads,
+    )
+    # 记录原始模型来源，便于其他进程 (如分片推理) 重新加载同一产物
+    onnx_model.source_path = str(model_path)
+    if tokenizer is None:
+        tokenizer = AutoTokenizer.from_pretrained(output_dir)
+    return onnx_model, tokenizer
+
+def compare_with_pytorch(texts, torch_model, onnx_model, tokenizer, **kwargs):
+    """
+    对比 ONNX 后端与 PyTorch 的标签一致率和吞吐量
+
+    Args:
+        texts: list of str，验证文本
+        torch_model: PyTorch 模型
+        onnx_model: OnnxSentimentModel
+        tokenizer: 分词器
+        **kwargs: 透传给 predict_proba 的参数
+
+    Returns:
+        dict，{agreement, torch_texts_per_sec, onnx_texts_per_sec, speedup}
+    """
+    torch_model = torch_model.to("cpu").eval()
+
+    start = time.perf_counter()
+    torch_labels = predict_proba(texts, torch_model, tokenizer, show_progress=False, **kwargs).argmax(axis=-1)
+    torch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    onnx_labels = predict_proba(texts, onnx_model, tokenizer, show_progress=False, **kwargs).argmax(axis=-1)
+    onnx_time = time.perf_counter() - start
+
+    report = {
+        'agreement': float((torch_labels == onnx_labels).mean()) if len(texts) else 1.0,
+        'torch_texts_per_sec': len(texts) / torch_time,
+        'onnx_texts_per_sec': len(texts) / onnx_time,
+        'speedup': torch_time / onnx_time,
+    }
+    print(f"🤝 Label agreement with PyTorch: {report['agreement']:.2%} ({len(texts)} texts)")
+    print(f"⚡ PyTorch: {report['torch_texts_per_sec']:.1f} texts/s | ONNX: {report['onnx_texts_per_sec']:.1f} texts/s | speedup x{report['speedup']:.2f}")
+    return report
+
+if __name__ == "__main__":
+    import pandas as pd
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    raw_dir = PROJECT_ROOT / "data" / "raw"
+    texts = []
+    for csv_path in sorted(raw_dir.glob("*.csv")):
+        df = pd.read_csv(csv_path, encoding='utf-8-sig', on_bad_lines='skip')
+        if 'content' in df.columns:
+            texts.extend(df['content'].dropna().astype(str).tolist())
+    if not texts:
+        print(f"❌ {raw_dir} 中没有可用于验证的数据，请先运行爬虫。")
+        raise SystemExit(1)
+    texts = pd.Series(texts).sample(n=min(2000, len(texts)), random_state=42).tolist()
+
+    model_path = resolve_model_path()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    torch_model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    onnx_model, _ = load_onnx_model(model_path, model=torch_model, tokenizer=tokenizer)
+    compare_with_pytorch(texts, torch_model, onnx_model, tokenizer)
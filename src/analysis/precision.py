@@ -0,0 +1,178 @@
+"""
+低精度 (bfloat16) 推理
+
+支持 AVX512-BF16 / AMX 的 Xeon、EPYC 以及带 BF16 扩展的 ARM CPU 上，bf16 矩阵乘法比 fp32 快得多。
+这里用 torch.autocast 包装模型：矩阵乘法与线性层以 bf16 计算，LayerNorm、softmax 等
+对精度敏感的算子仍为 fp32，模型权重本身不变 (也适用于冷启动缓存中的追踪图)。
+CPU 不支持时保持 fp32 并给出提示。
+"""
+import sys
+import time
+import platform
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.analysis.inference import predict_proba, get_model_fingerprint
+
+PRECISIONS = ("fp32", "bf16")
+# x86 上表示原生 bf16 计算的 CPU 特性
+BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+# 与 fp32 对比时的验证样本大小
+VALIDATION_SAMPLE = 256
+
+def cpu_supports_bf16():
+    """
+    检测 CPU 是否原生支持 bf16 计算
+
+    Returns:
+        (bool, str)：是否支持，以及判断依据
+    """
+    machine = platform.machine().lower()
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        flags = None
+
+    if flags is not None:
+        if machine in ("x86_64", "amd64"):
+            found = [flag for flag in BF16_CPU_FLAGS if flag in flags]
+            if found:
+                return True, f"CPU flags: {', '.join(found)}"
+            return False, "CPU lacks avx512_bf16 / amx_bf16"
+        if machine in ("aarch64", "arm64"):
+            if "bf16" in flags:
+                return True, "CPU feature: bf16"
+            return False, "CPU lacks the ARM bf16 extension"
+    if sys.platform == "darwin" and machine == "arm64":
+        import subprocess
+        result = subprocess.run(["sysctl", "-n", "hw.optional.arm.FEAT_BF16"], capture_output=True, text=True)
+        if result.stdout.strip() == "1":
+            return True, "FEAT_BF16"
+        return False, "CPU lacks FEAT_BF16"
+    return False, f"cannot detect bf16 support on {platform.system()} {machine}"
+
+class AutocastModel:
+    """
+    在 torch.autocast 下执行前向的模型包装，其余属性透传给原模型
+
+    指纹带上精度后缀，bf16 的结果不会混入 fp32 的预测缓存。
+    """
+
+    def __init__(self, model, dtype=torch.bfloat16):
+        self.__dict__['model'] = model
+        self.__dict__['dtype'] = dtype
+        self.__dict__['fingerprint'] = f"{get_model_fingerprint(model)}-{_dtype_name(dtype)}"
+
+    def __call__(self, **inputs):
+        device = getattr(self.model, 'device', torch.device("cpu"))
+        with torch.autocast(device_type=torch.device(device).type, dtype=self.dtype):
+            return self.model(**inputs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __setattr__(self, name, value):
+        # 如 capture_pooled_output 设置的 pooled_output_sink，需要落到原模型上
+        setattr(self.model, name, value)
+
+    def to(self, device):
+        self.model.to(device)
+        return self
+
+    def eval(self):
+        self.model.eval()
+        return self
+
+def _dtype_name(dtype):
+    return {torch.bfloat16: "bf16", torch.float16: "fp16"}.get(dtype, str(dtype))
+
+def compare_precision(model, reduced_model, tokenizer, texts, **predict_kwargs):
+    """
+    在验证样本上对比 fp32 与低精度推理的速度和标签一致率
+
+    Returns:
+        dict，{texts, fp32_seconds, reduced_seconds, speedup, agreement, max_prob_diff}
+    """
+    texts = list(texts)
+    # 各跑一小批预热，避免首次调用的初始化计入耗时
+    predict_proba(texts[:8], model, tokenizer, show_progress=False, **predict_kwargs)
+    predict_proba(texts[:8], reduced_model, tokenizer, show_progress=False, **predict_kwargs)
+
+    start = time.perf_counter()
+    fp32_probs = predict_proba(texts, model, tokenizer, show_progress=False, **predict_kwargs)
+    fp32_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    reduced_probs = predict_proba(texts, reduced_model, tokenizer, show_progress=False, **predict_kwargs)
+    reduced_seconds = time.perf_counter() - start
+
+    return {
+        'texts': len(texts),
+        'fp32_seconds': round(fp32_seconds, 3),
+        'reduced_seconds': round(reduced_seconds, 3),
+        'speedup': round(fp32_seconds / max(reduced_seconds, 1e-9), 2),
+        'agreement': float(np.mean(fp32_probs.argmax(axis=-1) == reduced_probs.argmax(axis=-1))) if len(texts) else 1.0,
+        'max_prob_diff': float(np.abs(fp32_probs - reduced_probs).max()) if len(texts) else 0.0,
+    }
+
+def apply_precision(model, tokenizer, precision="fp32", validation_texts=None, **predict_kwargs):
+    """
+    按指定精度包装模型；bf16 不可用时回退到 fp32
+
+    Args:
+        model: 情感分类模型 (PyTorch 或冷启动缓存中的追踪图)
+        tokenizer: 分词器
+        precision: "fp32" 或 "bf16"
+        validation_texts: list of str (可选)，启用 bf16 时在其中抽样与 fp32 对比并打印报告
+            (默认使用合成语料)
+        **predict_kwargs: 对比时传给 predict_proba 的参数 (如 max_length)
+
+    Returns:
+        (model, report)：report 为 compare_precision 的结果，未启用低精度时为 None
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"未知精度: {precision}，可选 {PRECISIONS}")
+    if precision == "fp32":
+        return model, None
+
+    device = torch.device(getattr(model, 'device', torch.device("cpu")))
+    if device.type == "cpu":
+        supported, reason = cpu_supports_bf16()
+    else:
+        supported = torch.cuda.is_bf16_supported()
+        reason = "CUDA bf16 support" if supported else "GPU lacks bf16 support"
+    if not supported:
+        print(f"⚠️ bf16 is not supported here ({reason}), running in fp32")
+        return model, None
+
+    reduced_model = AutocastModel(model, torch.bfloat16)
+    if validation_texts is None:
+        from src.analysis.benchmark import make_synthetic_corpus
+        validation_texts = make_synthetic_corpus("danmaku", VALIDATION_SAMPLE, seed=7)
+    validation_texts = list(dict.fromkeys(validation_texts))
+    if len(validation_texts) > VALIDATION_SAMPLE:
+        rng = np.random.default_rng(0)
+        picked = rng.choice(len(validation_texts), VALIDATION_SAMPLE, replace=False)
+        validation_texts = [validation_texts[i] for i in sorted(picked)]
+
+    report = compare_precision(model, reduced_model, tokenizer, validation_texts, **predict_kwargs)
+    print(
+        f"🧪 bf16 ({reason}): speedup {report['speedup']}x over fp32 on {report['texts']} validation texts "
+        f"({report['fp32_seconds']}s -> {report['reduced_seconds']}s), "
+        f"label agreement {report['agreement']:.2%}, max prob diff {report['max_prob_diff']:.4f}"
+    )
+    return reduced_model, report
+
+if __name__ == "__main__":
+    from src.analysis.model import get_model_and_tokenizer
+
+    supported, reason = cpu_supports_bf16()
+    print(f"💻 bf16 support: {'yes' if supported else 'no'} ({reason})")
+    model, tokenizer = get_model_and_tokenizer()
+    apply_precision(model, tokenizer, "bf16")
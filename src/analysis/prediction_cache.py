@@ -0,0 +1,145 @@
+"""
+持久化预测缓存
+
+以 (模型指纹, 文本哈希) 为键，把每条文本的类别概率 (float16) 存进本地 SQLite，
+重复分析同一视频或相似视频时直接命中缓存，无需再跑模型。
+超过容量上限时按最近访问时间淘汰最旧的条目。
+"""
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_CACHE_PATH = PROJECT_ROOT / "data" / "cache" / "predictions.sqlite"
+# 缓存条目上限 (每条约 100 字节)，超过后淘汰最久未访问的条目
+DEFAULT_MAX_ENTRIES = 2_000_000
+
+# SQLite 单条语句的参数个数有限，批量查询时分段
+_QUERY_CHUNK = 500
+
+def hash_text(text):
+    """计算文本的 16 字节哈希"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+class PredictionCache:
+    """
+    基于 SQLite 的预测结果缓存
+
+    用法：
+        with PredictionCache() as cache:
+            hits = cache.get_many(model_key, hashes)
+            cache.put_many(model_key, new_hashes, new_probs)
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path) if path is not None else DEFAULT_CACHE_PATH
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS predictions (
+                model_key TEXT NOT NULL,
+                text_hash BLOB NOT NULL,
+                probs BLOB NOT NULL,
+                last_access INTEGER NOT NULL,
+                PRIMARY KEY (model_key, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON predictions(last_access)")
+        self.conn.commit()
+        # 行数的上界估计：打开时计数一次，之后按写入条数累加 (覆盖写入也计入)，
+        # 只有估计超过上限时才重新精确计数，避免每次写入都全表扫描
+        self._row_estimate = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def get_many(self, model_key, hashes):
+        """
+        批量查询缓存，并刷新命中条目的访问时间
+
+        Args:
+            model_key: str，模型指纹
+            hashes: list of bytes，文本哈希
+
+        Returns:
+            dict，{text_hash: np.ndarray(float32)}
+        """
+        hits = {}
+        for start in range(0, len(hashes), _QUERY_CHUNK):
+            chunk = hashes[start:start + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT text_hash, probs FROM predictions WHERE model_key = ? AND text_hash IN ({placeholders})",
+                [model_key, *chunk],
+            ).fetchall()
+            for text_hash, blob in rows:
+                hits[bytes(text_hash)] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+        if hits:
+            now = int(time.time())
+            self.conn.executemany(
+                "UPDATE predictions SET last_access = ? WHERE model_key = ? AND text_hash = ?",
+                [(now, model_key, h) for h in hits],
+            )
+            self.conn.commit()
+        return hits
+
+    def put_many(self, model_key, hashes, probs):
+        """
+        批量写入缓存，写入后检查容量并淘汰
+
+        Args:
+            model_key: str，模型指纹
+            hashes: list of bytes，文本哈希
+            probs: np.ndarray，形状 (len(hashes), num_labels) 的概率矩阵
+        """
+        now = int(time.time())
+        probs = np.asarray(probs, dtype=np.float16)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO predictions (model_key, text_hash, probs, last_access) VALUES (?, ?, ?, ?)",
+            [(model_key, h, p.tobytes(), now) for h, p in zip(hashes, probs)],
+        )
+        self.conn.commit()
+        if self._row_estimate is not None:
+            self._row_estimate += len(probs)
+        self.evict()
+
+    def evict(self):
+        """超过容量上限时，删除最久未访问的条目，腾出 10% 余量"""
+        if self._row_estimate is not None and self._row_estimate <= self.max_entries:
+            return 0
+        count = len(self)
+        self._row_estimate = count
+        if count <= self.max_entries:
+            return 0
+        to_delete = count - int(self.max_entries * 0.9)
+        self.conn.execute(
+            """
+            DELETE FROM predictions WHERE (model_key, text_hash) IN (
+                SELECT model_key, text_hash FROM predictions ORDER BY last_access LIMIT ?
+            )
+            """,
+            (to_delete,),
+        )
+        self.conn.commit()
+        self._row_estimate = count - to_delete
+        return to_delete
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
@@ -0,0 +1,281 @@
+"""
+快速预览：先分析分层抽样的一小部分数据，立刻给出带抽样误差的情感分布与时间趋势，
+再逐轮扩大样本，直到覆盖全量数据
+
+分层 = 发布时间分箱 × 视频进度分箱 (弹幕)，各层按行数等比例抽样。
+PreviewEstimator.order 给出的行顺序保证任意前缀都近似是一个等比例分层样本：
+逐轮扩大样本时只需推理新增的行，最后一轮就是全量结果 (误差为 0)。
+
+误差按分层抽样估计 (含有限总体校正)，各时间段的趋势按该时间段内的各层事后加权，
+95% 置信区间 = 估计值 ± 1.96 × 标准误。
+"""
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.utils import get_emotion_label
+from src.utils.time_series import SENTIMENT_WEIGHTS
+
+# 第一轮的抽样行数，之后每轮扩大 REFINE_GROWTH 倍
+PREVIEW_SAMPLE_SIZE = 2000
+REFINE_GROWTH = 4
+# 分层：发布时间、视频进度各等宽分为若干箱 (缺失值单独一箱)
+TIME_STRATA = 8
+VIDEO_STRATA = 8
+# 预览图的时间粒度，与 app.py 的默认值一致
+DEFAULT_FREQ = 'D'
+DEFAULT_VIDEO_BIN_SIZE = 30.0
+Z_SCORE = 1.96
+# 时间列的查找顺序，与 app.py 一致
+TIME_COLUMNS = ('time', 'date', 'real_time')
+
+def _equal_width_codes(values, n_bins):
+    """把数值等宽分为 n_bins 箱，NaN 单独编为 n_bins"""
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.full(len(values), n_bins, dtype=np.int64)
+    valid = ~np.isnan(values)
+    if valid.any():
+        low, high = values[valid].min(), values[valid].max()
+        if high > low:
+            codes[valid] = np.minimum(((values[valid] - low) / (high - low) * n_bins).astype(np.int64), n_bins - 1)
+        else:
+            codes[valid] = 0
+    return codes
+
+def _time_bin_starts(times, freq):
+    """按 freq 取各行所在时间段的起点 (固定长度的频率用 floor，周/月等按日历周期)"""
+    try:
+        return times.dt.floor(freq)
+    except ValueError:
+        return times.dt.to_period(freq).dt.start_time
+
+def _grouped_stratified_mean(groups, strata, positions, values):
+    """
+    分组的分层均值估计：每组内按各层的总体行数对样本层均值加权
+
+    Args:
+        groups: np.ndarray (N,)，全量各行的组编号 (非负整数)
+        strata: np.ndarray (N,)，全量各行的层编号 (非负整数)
+        positions: np.ndarray (n,)，已抽样的行号
+        values: np.ndarray (n, k)，已抽样各行的取值
+
+    Returns:
+        (mean, se, sampled)：(G, k) 的估计值与标准误、(G,) 各组的样本数；没有样本的组为 NaN
+    """
+    n_strata = int(strata.max()) + 1
+    n_groups = int(groups.max()) + 1
+    n_cells = n_groups * n_strata
+    cells = groups * n_strata + strata
+    population = np.bincount(cells, minlength=n_cells).astype(np.float64)
+
+    sample_cells = cells[positions]
+    sampled = np.bincount(sample_cells, minlength=n_cells).astype(np.float64)
+    sums = np.stack([np.bincount(sample_cells, weights=values[:, j], minlength=n_cells) for j in range(values.shape[1])], axis=1)
+    squares = np.stack([np.bincount(sample_cells, weights=values[:, j] ** 2, minlength=n_cells) for j in range(values.shape[1])], axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cell_mean = sums / sampled[:, None]
+        cell_var = (squares - sampled[:, None] * cell_mean ** 2) / (sampled[:, None] - 1)
+        # 只抽到一行的层无法估计层内方差，用该组的合并方差代替
+        group_sampled = np.bincount(groups[positions], minlength=n_groups).astype(np.float64)
+        group_sums = sums.reshape(n_groups, n_strata, -1).sum(axis=1)
+        group_squares = squares.reshape(n_groups, n_strata, -1).sum(axis=1)
+        group_mean = group_sums / group_sampled[:, None]
+        group_var = (group_squares - group_sampled[:, None] * group_mean ** 2) / np.maximum(group_sampled[:, None] - 1, 1)
+        cell_var = np.where(sampled[:, None] >= 2, cell_var, np.repeat(group_var, n_strata, axis=0))
+        cell_var = np.maximum(np.nan_to_num(cell_var), 0.0)
+
+        # 事后分层：只在抽到样本的层之间按总体行数加权
+        covered = np.where(sampled > 0, population, 0.0).reshape(n_groups, n_strata)
+        weights = (covered / covered.sum(axis=1, keepdims=True)).reshape(-1)
+        finite_correction = np.where(sampled > 0, 1 - sampled / np.maximum(population, 1), 0.0)
+        mean_terms = np.where(sampled[:, None] > 0, weights[:, None] * cell_mean, 0.0)
+        var_terms = np.where(
+            sampled[:, None] > 0,
+            weights[:, None] ** 2 * finite_correction[:, None] * cell_var / np.maximum(sampled[:, None], 1),
+            0.0,
+        )
+    mean = mean_terms.reshape(n_groups, n_strata, -1).sum(axis=1)
+    se = np.sqrt(var_terms.reshape(n_groups, n_strata, -1).sum(axis=1))
+    mean[group_sampled == 0] = np.nan
+    se[group_sampled == 0] = np.nan
+    return mean, se, group_sampled
+
+class PreviewEstimator:
+    """
+    分层抽样预览的估计器：对全量数据分层，给出抽样顺序，并由已标注的样本估计分布与趋势
+
+    Example:
+        estimator = PreviewEstimator(df)
+        order = estimator.order()
+        sample = order[:2000]
+        estimate = estimator.estimate(sample, labels_of_sample)
+        print_preview_report(estimate)
+    """
+
+    def __init__(self, df, time_column=None, freq=DEFAULT_FREQ, video_bin_size=DEFAULT_VIDEO_BIN_SIZE, weights=None):
+        """
+        Args:
+            df: 清洗后的 DataFrame (见 run_prediction.clean_dataframe)
+            time_column: 发布时间列名 (默认按 TIME_COLUMNS 查找，没有时不分时间层、不估计时间趋势)
+            freq: 时间趋势的聚合粒度 (同 aggregate_by_time)
+            video_bin_size: 视频进度趋势的分箱大小 (秒，同 aggregate_by_numeric)
+            weights: 情感权重映射 (默认 SENTIMENT_WEIGHTS)
+        """
+        self.total = len(df)
+        self.weights = weights or SENTIMENT_WEIGHTS
+        self.time_column = time_column or next((c for c in TIME_COLUMNS if c in df.columns), None)
+        self.freq = freq
+        self.video_bin_size = video_bin_size
+
+        times = None
+        time_codes = np.zeros(self.total, dtype=np.int64)
+        if self.time_column is not None:
+            times = pd.to_datetime(df[self.time_column], errors='coerce').reset_index(drop=True)
+            seconds = (times - times.min()).dt.total_seconds().to_numpy(dtype=np.float64, na_value=np.nan)
+            time_codes = _equal_width_codes(seconds, TIME_STRATA)
+        video = None
+        video_codes = np.zeros(self.total, dtype=np.int64)
+        if 'video_time' in df.columns:
+            video = pd.to_numeric(df['video_time'], errors='coerce').reset_index(drop=True)
+            video_codes = _equal_width_codes(video.to_numpy(dtype=np.float64), VIDEO_STRATA)
+        self.strata = pd.factorize(time_codes * (VIDEO_STRATA + 1) + video_codes)[0]
+
+        # 两条趋势线的分组：缺失值的行放在最后一组，估计后丢弃
+        self._timeline_groups = self._timeline_labels = None
+        if times is not None and times.notna().any():
+            self._timeline_groups, self._timeline_labels = self._factorize_bins(_time_bin_starts(times, freq))
+        self._progress_groups = self._progress_labels = None
+        if video is not None and video.notna().any():
+            self._progress_groups, self._progress_labels = self._factorize_bins((video // video_bin_size) * video_bin_size)
+
+    @staticmethod
+    def _factorize_bins(bin_starts):
+        codes, labels = pd.factorize(bin_starts, sort=True)
+        codes = np.where(codes < 0, len(labels), codes)
+        return codes, labels
+
+    def order(self, random_state=42):
+        """
+        抽样顺序：各层内随机排列后按层内进度交错，任意前缀都近似是等比例分层样本
+
+        Returns:
+            np.ndarray，全量行号的一个排列
+        """
+        rng = np.random.default_rng(random_state)
+        if self.total == 0:
+            return np.arange(0)
+        shuffled = rng.permutation(self.total)
+        by_stratum = shuffled[np.argsort(self.strata[shuffled], kind='stable')]
+        stratum_sizes = np.bincount(self.strata)
+        stratum_starts = np.concatenate([[0], np.cumsum(stratum_sizes)[:-1]])
+        rank = np.empty(self.total, dtype=np.float64)
+        rank[by_stratum] = np.arange(self.total) - stratum_starts[self.strata[by_stratum]]
+        # 第 r 个被抽中的位置在 (r, r + 1) / 层大小 之间随机，使各层的进度均匀交错
+        keys = (rank + rng.random(self.total)) / stratum_sizes[self.strata]
+        return np.argsort(keys, kind='stable')
+
+    def estimate(self, positions, labels, num_labels=None):
+        """
+        由已标注的样本估计全量的情感分布、情感指数与时间趋势
+
+        Args:
+            positions: 已抽样的行号 (通常是 order() 的前缀)
+            labels: 与 positions 对应的预测标签编号
+            num_labels: 类别数 (默认为情感权重的类别数)
+
+        Returns:
+            dict：
+                sampled / total / fraction：样本数、总行数、抽样比例
+                sentiment_index：(估计值, 下界, 上界)
+                distribution：DataFrame [label, emotion, proportion, lower, upper, count]
+                timeline / progress：按发布时间 / 视频进度的趋势 DataFrame
+                    [time, sentiment_index, lower, upper, count, sampled]，对应列不存在时为 None
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        labels = np.asarray(labels, dtype=np.int64)
+        num_labels = num_labels or max(len(self.weights), int(labels.max()) + 1 if len(labels) else 0)
+        weight_vector = np.array([self.weights.get(code, 0) for code in range(num_labels)], dtype=np.float64)
+        scores = weight_vector[labels][:, None]
+        whole = np.zeros(self.total, dtype=np.int64)
+
+        one_hot = np.eye(num_labels)[labels]
+        proportion, proportion_se, _ = _grouped_stratified_mean(whole, self.strata, positions, one_hot)
+        proportion, proportion_se = proportion[0], proportion_se[0]
+        index, index_se, _ = _grouped_stratified_mean(whole, self.strata, positions, scores)
+
+        distribution = pd.DataFrame({
+            'label': np.arange(num_labels),
+            'emotion': [get_emotion_label(code, use_zh=True) for code in range(num_labels)],
+            'proportion': proportion.round(4),
+            'lower': np.clip(proportion - Z_SCORE * proportion_se, 0, 1).round(4),
+            'upper': np.clip(proportion + Z_SCORE * proportion_se, 0, 1).round(4),
+            'count': np.round(proportion * self.total).astype(np.int64),
+        })
+        return {
+            'sampled': len(positions),
+            'total': self.total,
+            'fraction': len(positions) / max(1, self.total),
+            'sentiment_index': self._interval(index[0, 0], index_se[0, 0]),
+            'distribution': distribution,
+            'timeline': self._trend(self._timeline_groups, self._timeline_labels, positions, scores),
+            'progress': self._trend(self._progress_groups, self._progress_labels, positions, scores),
+        }
+
+    @staticmethod
+    def _interval(value, se):
+        lower = max(-3.0, min(3.0, value - Z_SCORE * se))
+        upper = max(-3.0, min(3.0, value + Z_SCORE * se))
+        return (round(float(value), 4), round(float(lower), 4), round(float(upper), 4))
+
+    def _trend(self, groups, bin_labels, positions, scores):
+        if groups is None:
+            return None
+        mean, se, sampled = _grouped_stratified_mean(groups, self.strata, positions, scores)
+        population = np.bincount(groups, minlength=len(sampled))
+        results = []
+        for code, label in enumerate(bin_labels):
+            if sampled[code] == 0:
+                continue
+            sentiment_index, lower, upper = self._interval(mean[code, 0], se[code, 0])
+            results.append({
+                'time': label,
+                'sentiment_index': sentiment_index,
+                'lower': lower,
+                'upper': upper,
+                'count': int(population[code]),
+                'sampled': int(sampled[code]),
+            })
+        return pd.DataFrame(results, columns=['time', 'sentiment_index', 'lower', 'upper', 'count', 'sampled'])
+
+def refinement_sizes(total, preview_size=PREVIEW_SAMPLE_SIZE, growth=REFINE_GROWTH):
+    """
+    各轮累计的样本数：preview_size、再逐轮扩大 growth 倍，最后一轮为全量
+
+    Example:
+        >>> refinement_sizes(50000)
+        [2000, 8000, 32000, 50000]
+    """
+    sizes = []
+    size = max(1, preview_size)
+    while size < total:
+        sizes.append(size)
+        size *= growth
+    sizes.append(total)
+    return sizes
+
+def print_preview_report(estimate):
+    """打印预览估计：样本比例、情感指数与各情感占比的 95% 置信区间"""
+    index, lower, upper = estimate['sentiment_index']
+    print(
+        f"⚡ Preview from {estimate['sampled']} of {estimate['total']} rows ({estimate['fraction']:.1%}): "
+        f"sentiment index {index:.2f} [{lower:.2f}, {upper:.2f}]"
+    )
+    for _, row in estimate['distribution'].iterrows():
+        if row['upper'] > 0:
+            print(f"   {row['emotion']:<6} {row['proportion']:>7.1%}  [{row['lower']:.1%}, {row['upper']:.1%}]")
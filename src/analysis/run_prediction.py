@@ -3,30 +3,342 @@ import os
 from pathlib import Path
 import pandas as pd
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from tqdm import tqdm
 import numpy as np
-import re
+from functools import partial
 
 # Add project root to sys.path
 # This file is in src/analysis/, so PROJECT_ROOT is ../../
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(PROJECT_ROOT))
 
-from src.utils import get_emotion_label
+from src.utils import get_emotion_label, strip_reply_prefix, normalize_texts
+from src.utils import prob_store
+from src.analysis.inference import (
+    predict_proba,
+    predict_proba_deduplicated,
+    get_model_fingerprint,
+    DEFAULT_MAX_LENGTH,
+    DEFAULT_TOKEN_BUDGET,
+    DEFAULT_MAX_BATCH_SIZE,
+)
+from src.analysis.model import get_model_and_tokenizer, get_torch_model
+from src.analysis.prediction_cache import PredictionCache
+from src.analysis.sharded import predict_proba_sharded
+from src.analysis.checkpoint import hash_file, load_progress, save_progress, clear_progress
+from src.analysis.cascade import wrap_with_cascade, train_cascade_model
+from src.analysis.near_dedup import wrap_with_near_dedup
+from src.analysis.autotune import get_tuning
+from src.analysis.precision import apply_precision
+from src.analysis.early_exit import wrap_with_early_exit
+from src.analysis.distill import find_student_model
+from src.analysis.preview import PreviewEstimator, PREVIEW_SAMPLE_SIZE, refinement_sizes, print_preview_report
 
-def run_prediction_pipeline(input_path=None, output_path=None, model_path=None, model=None, tokenizer=None):
+def load_pipeline_model(model_path=None, model=None, tokenizer=None, backend="torch", server_url=None):
     """
-    运行预测流水线：读取数据 -> 加载模型 -> 预测 -> 保存结果 -> 返回 DataFrame
+    按流水线的规则加载模型与分词器
+    
+    backend 为 "remote" 时连接本地推理服务 (见 inference_server.py)，不在本进程加载模型，
+    此时返回的 tokenizer 为 None。
+    
+    Returns:
+        (model, tokenizer, device)；加载失败时返回 None
+    """
+    if backend == "remote":
+        from src.analysis.inference_server import RemoteSentimentModel, DEFAULT_SERVER_URL
+        if not isinstance(model, RemoteSentimentModel):
+            server_url = server_url or DEFAULT_SERVER_URL
+            try:
+                model = RemoteSentimentModel(server_url)
+            except Exception as e:
+                print(f"❌ Failed to connect to inference server at {server_url}: {e}")
+                print("请先运行 python src/analysis/inference_server.py 启动推理服务")
+                return None
+        print(f"🛰️ Using remote inference server: {model.server_url}")
+        return model, None, model.device
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"💻 Using device: {device}")
+
+    if backend == "onnx":
+        # ONNX 后端：传入的 PyTorch 模型仅在首次导出时使用
+        from src.analysis.onnx_backend import load_onnx_model, OnnxSentimentModel
+        if not isinstance(model, OnnxSentimentModel):
+            try:
+                model, tokenizer = load_onnx_model(model_path, model=model, tokenizer=tokenizer)
+            except Exception as e:
+                print(f"❌ Failed to load ONNX model: {e}")
+                return None
+        device = torch.device("cpu")
+        print(f"💻 ONNX Runtime backend, using device: {device}")
+
+    # 如果没有传入预加载的模型，则从共享提供者获取 (同一进程内只加载一次)
+    elif model is None or tokenizer is None:
+        try:
+            model, tokenizer = get_model_and_tokenizer(model_path)
+        except Exception as e:
+            print(f"❌ Failed to load model: {e}")
+            return None
+    
+    # 确保模型在正确的设备上
+    model = model.to(device)
+    model.eval()
+    return model, tokenizer, device
+
+def resolve_student_backend(model_path=None):
+    """
+    backend="student"：找到为 (教师) 模型蒸馏的学生模型 (见 distill.py)，之后按 PyTorch 后端推理
+    
+    Returns:
+        学生模型目录；尚未蒸馏时返回 None
+    """
+    student_path = find_student_model(model_path)
+    if student_path is None:
+        print("❌ No distilled student model for this model yet")
+        print("请先运行 python src/analysis/distill.py 训练学生模型")
+        return None
+    print(f"🎓 Using distilled student model: {student_path}")
+    return student_path
+
+def autotune_settings(model, tokenizer, device, model_path, backend, max_length, token_budget, autotune=True):
+    """
+    读取 (首次运行时校准) 本机的线程数与 token 预算，仅对 CPU 上的 PyTorch 后端生效
+
+    autotune="cached" 时只使用已有的调优结果，没有时不校准。
+    
+    Returns:
+        int，调优后的 token 预算；不适用时原样返回 token_budget
+    """
+    if backend != "torch" or device.type != "cpu":
+        return token_budget
+    tuning = get_tuning(model, tokenizer, model_path=model_path, max_length=max_length, calibrate_if_missing=autotune != "cached")
+    if tuning is None:
+        print("🎛️ No auto-tune result for this machine yet, using the default settings (run python src/analysis/autotune.py to calibrate)")
+        return token_budget
+    print(f"🎛️ Auto-tuned: {tuning['intra_op_threads']} threads, token budget {tuning['token_budget']}")
+    return tuning['token_budget']
+
+def precision_settings(model, tokenizer, backend, precision, max_length, validation_texts=None):
+    """
+    按需启用低精度推理 (仅 PyTorch 后端)，并报告与 fp32 的速度和标签一致率
+    
+    Returns:
+        (model, precision)：实际使用的模型与精度 (不支持时回退为 fp32)
+    """
+    if precision == "fp32":
+        return model, precision
+    if backend != "torch":
+        print(f"⚠️ {precision} mode only applies to the PyTorch backend, ignoring it for {backend}")
+        return model, "fp32"
+    reduced_model, report = apply_precision(
+        model, tokenizer, precision, validation_texts=validation_texts, max_length=max_length
+    )
+    return reduced_model, (precision if report is not None else "fp32")
+
+def early_exit_settings(model, tokenizer, backend, num_workers, model_path, threshold, max_length, calibration_texts=None):
+    """
+    按需启用提前退出推理 (仅单进程 PyTorch 后端)
+    
+    共享模型为冷启动缓存的追踪图时另外加载一份可逐层计算的模型；尚未校准出口分类头时，
+    传入 calibration_texts 则先校准一次 (见 early_exit.py)。
+    
+    Returns:
+        (model, early_exit_model)：early_exit_model 为 None 表示本次按完整深度推理
+    """
+    if threshold is None:
+        return model, None
+    if backend != "torch" or num_workers > 1:
+        print("⚠️ Early exit only applies to the single-process PyTorch backend, running full depth")
+        return model, None
+    if not isinstance(model, torch.nn.Module):
+        model = get_torch_model(model_path or model.config._name_or_path)
+    early_exit_model = wrap_with_early_exit(
+        model, tokenizer, threshold, calibration_texts=calibration_texts, max_length=max_length
+    )
+    if early_exit_model is None:
+        return model, None
+    return early_exit_model, early_exit_model
+
+def report_early_exit(early_exit_model):
+    """打印本次推理实际的平均执行层数"""
+    stats = early_exit_model.stats
+    print(
+        f"⏩ Early exit: {early_exit_model.average_layers():.2f} of {early_exit_model.num_layers} layers per text on average, "
+        f"{stats['exited']} of {stats['texts']} texts ({stats['exited'] / max(1, stats['texts']):.1%}) left early"
+    )
+
+def find_header_row(input_path):
+    """
+    自动检测表头：跳过开头的空行和注释行 (逐行读取，不把整个文件读入内存)
+    """
+    input_path = Path(input_path)
+    if not input_path.exists():
+        return 0
+    with open(input_path, 'r', encoding='utf-8-sig') as f:
+        for i, line in enumerate(f):
+            if line.strip() and not line.strip().startswith('#'):
+                return i
+    return 0
+
+def clean_dataframe(df):
+    """
+    统一列名并清洗评论内容
+    
+    Returns:
+        pd.DataFrame；缺少内容列时返回 None
+    """
+    # 统一列名：确保有 'content' 列
+    if 'content' not in df.columns:
+        if 'message' in df.columns:
+            df['content'] = df['message']
+        elif 'text' in df.columns:
+            df['content'] = df['text']
+        
+    if 'content' not in df.columns:
+        print("❌ 'content' column not found in CSV.")
+        print(f"Columns found: {df.columns.tolist()}")
+        return None
+        
+    # 数据清洗
+    df['content'] = df['content'].fillna("").astype(str)
+    # 移除空白内容
+    df = df[df['content'].str.strip() != ""]
+    # 移除 "回复 @xxx :" 或 "@xxx :" (兼容不同格式)；content 保留原始写法用于展示和词云
+    df["content"] = strip_reply_prefix(df["content"])
+    df = df[df["content"] != ""]
+    return df
+
+def build_predict_fn(
+    model,
+    tokenizer,
+    device,
+    model_path=None,
+    backend="torch",
+    num_workers=1,
+    max_length=DEFAULT_MAX_LENGTH,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    batch_size=DEFAULT_MAX_BATCH_SIZE,
+    precision="fp32",
+):
+    """
+    根据推理配置构造 predict_fn：接受 list of str，返回概率矩阵
+    """
+    if backend == "remote":
+        # 推理服务端自行组批，请求优先级由客户端对象决定 (默认 bulk)
+        return partial(model.predict_proba, max_length=max_length)
+    if num_workers > 1:
+        # 多进程分片：各工作进程按模型来源重新加载一份模型
+        worker_model_path = model_path or getattr(model, 'source_path', None) or model.config._name_or_path
+        return partial(
+            predict_proba_sharded,
+            model_path=worker_model_path,
+            tokenizer=tokenizer,
+            num_labels=model.config.num_labels,
+            backend=backend,
+            num_workers=num_workers,
+            max_length=max_length,
+            token_budget=token_budget,
+            max_batch_size=batch_size,
+            precision=precision,
+        )
+    return partial(
+        predict_proba,
+        model=model,
+        tokenizer=tokenizer,
+        device=device,
+        max_length=max_length,
+        token_budget=token_budget,
+        max_batch_size=batch_size,
+    )
+
+def _assign_labels(df, probs):
+    """按概率矩阵为 DataFrame 添加标签列 (原地修改)"""
+    predictions = probs.argmax(axis=-1)
+            
+    df['predicted_label_id'] = predictions
+    # 获取中文情感标签
+    df['predicted_emotion'] = df['predicted_label_id'].apply(lambda x: get_emotion_label(x, use_zh=True))
+    
+    # 兼容旧代码，可能需要 'labels' 列
+    df['labels'] = predictions
+
+def predict_dataframe(df, predict_fn, num_labels, cache=None, model_key=None):
+    """
+    对清洗后的 DataFrame 执行推理并添加标签列 (原地修改)
+    
+    Returns:
+        np.ndarray，各行的类别概率
+    """
+    # 规范化 (表情、重复字符、全半角、空白) 后去重，相同文本只推理一次；再按 token 长度分桶动态组批
+    texts = normalize_texts(df['content']).tolist()
+    probs = predict_proba_deduplicated(texts, predict_fn, num_labels, cache=cache, model_key=model_key)
+    _assign_labels(df, probs)
+    return probs
+
+def predict_dataframe_with_preview(df, predict_fn, num_labels, on_preview, cache=None, model_key=None, preview_size=PREVIEW_SAMPLE_SIZE):
+    """
+    同 predict_dataframe，但按分层抽样顺序逐轮推理 (见 preview.py)：先推理 preview_size 行，
+    每轮结束后把全量的估计 (带置信区间) 交给 on_preview，再扩大样本，最后一轮即为全量结果
+    
+    去重跨轮进行：之前各轮已推理过的文本不再送入 predict_fn。每轮都会调用一次 predict_fn，
+    因此不适合每次调用都要启动进程的多进程分片 (run_prediction_pipeline 此时不启用预览)。
     
     Args:
-        input_path: 输入 CSV 路径
-        output_path: 输出 CSV 路径
-        model_path: 模型路径 (可选)
-        model: 预加载的模型对象 (可选，推荐)
-        tokenizer: 预加载的分词器对象 (可选，推荐)
+        on_preview: 函数，接受 PreviewEstimator.estimate 的结果；返回 False 时停止，不再推理剩余的行
+    
+    Returns:
+        np.ndarray，各行的类别概率；被 on_preview 停止时返回 None (df 不修改)
     """
-    # 1. 路径处理
+    row_codes, uniques = pd.factorize(normalize_texts(df['content']))
+    estimator = PreviewEstimator(df)
+    order = estimator.order()
+    unique_probs = np.zeros((len(uniques), num_labels), dtype=np.float32)
+    known = np.zeros(len(uniques), dtype=bool)
+    labels = np.zeros(len(row_codes), dtype=np.int64)
+    done = 0
+    for size in refinement_sizes(len(row_codes), preview_size):
+        batch_codes = row_codes[order[done:size]]
+        new_codes = np.unique(batch_codes[~known[batch_codes]])
+        if len(new_codes):
+            unique_probs[new_codes] = predict_proba_deduplicated(
+                [uniques[c] for c in new_codes], predict_fn, num_labels, cache=cache, model_key=model_key
+            )
+            known[new_codes] = True
+        labels[order[done:size]] = unique_probs[batch_codes].argmax(axis=-1)
+        done = size
+        if on_preview(estimator.estimate(order[:done], labels[order[:done]], num_labels)) is False:
+            print(f"⏹️ Stopped after previewing {done} of {len(row_codes)} rows")
+            return None
+    probs = unique_probs[row_codes]
+    _assign_labels(df, probs)
+    return probs
+
+def predict_dataframe_with_embeddings(df, predict_fn, cache=None, model_key=None):
+    """
+    同 predict_dataframe，并返回同一次前向计算得到的句向量
+    
+    每个不同文本都需要自己的句向量，因此不查询预测缓存 (结果仍写回缓存)。
+    
+    Args:
+        predict_fn: 函数，接受 list of str 返回 (概率矩阵, 句向量)
+    
+    Returns:
+        (probs, embeddings, row_codes)：各行的类别概率、每个不同文本的句向量、各行对应的文本编号
+    """
+    from src.analysis.prediction_cache import hash_text
+
+    texts = normalize_texts(df['content'])
+    row_codes, uniques = pd.factorize(texts)
+    uniques = list(uniques)
+    print(f"🧮 {len(row_codes)} rows -> {len(uniques)} unique texts, computing sentiment and embeddings")
+    unique_probs, embeddings = predict_fn(uniques)
+    if cache is not None and uniques:
+        cache.put_many(model_key, [hash_text(t) for t in uniques], unique_probs)
+    probs = unique_probs[row_codes]
+    _assign_labels(df, probs)
+    return probs, embeddings, row_codes
+
+def _resolve_paths(input_path, output_path):
+    """路径处理：补全默认输入输出路径"""
     if input_path is None:
         input_path = PROJECT_ROOT / "data" / "raw" / "comments.csv"
     else:
@@ -37,83 +349,99 @@ def run_prediction_pipeline(input_path=None, output_path=None, model_path=None,
         output_path = PROJECT_ROOT / "data" / "processed" / f"{input_path.stem}_predicted.csv"
     else:
         output_path = Path(output_path)
+    return input_path, output_path
 
-    # 2. 模型加载逻辑
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"💻 Using device: {device}")
-
-    # 如果没有传入预加载的模型，则尝试加载
-    if model is None or tokenizer is None:
-        # 尝试从 src.analysis.model 导入 (如果未指定 model_path)
-        if model_path is None:
-            try:
-                print("🚀 Loading model from src.analysis.model configuration...")
-                from src.analysis.model import model as loaded_model, tokenizer as loaded_tokenizer
-                model = loaded_model
-                tokenizer = loaded_tokenizer
-            except Exception as e:
-                print(f"⚠️ Failed to import from src.analysis.model: {e}")
-        
-        # 如果导入失败或指定了 model_path，则手动加载
-        if model is None:
-            if model_path is None:
-                LOCAL_MODEL_DIR = PROJECT_ROOT / "trained_models"
-                HF_MODEL_ID = "ScarletShinku/bilibili-sentiment-bert"
-                
-                if LOCAL_MODEL_DIR.exists():
-                    model_path = LOCAL_MODEL_DIR
-                else:
-                    model_path = HF_MODEL_ID
-            
-            print(f"🚀 Loading model from: {model_path}")
-            try:
-                tokenizer = AutoTokenizer.from_pretrained(model_path)
-                model = AutoModelForSequenceClassification.from_pretrained(model_path)
-            except Exception as e:
-                print(f"❌ Failed to load model: {e}")
-                return None
+def run_prediction_pipeline(
+    input_path=None,
+    output_path=None,
+    model_path=None,
+    model=None,
+    tokenizer=None,
+    max_length=DEFAULT_MAX_LENGTH,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    batch_size=DEFAULT_MAX_BATCH_SIZE,
+    use_cache=True,
+    cache_path=None,
+    backend="torch",
+    num_workers=1,
+    server_url=None,
+    cascade_threshold=None,
+    near_dup_distance=None,
+    save_probs=False,
+    save_embeddings=False,
+    autotune=False,
+    precision="fp32",
+    early_exit_threshold=None,
+    on_preview=None,
+    preview_size=PREVIEW_SAMPLE_SIZE,
+):
+    """
+    运行预测流水线：读取数据 -> 加载模型 -> 预测 -> 保存结果 -> 返回 DataFrame
     
-    # 确保模型在正确的设备上
-    model = model.to(device)
+    Args:
+        input_path: 输入 CSV 路径
+        output_path: 输出 CSV 路径
+        model_path: 模型路径 (可选)
+        model: 预加载的模型对象 (可选，推荐)
+        tokenizer: 预加载的分词器对象 (可选，推荐)
+        max_length: 截断长度
+        token_budget: 每个批次的 token 上限 (行数 × 补齐长度)，按长度分桶动态组批
+        batch_size: 每个批次的最大行数
+        use_cache: 是否使用持久化预测缓存 (相同文本跨文件复用结果)
+        cache_path: 缓存文件路径 (默认 data/cache/predictions.sqlite)
+        backend: 推理后端，"torch" (PyTorch)、"onnx" (ONNX Runtime + int8 量化，仅 CPU)、
+            "remote" (本地推理服务，见 inference_server.py) 或 "student" (蒸馏的小模型，见 distill.py，
+            更快但精度略低；此时 model_path 指教师模型，传入的 model/tokenizer 不使用)
+        num_workers: 推理进程数，大于 1 时启用多进程分片推理 (仅 CPU)
+        server_url: 推理服务地址 (backend="remote" 时使用，默认 http://127.0.0.1:8765)
+        cascade_threshold: 级联阈值 (可选)。设置后先用廉价模型预测，其最大概率不低于阈值的行
+            不再经过 BERT；尚无廉价模型时本次全量使用 BERT，并用结果训练一个 (见 cascade.py)
+        near_dup_distance: 近似去重的 SimHash 汉明距离阈值 (可选，例如 3)。设置后只差标点、
+            个别字的文本合并为一簇，每簇只推理一次，结果复制给所有成员 (见 near_dedup.py)
+        save_probs: 是否保存每行完整的类别概率 (float16，输出文件名 + .probs.npy，行与输出 CSV 对齐)，
+            之后可用 src.utils.load_probs 以内存映射方式读取，无需重新推理
+        save_embeddings: 是否同时保存池化句向量并建立语义检索索引 (见 semantic_index.py)。
+            句向量来自情感推理的同一次前向计算，仅支持单进程 PyTorch 后端；
+            每个不同文本都要经过模型，因此本次不使用级联、近似去重和缓存命中
+        autotune: 是否使用本机自动调优的线程数与 token 预算 (覆盖 token_budget，首次运行时会校准一次，
+            结果缓存在 data/cache/autotune.json)；"cached" 表示只使用已有的结果，没有时不校准
+        precision: "fp32" 或 "bf16"。bf16 用 autocast 以 bfloat16 计算矩阵乘法 (仅 PyTorch 后端，
+            CPU 不支持时回退 fp32)，启用时先在本次数据的抽样上报告相对 fp32 的加速比与标签一致率
+        early_exit_threshold: 提前退出阈值 (可选，例如 0.9)。设置后逐层推理，中间层出口分类头最大概率
+            不低于阈值的文本提前输出 (仅单进程 PyTorch 后端)；尚未校准时先用本次数据抽样校准一次，
+            报告校准时与完整模型的一致率和本次的平均执行层数 (见 early_exit.py)
+        on_preview: 快速预览回调 (可选)。设置后先推理按发布时间 × 视频进度分层抽样的 preview_size 行，
+            立即把全量情感分布与趋势的估计 (带 95% 置信区间) 交给回调，再逐轮扩大样本直到全量；
+            回调返回 False 时停止并返回 None (见 preview.py)。与 save_embeddings、多进程分片 (num_workers > 1)
+            不能同时使用：每轮都要调用一次推理，分片推理每次调用都会重新启动工作进程并加载模型
+        preview_size: 快速预览第一轮的抽样行数
+    """
+    # 1. 路径处理
+    input_path, output_path = _resolve_paths(input_path, output_path)
+    if backend == "student":
+        # 学生模型是一个更小的 PyTorch 模型，之后的流程与 torch 后端相同
+        model_path = resolve_student_backend(model_path)
+        if model_path is None:
+            return None
+        model, tokenizer, backend = None, None, "torch"
+
+    # 2. 模型加载逻辑
+    loaded = load_pipeline_model(model_path, model, tokenizer, backend, server_url)
+    if loaded is None:
+        return None
+    model, tokenizer, device = loaded
+    if autotune:
+        token_budget = autotune_settings(model, tokenizer, device, model_path, backend, max_length, token_budget, autotune)
 
     # 3. 读取数据
     print(f"📖 Reading data from {input_path}...")
     try:
         # 尝试读取，跳过可能的坏行
-        # 自动检测表头：如果第一行看起来不像表头（比如是注释），尝试跳过
-        header_row = 0
-        if input_path.exists():
-            with open(input_path, 'r', encoding='utf-8-sig') as f:
-                lines = f.readlines()
-            for i, line in enumerate(lines):
-                if line.strip() and not line.strip().startswith('#'):
-                    header_row = i
-                    break
-        
+        header_row = find_header_row(input_path)
         df = pd.read_csv(input_path, skiprows=header_row, encoding='utf-8-sig', on_bad_lines='skip')
-        
-        # 统一列名：确保有 'content' 列
-        if 'content' not in df.columns:
-            if 'message' in df.columns:
-                df['content'] = df['message']
-            elif 'text' in df.columns:
-                df['content'] = df['text']
-            
-        if 'content' not in df.columns:
-            print("❌ 'content' column not found in CSV.")
-            print(f"Columns found: {df.columns.tolist()}")
+        df = clean_dataframe(df)
+        if df is None:
             return None
-            
-        # 数据清洗
-        df['content'] = df['content'].fillna("").astype(str)
-        # 移除空白内容
-        df = df[df['content'].str.strip() != ""]
-        # 移除 "回复 @xxx :" 或 "@xxx :" (兼容不同格式)
-        # 正则解释: ^(?:回复\s*)? 匹配开头可选的"回复"和空格
-        # @.*? 匹配 @用户名 (非贪婪)
-        # [：:]\s* 匹配中英文冒号和后续空格
-        df["content"] = df["content"].apply(lambda x: re.sub(r'^(?:回复\s*)?@.*?[：:]\s*', '', x).strip())
-        df = df[df["content"] != ""]
         
         print(f"📊 Total items to analyze: {len(df)}")
         
@@ -121,46 +449,294 @@ def run_prediction_pipeline(input_path=None, output_path=None, model_path=None,
         print(f"❌ Failed to read data: {e}")
         return None
 
+    if save_embeddings and on_preview is not None:
+        print("⚠️ The semantic index needs every text in one pass, skipping the preview for this run")
+        on_preview = None
+    if on_preview is not None and num_workers > 1 and backend != "remote":
+        print("⚠️ Sharded inference restarts its workers on every call, skipping the preview so each worker loads the model once")
+        on_preview = None
+    if save_embeddings and backend != "torch":
+        print("⚠️ Embeddings are only available with the PyTorch backend, skipping the semantic index")
+        save_embeddings = False
+    if save_embeddings and (
+        num_workers > 1 or cascade_threshold is not None or near_dup_distance is not None or early_exit_threshold is not None
+    ):
+        print("⚠️ Embeddings need a single-process, full-depth forward pass for every text: workers, cascade, near-duplicate grouping and early exit are off for this run")
+        num_workers, cascade_threshold, near_dup_distance, early_exit_threshold = 1, None, None, None
+
+    model, early_exit_model = early_exit_settings(
+        model, tokenizer, backend, num_workers, model_path, early_exit_threshold, max_length,
+        calibration_texts=normalize_texts(df['content']).tolist() if early_exit_threshold is not None else None,
+    )
+    model, precision = precision_settings(
+        model, tokenizer, backend, precision, max_length,
+        validation_texts=normalize_texts(df['content']).tolist() if precision != "fp32" and backend == "torch" else None,
+    )
+
     # 4. 执行预测
     print("🔮 Running inference...")
-    batch_size = 32
-    predictions = []
-    
-    model.eval()
-    
-    # 批量预测
-    texts = df['content'].tolist()
-    for i in tqdm(range(0, len(texts), batch_size), desc="Predicting"):
-        batch_texts = texts[i : i + batch_size]
-        
-        inputs = tokenizer(
-            batch_texts, 
-            return_tensors="pt", 
-            padding=True, 
-            truncation=True, 
-            max_length=128
-        ).to(device)
-        
-        with torch.no_grad():
-            logits = model(**inputs).logits
-            preds = torch.argmax(logits, dim=-1).cpu().numpy()
-            predictions.extend(preds)
-            
-    df['predicted_label_id'] = predictions
-    # 获取中文情感标签
-    df['predicted_emotion'] = df['predicted_label_id'].apply(lambda x: get_emotion_label(x, use_zh=True))
-    
-    # 兼容旧代码，可能需要 'labels' 列
-    df['labels'] = predictions
+    predict_fn = build_predict_fn(
+        model, tokenizer, device,
+        model_path=model_path,
+        backend=backend,
+        num_workers=num_workers,
+        max_length=max_length,
+        token_budget=token_budget,
+        batch_size=batch_size,
+        precision=precision,
+    )
+
+    model_key = get_model_fingerprint(model, max_length)
+    cache_key = model_key
+    cheap_model = None
+    if cascade_threshold is not None:
+        predict_fn, cache_key, cheap_model = wrap_with_cascade(
+            predict_fn, model_key, model.config.num_labels, cascade_threshold
+        )
+    if near_dup_distance is not None:
+        predict_fn, cache_key = wrap_with_near_dedup(predict_fn, cache_key, near_dup_distance)
+
+    cache = PredictionCache(cache_path) if use_cache else None
+    if early_exit_model is not None:
+        early_exit_model.reset_stats()
+    try:
+        if save_embeddings:
+            probs, embeddings, row_codes = predict_dataframe_with_embeddings(
+                df,
+                partial(predict_fn, return_embeddings=True),
+                cache=cache,
+                model_key=cache_key,
+            )
+        elif on_preview is not None and len(df) > 0:
+            probs = predict_dataframe_with_preview(
+                df,
+                predict_fn,
+                model.config.num_labels,
+                on_preview,
+                cache=cache,
+                model_key=cache_key,
+                preview_size=preview_size,
+            )
+        else:
+            probs = predict_dataframe(
+                df,
+                predict_fn,
+                model.config.num_labels,
+                cache=cache,
+                model_key=cache_key,
+            )
+    finally:
+        if cache is not None:
+            cache.close()
+    if early_exit_model is not None:
+        report_early_exit(early_exit_model)
+    if probs is None:
+        # 预览后被停止：不保存部分结果
+        return None
+
+    if cascade_threshold is not None and cheap_model is None:
+        # 用本次全量 BERT 的结果训练廉价模型，下次运行即可走级联
+        train_cascade_model(
+            normalize_texts(df['content']).tolist(),
+            df['predicted_label_id'].to_numpy(),
+            model_key,
+            model.config.num_labels,
+        )
 
     # 5. 保存结果
     output_path.parent.mkdir(parents=True, exist_ok=True)
     print(f"💾 Saving predictions to {output_path}")
     # 使用 mode='w' 覆盖写入
     df.to_csv(output_path, index=False, encoding='utf-8-sig', mode='w')
+    if save_probs:
+        probs_path = prob_store.save_probs(output_path, probs)
+        print(f"💾 Saving class probabilities to {probs_path}")
+    if save_embeddings:
+        from src.analysis.semantic_index import build_index
+        embeddings_path = build_index(output_path, embeddings, row_codes, model_key=model_key, precision=precision)
+        print(f"💾 Saving sentence embeddings to {embeddings_path}")
     
     return df
 
+def run_prediction_streaming(
+    input_path=None,
+    output_path=None,
+    chunksize=50000,
+    model_path=None,
+    model=None,
+    tokenizer=None,
+    max_length=DEFAULT_MAX_LENGTH,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    batch_size=DEFAULT_MAX_BATCH_SIZE,
+    use_cache=True,
+    cache_path=None,
+    backend="torch",
+    num_workers=1,
+    server_url=None,
+    cascade_threshold=None,
+    near_dup_distance=None,
+    save_probs=False,
+    autotune=False,
+    precision="fp32",
+    early_exit_threshold=None,
+    resume=True,
+):
+    """
+    流式预测：分块读取 -> 清洗 -> 预测 -> 追加写入，峰值内存与输入文件大小无关
+    
+    适用于大型弹幕文件。每块结果写完即落盘，中途崩溃时已写入的部分不会丢失；
+    跨块的重复文本通过预测缓存复用结果。
+    
+    Args:
+        chunksize: 每块读取的行数 (num_workers > 1 时每块都会重新启动工作进程，建议调大)
+        resume: 是否断点续跑。开启时每块提交后记录进度清单 (输出文件名 + .progress.json)，
+            对同一输入、同一模型重新运行会从最后一个已提交的块继续
+        cascade_threshold: 级联阈值 (可选)。流式模式只使用已训练好的廉价模型，不会自动训练
+        near_dup_distance: 近似去重阈值 (可选)，只在每块内部合并
+        save_probs: 是否保存类别概率 (逐块追加，结束时生成 .probs.npy)
+        precision: 推理精度，bf16 的对比报告使用合成语料
+        early_exit_threshold: 提前退出阈值 (可选)。流式模式只使用已校准的出口分类头，不会自动校准
+        其余参数同 run_prediction_pipeline
+        
+    Returns:
+        int，写入的总行数；失败时返回 None
+    """
+    input_path, output_path = _resolve_paths(input_path, output_path)
+    if backend == "student":
+        # 学生模型是一个更小的 PyTorch 模型，之后的流程与 torch 后端相同
+        model_path = resolve_student_backend(model_path)
+        if model_path is None:
+            return None
+        model, tokenizer, backend = None, None, "torch"
+
+    loaded = load_pipeline_model(model_path, model, tokenizer, backend, server_url)
+    if loaded is None:
+        return None
+    model, tokenizer, device = loaded
+    if autotune:
+        token_budget = autotune_settings(model, tokenizer, device, model_path, backend, max_length, token_budget, autotune)
+    # 流式模式不校准出口分类头，需先用普通模式或 early_exit.py 校准
+    model, early_exit_model = early_exit_settings(
+        model, tokenizer, backend, num_workers, model_path, early_exit_threshold, max_length
+    )
+    model, precision = precision_settings(model, tokenizer, backend, precision, max_length)
+    if early_exit_model is not None:
+        early_exit_model.reset_stats()
+
+    predict_fn = build_predict_fn(
+        model, tokenizer, device,
+        model_path=model_path,
+        backend=backend,
+        num_workers=num_workers,
+        max_length=max_length,
+        token_budget=token_budget,
+        batch_size=batch_size,
+        precision=precision,
+    )
+    model_key = get_model_fingerprint(model, max_length)
+    if cascade_threshold is not None:
+        # 流式模式不训练廉价模型，需先用普通模式或 cascade.py 训练
+        predict_fn, model_key, _ = wrap_with_cascade(predict_fn, model_key, model.config.num_labels, cascade_threshold)
+    if near_dup_distance is not None:
+        predict_fn, model_key = wrap_with_near_dedup(predict_fn, model_key, near_dup_distance)
+
+    print(f"📖 Streaming data from {input_path} (chunksize={chunksize})...")
+    try:
+        header_row = find_header_row(input_path)
+        reader = pd.read_csv(
+            input_path,
+            skiprows=header_row,
+            encoding='utf-8-sig',
+            on_bad_lines='skip',
+            chunksize=chunksize,
+        )
+    except Exception as e:
+        print(f"❌ Failed to read data: {e}")
+        return None
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    run_key = None
+    progress = None
+    if resume:
+        run_key = {
+            'input_hash': hash_file(input_path),
+            'model_fingerprint': model_key,
+            'chunksize': chunksize,
+            'save_probs': save_probs,
+        }
+        progress = load_progress(output_path, run_key)
+        if progress is not None and save_probs and not prob_store.partial_probs_path_for(output_path).exists():
+            progress = None
+
+    skip_chunks = 0
+    total_rows = 0
+    if progress is not None:
+        # 截掉最后一次提交之后写了一半的内容，从下一块继续
+        skip_chunks = progress['chunks_committed']
+        total_rows = progress['rows_written']
+        with open(output_path, 'r+b') as fb:
+            fb.truncate(progress['output_bytes'])
+        if save_probs:
+            with open(prob_store.partial_probs_path_for(output_path), 'r+b') as fb:
+                fb.truncate(progress['probs_bytes'])
+        print(f"🔁 Resuming from chunk {skip_chunks + 1} ({total_rows} rows already committed)")
+        mode = 'a'
+    else:
+        mode = 'w'
+
+    print(f"💾 Writing predictions to {output_path}")
+    cache = PredictionCache(cache_path) if use_cache else None
+    probs_file = None
+    try:
+        probs_file = open(prob_store.partial_probs_path_for(output_path), mode + 'b') if save_probs else None
+        with reader, open(output_path, mode, encoding='utf-8-sig', newline='') as f:
+            for chunk_id, chunk in enumerate(reader):
+                if chunk_id < skip_chunks:
+                    continue
+                chunk = clean_dataframe(chunk)
+                if chunk is None:
+                    return None
+
+                if not chunk.empty:
+                    print(f"🔮 Chunk {chunk_id + 1}: {len(chunk)} items")
+                    probs = predict_dataframe(chunk, predict_fn, model.config.num_labels, cache=cache, model_key=model_key)
+                    chunk.to_csv(f, index=False, header=(f.tell() == 0))
+                    if probs_file is not None:
+                        probs_file.write(probs.astype(prob_store.PROBS_DTYPE).tobytes())
+                    total_rows += len(chunk)
+
+                f.flush()
+                if probs_file is not None:
+                    probs_file.flush()
+                if run_key is not None:
+                    # 先让数据落盘，再提交进度
+                    os.fsync(f.fileno())
+                    extra = {}
+                    if probs_file is not None:
+                        os.fsync(probs_file.fileno())
+                        extra['probs_bytes'] = probs_file.tell()
+                    save_progress(output_path, run_key, chunk_id + 1, total_rows, f.tell(), **extra)
+    except Exception as e:
+        print(f"❌ Streaming prediction failed after {total_rows} rows: {e}")
+        if run_key is not None:
+            print("🔁 Re-run the same command to resume from the last committed chunk.")
+        return None
+    finally:
+        if cache is not None:
+            cache.close()
+        if probs_file is not None:
+            probs_file.close()
+
+    if save_probs:
+        probs_path = prob_store.finalize_probs(output_path, model.config.num_labels)
+        print(f"💾 Class probabilities saved to {probs_path}")
+    if early_exit_model is not None:
+        report_early_exit(early_exit_model)
+    if run_key is not None:
+        clear_progress(output_path)
+    print(f"📊 Total items analyzed: {total_rows}")
+    return total_rows
+
 def main():
     """
     CLI 入口函数
@@ -201,8 +777,107 @@ def main():
         print("请先运行爬虫进行爬取")
         return
 
+    print("请选择推理后端:")
+    print("1. torch (PyTorch，默认)")
+    print("2. onnx (ONNX Runtime int8 量化，CPU 更快)")
+    print("3. remote (已启动的本地推理服务，见 inference_server.py)")
+    print("4. student (蒸馏的小模型，更快但精度略低，见 distill.py)")
+    backend_choice = input("请输入您的选择 (按Enter使用默认值 torch): ").strip().lower()
+    if backend_choice in ['2', 'onnx']:
+        backend = "onnx"
+    elif backend_choice in ['3', 'remote']:
+        backend = "remote"
+    elif backend_choice in ['4', 'student']:
+        backend = "student"
+    else:
+        backend = "torch"
+
+    precision = "fp32"
+    if backend in ("torch", "student"):
+        precision_choice = input("是否启用 bf16 低精度推理 (CPU 支持时更快，会报告与 fp32 的一致率)？(y/n，默认n): ").strip().lower()
+        precision = "bf16" if precision_choice == 'y' else "fp32"
+
+    early_exit_threshold = None
+    if backend in ("torch", "student"):
+        early_exit_input = input("请输入提前退出阈值 (简单样本在中间层提前输出，例如 0.9；按Enter不启用，仅单进程): ").strip()
+        try:
+            early_exit_threshold = float(early_exit_input) if early_exit_input else None
+        except ValueError:
+            print("⚠️ 输入无效，不启用提前退出")
+            early_exit_threshold = None
+
+    # 默认只使用已有的调优结果；校准要扫描多组线程数与 token 预算，需要一些时间
+    autotune = False
+    if backend in ("torch", "student"):
+        autotune_choice = input("是否在本机校准推理线程数与 token 预算 (仅首次需要，结果会缓存；默认只使用已有的校准结果)？(y/n，默认n): ").strip().lower()
+        autotune = True if autotune_choice == 'y' else "cached"
+
+    num_workers = 1
+    if backend != "remote":
+        workers_input = input(f"请输入推理进程数 (本机 {os.cpu_count()} 核，按Enter使用默认值 1): ").strip()
+        try:
+            num_workers = max(1, int(workers_input)) if workers_input else 1
+        except ValueError:
+            print("⚠️ 输入无效，使用默认值 1")
+            num_workers = 1
+
+    cascade_input = input("请输入级联阈值 (廉价模型有把握时跳过 BERT，例如 0.9；按Enter不启用): ").strip()
+    try:
+        cascade_threshold = float(cascade_input) if cascade_input else None
+    except ValueError:
+        print("⚠️ 输入无效，不启用级联")
+        cascade_threshold = None
+
+    near_dup_input = input("请输入近似去重的 SimHash 距离阈值 (只差标点/个别字的弹幕只推理一次，例如 3；按Enter不启用): ").strip()
+    try:
+        near_dup_distance = int(near_dup_input) if near_dup_input else None
+    except ValueError:
+        print("⚠️ 输入无效，不启用近似去重")
+        near_dup_distance = None
+
+    probs_choice = input("是否保存每条数据的类别概率 (.probs.npy，可用于调整权重、筛选低置信度)？(y/n，默认n): ").strip().lower()
+    save_probs = probs_choice == 'y'
+
+    stream_choice = input("是否使用流式模式 (分块读写，适合超大文件，内存占用恒定)？(y/n，默认n): ").strip().lower()
+
+    if stream_choice == 'y':
+        total_rows = run_prediction_streaming(
+            input_path=INPUT_FILE,
+            output_path=OUTPUT_FILE,
+            backend=backend,
+            num_workers=num_workers,
+            cascade_threshold=cascade_threshold,
+            near_dup_distance=near_dup_distance,
+            save_probs=save_probs,
+            autotune=autotune,
+            precision=precision,
+            early_exit_threshold=early_exit_threshold,
+        )
+        if total_rows is not None:
+            print(f"✅ 预测完成！共 {total_rows} 条，结果已保存至: {OUTPUT_FILE}")
+        return
+
+    preview_choice = input("是否先显示分层抽样的快速预览 (几秒内给出带误差范围的估计，再逐轮补全)？(y/n，默认n): ").strip().lower()
+
+    embeddings_choice = 'n'
+    if backend in ("torch", "student") and preview_choice != 'y':
+        embeddings_choice = input("是否同时保存句向量并建立语义检索索引 (用于查找相似评论)？(y/n，默认n): ").strip().lower()
+
     # 调用流水线函数
-    df = run_prediction_pipeline(input_path=INPUT_FILE, output_path=OUTPUT_FILE)
+    df = run_prediction_pipeline(
+        input_path=INPUT_FILE,
+        output_path=OUTPUT_FILE,
+        backend=backend,
+        num_workers=num_workers,
+        cascade_threshold=cascade_threshold,
+        near_dup_distance=near_dup_distance,
+        save_probs=save_probs,
+        save_embeddings=embeddings_choice == 'y',
+        autotune=autotune,
+        precision=precision,
+        early_exit_threshold=early_exit_threshold,
+        on_preview=print_preview_report if preview_choice == 'y' else None,
+    )
     
     if df is not None:
         print(f"✅ 预测完成！结果已保存至: {OUTPUT_FILE}")
@@ -0,0 +1,283 @@
+"""
+语义检索索引："找出和这条相似的评论"
+
+run_prediction_pipeline 开启 save_embeddings 后，情感推理的同一次前向计算会顺带保存池化句向量
+(每个不同文本一条，float16)。本模块在其上建立本地向量索引：
+
+1. 去均值后取符号位，把 768 维向量量化为 96 字节的二值码；
+2. 查询时先用异或 + popcount 在全部二值码上做暴力汉明距离扫描 (向量化，安装了 faiss 时用
+   faiss.IndexBinaryFlat)，取出若干倍的候选；
+3. 再用原始句向量的余弦相似度对候选精排。
+
+百万条数据的二值码约 96 MB，可常驻内存；句向量以内存映射方式读取，只读取候选行。
+"""
+import sys
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+# This file is in src/analysis/, so PROJECT_ROOT is ../../
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+EMBEDDING_DTYPE = np.float16
+# 精排候选数 = k × RERANK_FACTOR (至少 MIN_CANDIDATES)
+RERANK_FACTOR = 20
+MIN_CANDIDATES = 200
+# 汉明扫描的分块行数，控制临时数组大小
+SCAN_BLOCK_ROWS = 1 << 14
+
+def _paths_for(output_path):
+    """输出 CSV 对应的索引文件：xxx.csv -> xxx.emb.npy / .emb_codes.npy / .emb_rows.npy / .emb_meta.json"""
+    output_path = Path(output_path)
+    stem = output_path.with_name(output_path.stem)
+    return {
+        'embeddings': Path(f"{stem}.emb.npy"),
+        'codes': Path(f"{stem}.emb_codes.npy"),
+        'rows': Path(f"{stem}.emb_rows.npy"),
+        'meta': Path(f"{stem}.emb_meta.json"),
+    }
+
+def index_exists(output_path):
+    """输出 CSV 是否已有语义索引"""
+    return all(path.exists() for path in _paths_for(output_path).values())
+
+def _normalize(vectors, mean):
+    vectors = np.asarray(vectors, dtype=np.float32) - mean
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def quantize(embeddings, mean, block_rows=SCAN_BLOCK_ROWS):
+    """
+    二值量化：去均值后取符号位，按行打包为 uint8
+
+    Returns:
+        np.ndarray，形状 (n, hidden_size / 8) 的 uint8
+    """
+    n, dim = embeddings.shape
+    codes = np.empty((n, (dim + 7) // 8), dtype=np.uint8)
+    for start in range(0, n, block_rows):
+        block = np.asarray(embeddings[start:start + block_rows], dtype=np.float32)
+        codes[start:start + block_rows] = np.packbits(block > mean, axis=1)
+    return codes
+
+def build_index(output_path, embeddings, row_codes, model_key=None, precision="fp32"):
+    """
+    保存句向量并建立索引
+
+    Args:
+        output_path: 输出 CSV 路径 (索引文件与之同名)
+        embeddings: np.ndarray，形状 (n_unique, hidden_size)，每个不同文本一条
+        row_codes: np.ndarray，形状 (n_rows,)，CSV 第 i 行对应的文本编号
+        model_key: str (可选)，生成句向量的模型指纹 (含 max_length，见 get_model_fingerprint)，查询时用于核对
+        precision: str，生成句向量时的推理精度 ("fp32" 或 "bf16")，查询时按同一精度编码
+
+    Returns:
+        Path，句向量文件路径
+    """
+    paths = _paths_for(output_path)
+    start = time.perf_counter()
+    store = np.lib.format.open_memmap(paths['embeddings'], mode='w+', dtype=EMBEDDING_DTYPE, shape=embeddings.shape)
+    store[:] = embeddings
+    store.flush()
+    del store
+
+    mean = np.zeros(embeddings.shape[1], dtype=np.float64)
+    for block_start in range(0, len(embeddings), SCAN_BLOCK_ROWS):
+        mean += np.asarray(embeddings[block_start:block_start + SCAN_BLOCK_ROWS], dtype=np.float64).sum(axis=0)
+    mean = (mean / max(1, len(embeddings))).astype(np.float32)
+    np.save(paths['codes'], quantize(embeddings, mean))
+    np.save(paths['rows'], np.asarray(row_codes, dtype=np.int64))
+    meta = {
+        'model_key': model_key,
+        'precision': precision,
+        'num_texts': int(len(embeddings)),
+        'num_rows': int(len(row_codes)),
+        'hidden_size': int(embeddings.shape[1]),
+        'mean': mean.tolist(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    paths['meta'].write_text(json.dumps(meta), encoding='utf-8')
+    print(f"🔎 Semantic index built for {len(embeddings)} texts in {time.perf_counter() - start:.2f}s")
+    return paths['embeddings']
+
+class SemanticIndex:
+    """
+    已保存的语义索引：二值码常驻内存，句向量内存映射
+
+    Example:
+        index = SemanticIndex.load("data/processed/xxx_predicted.csv")
+        hits = index.search(["这集剧情太好哭了"], model, tokenizer, k=10)[0]
+        for text_id, score in hits:
+            rows = index.rows_for(text_id)
+    """
+
+    def __init__(self, embeddings, codes, row_codes, mean, model_key=None, precision="fp32"):
+        self.embeddings = embeddings
+        self.codes = codes
+        self.row_codes = row_codes
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.model_key = model_key
+        self.precision = precision
+        self._row_order = None
+        self._sorted_codes = None
+        self._faiss_index = None
+        try:
+            import faiss
+            self._faiss_index = faiss.IndexBinaryFlat(codes.shape[1] * 8)
+            self._faiss_index.add(np.ascontiguousarray(codes))
+        except ImportError:
+            pass
+
+    @classmethod
+    def load(cls, output_path):
+        """
+        读取输出 CSV 对应的语义索引
+
+        Raises:
+            FileNotFoundError：索引不存在 (预测时需开启 save_embeddings)
+        """
+        paths = _paths_for(output_path)
+        if not index_exists(output_path):
+            raise FileNotFoundError(f"语义索引不存在: {paths['embeddings']} (预测时需开启 save_embeddings)")
+        meta = json.loads(paths['meta'].read_text(encoding='utf-8'))
+        return cls(
+            np.load(paths['embeddings'], mmap_mode='r'),
+            np.load(paths['codes']),
+            np.load(paths['rows'], mmap_mode='r'),
+            meta['mean'],
+            meta.get('model_key'),
+            meta.get('precision', "fp32"),
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _hamming_candidates(self, query_code, n_candidates):
+        """暴力汉明扫描，返回距离最小的 n_candidates 个文本编号"""
+        if self._faiss_index is not None:
+            _, ids = self._faiss_index.search(query_code[None, :], n_candidates)
+            return ids[0][ids[0] >= 0]
+
+        from src.analysis.near_dedup import _popcount
+
+        # 按 64 位字做异或与 popcount (码长不是 64 的倍数时按字节)
+        word = np.uint64 if self.codes.shape[1] % 8 == 0 else np.uint8
+        codes, query = self.codes.view(word), query_code.view(word)
+        distances = np.empty(len(codes), dtype=np.uint16)
+        # 分块并复用缓冲区，避免每次查询分配与全部二值码同样大的临时数组
+        xor_buffer = np.empty((min(SCAN_BLOCK_ROWS, len(codes)), codes.shape[1]), dtype=word)
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            xor = np.bitwise_xor(block, query, out=xor_buffer[:len(block)])
+            counts = _popcount(xor.reshape(-1)).reshape(len(block), -1)
+            total = distances[start:start + len(block)]
+            total[:] = counts[:, 0]
+            for column in range(1, counts.shape[1]):
+                total += counts[:, column]
+        if n_candidates >= len(distances):
+            return np.arange(len(distances))
+        return np.argpartition(distances, n_candidates)[:n_candidates]
+
+    def search_vectors(self, query_vectors, k=10):
+        """
+        按句向量检索
+
+        Args:
+            query_vectors: np.ndarray，形状 (m, hidden_size)
+            k: int，每条查询返回的结果数
+
+        Returns:
+            list of list of (text_id, score)：按余弦相似度降序
+        """
+        query_vectors = _normalize(np.atleast_2d(query_vectors), self.mean)
+        query_codes = np.packbits(query_vectors > 0, axis=1)
+        n_candidates = min(len(self), max(k * RERANK_FACTOR, MIN_CANDIDATES))
+        results = []
+        for query, query_code in zip(query_vectors, query_codes):
+            if n_candidates == 0:
+                results.append([])
+                continue
+            candidates = np.sort(self._hamming_candidates(query_code, n_candidates))
+            scores = _normalize(self.embeddings[candidates], self.mean) @ query
+            top = np.argsort(-scores)[:k]
+            results.append([(int(candidates[i]), float(scores[i])) for i in top])
+        return results
+
+    def search(self, texts, model, tokenizer, k=10, **predict_kwargs):
+        """
+        按文本检索：查询文本经同一模型编码 (需与建索引时的模型一致)
+
+        建索引时使用低精度推理的，查询时自动按同一精度编码。
+
+        Args:
+            texts: list of str，查询文本
+            model: 情感分类模型 (PyTorch)
+            tokenizer: 分词器
+            k: int，每条查询返回的结果数
+            **predict_kwargs: 传给 predict_proba 的其他参数 (如 max_length)
+
+        Returns:
+            list of list of (text_id, score)
+
+        Raises:
+            ValueError：查询模型 (含截断长度与精度) 与建索引时的不一致，句向量不可比
+        """
+        from src.analysis.inference import predict_proba, get_model_fingerprint, DEFAULT_MAX_LENGTH
+        from src.utils import normalize_texts
+        import pandas as pd
+
+        if self.precision == "bf16" and not (getattr(model, 'fingerprint', None) or '').endswith("-bf16"):
+            import torch
+            from src.analysis.precision import AutocastModel
+            model = AutocastModel(model, torch.bfloat16)
+        if self.model_key is not None:
+            query_key = get_model_fingerprint(model, predict_kwargs.get('max_length', DEFAULT_MAX_LENGTH))
+            if query_key != self.model_key:
+                raise ValueError(
+                    f"查询模型与建索引时的模型不一致 (索引 {self.model_key}，查询 {query_key})，"
+                    f"请使用同一模型、后端与截断长度"
+                )
+
+        texts = normalize_texts(pd.Series(list(texts), dtype=object)).tolist()
+        _, query_vectors = predict_proba(texts, model, tokenizer, show_progress=False, return_embeddings=True, **predict_kwargs)
+        return self.search_vectors(query_vectors, k)
+
+    def rows_for(self, text_id):
+        """某个文本编号对应的全部 CSV 行号 (同一文本可能出现多次)"""
+        if self._row_order is None:
+            row_codes = np.asarray(self.row_codes)
+            self._row_order = np.argsort(row_codes, kind='stable')
+            self._sorted_codes = row_codes[self._row_order]
+        lo, hi = np.searchsorted(self._sorted_codes, [text_id, text_id + 1])
+        return self._row_order[lo:hi]
+
+if __name__ == "__main__":
+    import pandas as pd
+    from src.analysis.model import get_model_and_tokenizer
+
+    processed_dir = PROJECT_ROOT / "data" / "processed"
+    candidates = sorted(p for p in processed_dir.glob("*.csv") if index_exists(p))
+    if not candidates:
+        print(f"❌ {processed_dir} 中没有语义索引，请在预测时开启 save_embeddings。")
+        raise SystemExit(1)
+    for i, path in enumerate(candidates, 1):
+        print(f"{i}. {path.name}")
+    choice = input("请选择要检索的结果文件 (按Enter选择第1个): ").strip()
+    output_path = candidates[int(choice) - 1 if choice else 0]
+
+    df = pd.read_csv(output_path, encoding='utf-8-sig')
+    index = SemanticIndex.load(output_path)
+    model, tokenizer = get_model_and_tokenizer()
+    while True:
+        query = input("请输入查询内容 (按Enter退出): ").strip()
+        if not query:
+            break
+        start = time.perf_counter()
+        hits = index.search([query], model, tokenizer, k=10)[0]
+        print(f"⏱️ {(time.perf_counter() - start) * 1000:.1f} ms")
+        for text_id, score in hits:
+            rows = index.rows_for(text_id)
+            print(f"   {score:.3f} | x{len(rows)} | {df['content'].iloc[rows[0]]}")
@@ -0,0 +1,196 @@
+"""
+多进程分片推理
+
+单个 PyTorch 进程的算子内并行在核数较多时很快就不再扩展。这里启动 N 个工作进程，
+每个进程加载一次模型并限制自身线程数，从共享队列领取批次，结果由主进程按原始顺序拼回。
+"""
+import os
+import queue
+import threading
+import traceback
+
+import numpy as np
+from tqdm import tqdm
+
+from src.analysis.inference import (
+    make_length_batches,
+    collate_batch,
+    DEFAULT_MAX_LENGTH,
+    DEFAULT_TOKEN_BUDGET,
+    DEFAULT_MAX_BATCH_SIZE,
+)
+
+def default_threads_per_worker(num_workers):
+    """按核数平分线程，每个工作进程至少 1 个线程"""
+    return max(1, (os.cpu_count() or 1) // num_workers)
+
+def _load_worker_model(model_path, backend, num_threads, precision="fp32"):
+    """在工作进程内加载模型"""
+    import torch
+    torch.set_num_threads(num_threads)
+
+    if backend == "onnx":
+        from src.analysis.onnx_backend import load_onnx_model
+        model, _ = load_onnx_model(model_path, num_threads=num_threads)
+        return model
+
+    # 启用且有冷启动缓存时直接加载追踪图与内存映射的权重，工作进程不必导入 transformers (见 model_cache.py)
+    from src.analysis.model import USE_COMPILED_CACHE
+    compiled = None
+    if USE_COMPILED_CACHE:
+        from src.analysis.model_cache import load_compiled_model
+        compiled = load_compiled_model(model_path)
+    if compiled is not None:
+        model = compiled[0]
+    else:
+        from transformers import AutoModelForSequenceClassification
+        model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+    if precision == "bf16":
+        # 主进程已确认 CPU 支持 bf16 并做过对比
+        from src.analysis.precision import AutocastModel
+        model = AutocastModel(model, torch.bfloat16)
+    return model
+
+def _worker_main(model_path, backend, num_threads, pad_token_id, with_token_type_ids, task_queue, result_queue, precision="fp32"):
+    """
+    工作进程入口：加载模型后循环领取批次，直到收到 None
+
+    任务格式：(batch_id, list of input_ids)
+    结果格式：(batch_id, probs) 或 (None, 错误信息)
+    """
+    try:
+        import torch
+        model = _load_worker_model(model_path, backend, num_threads, precision)
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            batch_id, batch_ids = task
+            inputs = collate_batch(batch_ids, range(len(batch_ids)), pad_token_id, with_token_type_ids)
+            with torch.no_grad():
+                logits = model(**inputs).logits
+            probs = torch.softmax(logits.float(), dim=-1).numpy()
+            result_queue.put((batch_id, probs))
+    except Exception:
+        result_queue.put((None, traceback.format_exc()))
+
+def _get_result(result_queue, workers):
+    """
+    取一个批次的结果；工作进程被系统杀死 (OOM、段错误) 时不会回报错误，这里轮询进程状态以免永远等待
+
+    Raises:
+        RuntimeError：有工作进程异常退出，或所有工作进程都已退出
+    """
+    while True:
+        try:
+            return result_queue.get(timeout=1)
+        except queue.Empty:
+            for i, w in enumerate(workers):
+                if w.exitcode is not None and w.exitcode != 0:
+                    raise RuntimeError(f"Inference worker {i} (pid {w.pid}) died with exit code {w.exitcode}")
+            if not any(w.is_alive() for w in workers):
+                raise RuntimeError("All inference workers exited before returning every batch")
+
+def predict_proba_sharded(
+    texts,
+    model_path,
+    tokenizer,
+    num_labels,
+    backend="torch",
+    num_workers=2,
+    threads_per_worker=None,
+    max_length=DEFAULT_MAX_LENGTH,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+    show_progress=True,
+    precision="fp32",
+):
+    """
+    多进程分片推理，返回各类别概率
+
+    主进程负责分词、按长度分桶组批和结果拼接；工作进程只做前向计算。
+
+    Args:
+        texts: list of str，待预测文本
+        model_path: 模型路径或 Hugging Face ID (各工作进程独立加载)
+        tokenizer: 分词器 (主进程使用)
+        num_labels: int，类别数
+        backend: str，"torch" 或 "onnx"
+        num_workers: int，工作进程数
+        threads_per_worker: int，每个工作进程的线程数 (默认按核数平分)
+        max_length / token_budget / max_batch_size: 同 predict_proba
+        show_progress: bool，是否显示进度条
+        precision: str，"fp32" 或 "bf16" (torch 后端，见 precision.py)
+
+    Returns:
+        np.ndarray，形状 (len(texts), num_labels) 的 float32 概率矩阵，行顺序与输入一致
+    """
+    import multiprocessing as mp
+
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, num_labels), dtype=np.float32)
+    if threads_per_worker is None:
+        threads_per_worker = default_threads_per_worker(num_workers)
+
+    if backend == "onnx":
+        # 先在主进程确保导出产物存在，避免多个工作进程同时导出
+        from src.analysis.onnx_backend import load_onnx_model
+        load_onnx_model(model_path, tokenizer=tokenizer)
+
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    input_ids = encodings['input_ids']
+    lengths = np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+    batches = make_length_batches(lengths, token_budget, max_batch_size)
+
+    ctx = mp.get_context("spawn")
+    # 有界队列：主进程不会一次性把全部批次塞进内存
+    task_queue = ctx.Queue(maxsize=num_workers * 4)
+    result_queue = ctx.Queue()
+    workers = [
+        ctx.Process(
+            target=_worker_main,
+            args=(
+                str(model_path), backend, threads_per_worker,
+                tokenizer.pad_token_id or 0, 'token_type_ids' in encodings,
+                task_queue, result_queue, precision,
+            ),
+            daemon=True,
+        )
+        for _ in range(num_workers)
+    ]
+    for w in workers:
+        w.start()
+    print(f"🧵 Started {num_workers} inference workers x {threads_per_worker} threads ({backend})")
+
+    stop_feeding = threading.Event()
+
+    def feed():
+        for batch_id, indices in enumerate(batches):
+            if stop_feeding.is_set():
+                return
+            task_queue.put((batch_id, [input_ids[i] for i in indices]))
+        for _ in workers:
+            task_queue.put(None)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    probs = np.empty((len(texts), num_labels), dtype=np.float32)
+    try:
+        for _ in tqdm(range(len(batches)), desc="Predicting (sharded)", disable=not show_progress):
+            batch_id, result = _get_result(result_queue, workers)
+            if batch_id is None:
+                raise RuntimeError(f"Inference worker failed:\n{result}")
+            # 按原始下标写回，完成顺序还原
+            probs[batches[batch_id]] = result
+    finally:
+        stop_feeding.set()
+        for w in workers:
+            w.join(timeout=5)
+            if w.is_alive():
+                w.terminate()
+        # 工作进程异常退出时队列里可能还有发不出去的批次，不要让解释器退出时等待它们
+        task_queue.cancel_join_thread()
+
+    return probs
@@ -15,6 +15,12 @@ DATA_RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
 COMMENT_SAVE_PATH = os.path.join(DATA_RAW_DIR, "comments.csv")
 DANMAKU_SAVE_PATH = os.path.join(DATA_RAW_DIR, "danmaku.csv")
 
+# ================= 请求频率控制 =================
+# 相邻两次请求之间的随机间隔 (秒)，所有爬虫共用，避免触发风控
+REQUEST_INTERVAL = (1.5, 3.5)
+# 发现爬虫 (关键词搜索 / UP主投稿) 的并发翻页线程数
+DISCOVERY_WORKERS = 4
+
 # ================= 请求头 =================
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -0,0 +1,384 @@
+import requests
+import time
+import csv
+import re
+import os
+import hashlib
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# 导入配置文件与公共请求节流
+try:
+    import config
+    from main_crawler import wait_for_rate_limit, crawl_comments_by_bv, crawl_danmaku_by_bv
+except ImportError:
+    from src.crawler import config
+    from src.crawler.main_crawler import wait_for_rate_limit, crawl_comments_by_bv, crawl_danmaku_by_bv
+
+# 清单文件表头 (批量工具按此读取)
+MANIFEST_FIELDS = ['bvid', 'title', 'author', 'mid', 'pubdate', 'play', 'duration', 'source', 'page']
+
+# ==================== WBI 签名 ====================
+# B站搜索与投稿列表接口需要 WBI 签名，混淆表来自网页端 JS
+MIXIN_KEY_ENC_TAB = [
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52
+]
+
+_wbi_cache = {'mixin_key': None, 'expire': 0}
+# 多个发现线程同时发现缓存过期时，只由一个线程刷新
+_wbi_lock = threading.Lock()
+# 签名被拒绝的返回码 (密钥在缓存期内轮换后旧签名失效)：刷新密钥后重试一次
+WBI_SIGNATURE_ERROR_CODES = (-352, -403)
+
+def get_wbi_mixin_key():
+    """
+    从 nav 接口获取 img_key/sub_key 并生成 mixin_key (缓存 1 小时)
+
+    Raises:
+        RuntimeError：nav 接口返回错误 (如 -412 风控)，没有 wbi_img
+    """
+    with _wbi_lock:
+        if _wbi_cache['mixin_key'] and time.time() < _wbi_cache['expire']:
+            return _wbi_cache['mixin_key']
+
+        url = "https://api.bilibili.com/x/web-interface/nav"
+        wait_for_rate_limit()
+        data = requests.get(url, headers=config.HEADERS, timeout=10).json()
+        # 未登录时 nav 返回 -101，但仍然带有 wbi_img
+        wbi_img = (data.get('data') or {}).get('wbi_img') if data.get('code') in (0, -101) else None
+        if not wbi_img:
+            raise RuntimeError(f"获取 WBI 签名密钥失败 (Code: {data.get('code')}): {data.get('message', 'Unknown error')}")
+        img_key = os.path.splitext(os.path.basename(wbi_img['img_url']))[0]
+        sub_key = os.path.splitext(os.path.basename(wbi_img['sub_url']))[0]
+        orig = img_key + sub_key
+        mixin_key = ''.join(orig[i] for i in MIXIN_KEY_ENC_TAB)[:32]
+
+        _wbi_cache['mixin_key'] = mixin_key
+        _wbi_cache['expire'] = time.time() + 3600
+        return mixin_key
+
+def invalidate_wbi_key(stale_key):
+    """签名被拒绝时丢弃缓存的 mixin_key (其他线程已经换成新密钥时不动)"""
+    with _wbi_lock:
+        if _wbi_cache['mixin_key'] == stale_key:
+            _wbi_cache['mixin_key'] = None
+            _wbi_cache['expire'] = 0
+
+def sign_wbi_params(params, mixin_key=None):
+    """为请求参数添加 wts 与 w_rid 签名 (默认使用缓存的 mixin_key)"""
+    mixin_key = mixin_key or get_wbi_mixin_key()
+    params = dict(params)
+    params['wts'] = round(time.time())
+    params = dict(sorted(params.items()))
+    # 过滤 value 中的 "!'()*" 字符
+    params = {
+        k: ''.join(ch for ch in str(v) if ch not in "!'()*")
+        for k, v in params.items()
+    }
+    query = urllib.parse.urlencode(params)
+    params['w_rid'] = hashlib.md5((query + mixin_key).encode()).hexdigest()
+    return params
+
+# ==================== 单页请求 ====================
+def _get_json(url, params, desc):
+    """
+    经过全局节流的 GET 请求，带重试机制；签名被拒绝时刷新 WBI 密钥后重试一次
+
+    Returns:
+        dict；请求失败或接口返回错误时返回 None
+    """
+    max_retries = 3
+    key_refreshed = False
+    for attempt in range(max_retries):
+        wait_for_rate_limit()
+        try:
+            mixin_key = get_wbi_mixin_key()
+            resp = requests.get(url, params=sign_wbi_params(params, mixin_key), headers=config.HEADERS, timeout=10)
+            data = resp.json()
+            if data.get('code') == 0:
+                return data.get('data') or {}
+            if data.get('code') in WBI_SIGNATURE_ERROR_CODES and not key_refreshed:
+                print(f"⚠️ {desc} 签名被拒绝 (Code: {data.get('code')})，刷新 WBI 密钥后重试")
+                invalidate_wbi_key(mixin_key)
+                key_refreshed = True
+                continue
+            print(f"⚠️ {desc} API 返回错误 (Code: {data.get('code')}): {data.get('message', 'Unknown error')}")
+            return None
+        except (requests.exceptions.SSLError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            print(f"⚠️ {desc} 网络错误 (尝试 {attempt+1}/{max_retries}): {e}")
+            time.sleep(1 * (attempt + 1))
+        except Exception as e:
+            print(f"❌ {desc} 请求失败: {e}")
+            return None
+
+    print(f"❌ {desc} 重试 {max_retries} 次后仍失败，跳过。")
+    return None
+
+def _strip_html(text):
+    """去掉搜索结果标题中的 <em class="keyword"> 高亮标签"""
+    return re.sub(r'<[^>]+>', '', text or '')
+
+def fetch_search_page(keyword, page, order="totalrank"):
+    """
+    获取关键词搜索的单页视频结果
+
+    Returns:
+        (list of dict, int)：本页视频记录与总页数；失败时返回 (None, 0)
+    """
+    url = "https://api.bilibili.com/x/web-interface/wbi/search/type"
+    params = {
+        "search_type": "video",
+        "keyword": keyword,
+        "order": order,
+        "page": page,
+    }
+    data = _get_json(url, params, f"搜索 '{keyword}' 第 {page} 页")
+    if data is None:
+        return None, 0
+
+    records = []
+    for item in data.get('result') or []:
+        if not item.get('bvid'):
+            continue
+        records.append({
+            'bvid': item['bvid'],
+            'title': _strip_html(item.get('title')),
+            'author': item.get('author', ''),
+            'mid': item.get('mid', ''),
+            'pubdate': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item.get('pubdate', 0))),
+            'play': item.get('play', 0),
+            'duration': item.get('duration', ''),
+            'source': f"keyword:{keyword}",
+            'page': page,
+        })
+    return records, int(data.get('numPages') or 0)
+
+def fetch_uploader_page(mid, page, page_size=30):
+    """
+    获取 UP 主投稿列表的单页结果
+
+    Returns:
+        (list of dict, int)：本页视频记录与总页数；失败时返回 (None, 0)
+    """
+    url = "https://api.bilibili.com/x/space/wbi/arc/search"
+    params = {
+        "mid": mid,
+        "pn": page,
+        "ps": page_size,
+        "order": "pubdate",
+    }
+    data = _get_json(url, params, f"UP主 {mid} 第 {page} 页")
+    if data is None:
+        return None, 0
+
+    records = []
+    for item in (data.get('list') or {}).get('vlist') or []:
+        if not item.get('bvid'):
+            continue
+        records.append({
+            'bvid': item['bvid'],
+            'title': item.get('title', ''),
+            'author': item.get('author', ''),
+            'mid': item.get('mid', mid),
+            'pubdate': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item.get('created', 0))),
+            'play': item.get('play', 0),
+            'duration': item.get('length', ''),
+            'source': f"uploader:{mid}",
+            'page': page,
+        })
+
+    page_info = data.get('page') or {}
+    total_count = int(page_info.get('count') or 0)
+    total_pages = (total_count + page_size - 1) // page_size
+    return records, total_pages
+
+# ==================== 并发翻页与去重 ====================
+def _discover(fetch_page, max_pages, desc, callback=None):
+    """
+    通用发现流程：先取第 1 页得到总页数，再并发抓取剩余页面，按页序去重
+
+    Args:
+        fetch_page: 函数，接受 page 返回 (records, total_pages)
+        max_pages: int，最多抓取的页数
+        desc: str，日志中的描述
+        callback: 一个函数，接受 (current_page, total_pages, msg)
+    """
+    start = time.time()
+    first, total_pages = fetch_page(1)
+    if first is None:
+        # 请求失败 (风控、签名失效、网络错误) 与确实没有结果分开报告
+        print(f"❌ {desc}: 第 1 页请求失败，本次没有抓取到任何视频 (可能被风控，请稍后重试)。")
+        return []
+    if not first:
+        print(f"⚠️ {desc}: 第 1 页无结果。")
+        return []
+
+    pages_to_fetch = min(max_pages, total_pages) if total_pages else 1
+    print(f"🔎 {desc}: 共 {total_pages} 页，本次抓取 {pages_to_fetch} 页")
+
+    results = {1: first}
+    done = 1
+    if callback:
+        callback(done, pages_to_fetch, f"已完成第 1/{pages_to_fetch} 页")
+
+    failed_pages = []
+    if pages_to_fetch > 1:
+        with ThreadPoolExecutor(max_workers=config.DISCOVERY_WORKERS) as executor:
+            futures = {executor.submit(fetch_page, page): page for page in range(2, pages_to_fetch + 1)}
+            for future in as_completed(futures):
+                page = futures[future]
+                records, _ = future.result()
+                if records is None:
+                    failed_pages.append(page)
+                results[page] = records or []
+                done += 1
+                if callback:
+                    callback(done, pages_to_fetch, f"已完成第 {done}/{pages_to_fetch} 页")
+
+    # 按页序合并并去重 (同一视频可能因排序变化出现在相邻两页)
+    seen = set()
+    unique = []
+    total_items = 0
+    for page in sorted(results):
+        for record in results[page]:
+            total_items += 1
+            if record['bvid'] in seen:
+                continue
+            seen.add(record['bvid'])
+            unique.append(record)
+
+    if failed_pages:
+        print(f"⚠️ {desc}: {len(failed_pages)} 页请求失败 (第 {', '.join(map(str, sorted(failed_pages)))} 页)，结果不完整。")
+    elapsed = time.time() - start
+    print(f"🎉 {desc}: {pages_to_fetch} 页 / {total_items} 条结果 / 去重后 {len(unique)} 个 BV")
+    print(f"⏱️ 耗时 {elapsed:.1f}s，吞吐 {pages_to_fetch / elapsed:.2f} 页/s，{len(unique) / elapsed:.2f} BV/s")
+    return unique
+
+def discover_by_keyword(keyword, max_pages=5, order="totalrank", callback=None):
+    """
+    根据关键词搜索视频，返回去重后的视频记录列表
+
+    Args:
+        keyword: str，搜索关键词
+        max_pages: int，最多抓取的搜索结果页数 (每页约 20 个视频)
+        order: str，排序方式 ("totalrank" 综合, "click" 播放, "pubdate" 最新, "dm" 弹幕)
+        callback: 一个函数，接受 (current_page, total_pages, msg)
+    """
+    return _discover(
+        lambda page: fetch_search_page(keyword, page, order=order),
+        max_pages, f"关键词 '{keyword}'", callback=callback
+    )
+
+def discover_by_uploader(mid, max_pages=5, callback=None):
+    """
+    根据 UP 主 UID 获取其投稿视频，返回去重后的视频记录列表
+
+    Args:
+        mid: str/int，UP 主 UID
+        max_pages: int，最多抓取的投稿列表页数 (每页 30 个视频)
+        callback: 一个函数，接受 (current_page, total_pages, msg)
+    """
+    return _discover(
+        lambda page: fetch_uploader_page(mid, page),
+        max_pages, f"UP主 {mid}", callback=callback
+    )
+
+# ==================== 清单读写 ====================
+def save_manifest(records, filename):
+    """
+    保存 BV 清单 (与已有清单合并去重)
+
+    Returns:
+        int，清单中新增的 BV 数量
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    existing = load_manifest(filename) if os.path.isfile(filename) else []
+    seen = {r['bvid'] for r in existing}
+    new_records = [r for r in records if r['bvid'] not in seen]
+
+    with open(filename, mode='a', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS, extrasaction='ignore')
+        if not existing:
+            writer.writeheader()
+        writer.writerows(new_records)
+    return len(new_records)
+
+def load_manifest(filename):
+    """读取 BV 清单，返回记录列表"""
+    with open(filename, mode='r', encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+def crawl_manifest(manifest_path, data_type="danmaku", max_pages=5, max_count=None):
+    """
+    按清单批量爬取评论或弹幕，输出到 data/raw/{comments|danmaku}_{BV}.csv
+
+    Args:
+        manifest_path: str，清单 CSV 路径
+        data_type: str，"comment" 或 "danmaku"
+        max_pages: int，每个视频的评论页数
+        max_count: int，每个视频的弹幕条数上限 (None 为不限制)
+
+    Returns:
+        dict，{bvid: 爬取条数}
+    """
+    records = load_manifest(manifest_path)
+    prefix = "comments" if data_type == "comment" else "danmaku"
+    results = {}
+    start = time.time()
+    for i, record in enumerate(records, 1):
+        bv = record['bvid']
+        output_path = os.path.join(config.DATA_RAW_DIR, f"{prefix}_{bv}.csv")
+        print(f"📦 [{i}/{len(records)}] {bv} {record.get('title', '')}")
+        try:
+            if data_type == "comment":
+                results[bv] = crawl_comments_by_bv(bv, max_pages, output_path)
+            else:
+                wait_for_rate_limit()
+                results[bv] = crawl_danmaku_by_bv(bv, max_count, output_path)
+        except Exception as e:
+            print(f"❌ {bv} 爬取失败: {e}")
+            results[bv] = 0
+
+    elapsed = time.time() - start
+    total = sum(results.values())
+    print(f"🎉 批量爬取结束！{len(records)} 个视频，共 {total} 条，耗时 {elapsed:.1f}s ({len(records) / max(elapsed, 1e-9):.2f} 视频/s)")
+    return results
+
+# ==================== 主程序 ====================
+if __name__ == "__main__":
+    print("=======================================")
+    print("   Bilibili 视频发现 - 生成 BV 清单")
+    print("=======================================")
+    print("1. 🔎 关键词搜索")
+    print("2. 👤 UP主投稿")
+    choice = input("👉 请输入数字 (1 或 2): ").strip()
+
+    max_pages = input("请输入抓取页数（按Enter使用默认值: 5）：").strip()
+    try:
+        max_pages = int(max_pages) if max_pages else 5
+    except ValueError:
+        print("⚠️ 输入无效，使用默认值 5")
+        max_pages = 5
+
+    if choice == '1':
+        keyword = input("请输入关键词: ").strip()
+        records = discover_by_keyword(keyword, max_pages)
+        slug = re.sub(r'[^\w-]+', '_', keyword)
+        manifest_name = f"manifest_keyword_{slug}.csv"
+    elif choice == '2':
+        mid = input("请输入 UP 主 UID: ").strip()
+        records = discover_by_uploader(mid, max_pages)
+        manifest_name = f"manifest_uploader_{mid}.csv"
+    else:
+        print("❌ 输入无效，程序退出。")
+        exit()
+
+    manifest_path = os.path.join(config.DATA_RAW_DIR, "manifests", manifest_name)
+    added = save_manifest(records, manifest_path)
+    print(f"📂 清单已保存: {manifest_path} (新增 {added} 个 BV)")
+
+    if records and input("是否立即按清单批量爬取弹幕？(y/n，默认n): ").strip().lower() == 'y':
+        crawl_manifest(manifest_path, data_type="danmaku")
@@ -5,12 +5,32 @@ import random
 import re
 import os
 import json
+import threading
 # 导入配置文件
 try:
     import config
 except ImportError:
     from src.crawler import config
 
+# ==================== 请求频率控制 ====================
+_rate_lock = threading.Lock()
+_next_request_time = 0.0
+
+def wait_for_rate_limit():
+    """
+    全局请求节流 (线程安全)
+    
+    保证任意两次请求的发起时间至少间隔 config.REQUEST_INTERVAL 中的随机秒数，
+    多线程并发翻页时也只是排队等待，不会突破频率限制。
+    """
+    global _next_request_time
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_request_time - now
+        _next_request_time = max(now, _next_request_time) + random.uniform(*config.REQUEST_INTERVAL)
+    if wait > 0:
+        time.sleep(wait)
+
 def check_cookie():
     """检查 Cookie 是否有效"""
     url = "https://api.bilibili.com/x/web-interface/nav"
@@ -260,6 +280,7 @@ def crawl_comments_by_bv(bv_code, max_pages=None, output_path=None, callback=Non
         if callback:
             callback(page, max_pages, msg)
             
+        wait_for_rate_limit()
         replies = fetch_comments(oid, page)
         if not replies:
             print("⚠️ 本页无数据或已爬完。")
@@ -267,7 +288,6 @@ def crawl_comments_by_bv(bv_code, max_pages=None, output_path=None, callback=Non
             break
         saved_count = save_comments_to_csv(replies, filename=output_path)
         total_saved += saved_count
-        time.sleep(random.uniform(1.5, 3.5))
         
     print(f"🎉 [API] 评论爬取结束！共 {total_saved} 条。")
     if callback: callback(max_pages, max_pages, f"✅ 爬取结束！共 {total_saved} 条。")
@@ -366,13 +386,13 @@ if __name__ == "__main__":
         total_saved = 0
         for page in range(1, max_pages + 1):
             print(f"📄 第 {page} 页...")
+            wait_for_rate_limit()
             replies = fetch_comments(oid, page)
             if not replies:
                 print("⚠️ 本页无数据或已爬完。")
                 break
             saved_count = save_comments_to_csv(replies, filename=config.COMMENT_SAVE_PATH)
             total_saved += saved_count
-            time.sleep(random.uniform(1.5, 3.5))
         print(f"\n🎉 评论爬取结束！共 {total_saved} 条。")
         print(f"📂 保存路径: {config.COMMENT_SAVE_PATH}")
 
@@ -17,11 +17,23 @@ from .data_loader import (
 from .time_series import (
     SENTIMENT_WEIGHTS,
     calculate_sentiment_index,
+    calculate_expected_sentiment,
     aggregate_by_time,
     calculate_confidence_interval,
     get_sentiment_color,
     get_sentiment_label,
 )
+from .prob_store import (
+    probs_path_for,
+    save_probs,
+    load_probs,
+    low_confidence_mask,
+)
+from .text_normalizer import (
+    strip_reply_prefix,
+    normalize_texts,
+    normalize_text,
+)
 
 __all__ = [
     'EMOTION_MAP',
@@ -35,8 +47,16 @@ __all__ = [
     'get_emotion_distribution_percent',
     'SENTIMENT_WEIGHTS',
     'calculate_sentiment_index',
+    'calculate_expected_sentiment',
     'aggregate_by_time',
     'calculate_confidence_interval',
     'get_sentiment_color',
     'get_sentiment_label',
+    'probs_path_for',
+    'save_probs',
+    'load_probs',
+    'low_confidence_mask',
+    'strip_reply_prefix',
+    'normalize_texts',
+    'normalize_text',
 ]
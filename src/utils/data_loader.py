@@ -16,32 +16,47 @@ def get_project_root():
 PROJECT_ROOT = get_project_root()
 DATA_PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 
-def load_dataset(data_type="comment"):
+DATASET_SPLITS = ("train", "validation")
+
+def load_dataset(data_type="comment", splits=DATASET_SPLITS, columns=None, as_arrow=False, keep_in_memory=False):
     """
     加载预处理后的数据集
     
+    各个划分在 Arrow 层拼接，不会把 token 列表转成 Python 对象：默认直接内存映射磁盘上的
+    Arrow 文件，返回的 DataFrame 各列为 pd.ArrowDtype (嵌套的 input_ids 为 list<int> 列)，
+    数据仍由 Arrow 持有，构建过程几乎不占额外内存。
+    
     Args:
         data_type: str，数据类型 "comment" 或 "danmaku"
+        splits: 要拼接的划分，按顺序排列 (不存在的划分会被跳过)
+        columns: list of str (可选)，只加载这些列，默认全部
+        as_arrow: bool，为 True 时返回拼接后的 datasets.Dataset (可直接 set_format("torch") 用于训练)
+        keep_in_memory: bool，为 True 时把数据读入内存，否则内存映射 (默认)
         
     Returns:
-        pd.DataFrame，加载的数据
+        pd.DataFrame (各列为 pd.ArrowDtype)；as_arrow=True 时返回 datasets.Dataset
     """
     dataset_path = DATA_PROCESSED_DIR / f"{data_type}_tokenized_dataset"
     
     if not dataset_path.exists():
         raise FileNotFoundError(f"数据集不存在: {dataset_path}")
     
-    from datasets import load_from_disk
-    ds = load_from_disk(str(dataset_path))
+    from datasets import load_from_disk, concatenate_datasets
+    ds = load_from_disk(str(dataset_path), keep_in_memory=keep_in_memory)
     
-    # 转换为 DataFrame
-    df = pd.DataFrame({
-        'input_ids': ds['train']['input_ids'] + ds['validation']['input_ids'],
-        'labels': ds['train']['labels'] + ds['validation']['labels'],
-        'extra': ds['train']['extra'] + ds['validation']['extra'],
-    })
+    parts = [ds[split] for split in splits if split in ds]
+    if not parts:
+        raise ValueError(f"数据集中没有这些划分: {list(splits)} (现有: {list(ds.keys())})")
+    if columns is not None:
+        parts = [part.select_columns(list(columns)) for part in parts]
+    # 只拼接 Arrow 表的分块，不复制数据
+    combined = concatenate_datasets(parts)
+    if as_arrow:
+        return combined
     
-    return df
+    # 整表切片在没有索引映射时是零拷贝的
+    table = combined.with_format("arrow")[:]
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 def add_emotion_labels(df, emotion_mapping=None):
     """
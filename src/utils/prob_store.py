@@ -0,0 +1,90 @@
+"""
+预测概率的持久化存储
+
+run_prediction_pipeline 可以把每行的完整 softmax 分布以 float16 写入与输出 CSV 同名的
+.probs.npy 文件 (第 i 行对应 CSV 第 i 条数据)。下游用内存映射方式读取，
+调整情感权重、计算期望情感分或筛选低置信度行都不需要重新推理。
+"""
+from pathlib import Path
+
+import numpy as np
+
+PROBS_DTYPE = np.float16
+# 流式写入时分块复制的大小 (行)
+COPY_BLOCK_ROWS = 1 << 16
+
+def probs_path_for(output_path):
+    """输出 CSV 对应的概率文件路径：xxx.csv -> xxx.probs.npy"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.stem + ".probs.npy")
+
+def save_probs(output_path, probs):
+    """
+    将概率矩阵以 float16 写入 .probs.npy
+
+    Args:
+        output_path: 输出 CSV 路径 (概率文件与之同名)
+        probs: np.ndarray，形状 (n_rows, num_labels)
+
+    Returns:
+        Path，概率文件路径
+    """
+    path = probs_path_for(output_path)
+    store = np.lib.format.open_memmap(path, mode='w+', dtype=PROBS_DTYPE, shape=probs.shape)
+    store[:] = probs
+    store.flush()
+    del store
+    return path
+
+def load_probs(output_path, mmap_mode='r'):
+    """
+    以内存映射方式读取概率矩阵 (不会把整个文件读入内存)
+
+    Args:
+        output_path: 输出 CSV 路径，或直接传入 .probs.npy 路径
+        mmap_mode: str，np.load 的 mmap_mode
+
+    Returns:
+        np.memmap，形状 (n_rows, num_labels) 的 float16 数组
+    """
+    path = Path(output_path)
+    if not path.name.endswith(".probs.npy"):
+        path = probs_path_for(path)
+    if not path.exists():
+        raise FileNotFoundError(f"概率文件不存在: {path} (预测时需开启 save_probs)")
+    return np.load(path, mmap_mode=mmap_mode)
+
+def partial_probs_path_for(output_path):
+    """流式写入过程中的原始字节文件 (无 .npy 头)"""
+    path = probs_path_for(output_path)
+    return path.with_name(path.name + ".part")
+
+def finalize_probs(output_path, num_labels):
+    """
+    流式写入结束后，把原始字节文件转换为 .npy (分块复制，内存占用恒定)
+
+    Returns:
+        Path，概率文件路径
+    """
+    part_path = partial_probs_path_for(output_path)
+    row_bytes = num_labels * np.dtype(PROBS_DTYPE).itemsize
+    n_rows = part_path.stat().st_size // row_bytes
+    raw = np.memmap(part_path, dtype=PROBS_DTYPE, mode='r', shape=(n_rows, num_labels)) if n_rows else None
+
+    path = probs_path_for(output_path)
+    store = np.lib.format.open_memmap(path, mode='w+', dtype=PROBS_DTYPE, shape=(n_rows, num_labels))
+    for start in range(0, n_rows, COPY_BLOCK_ROWS):
+        store[start:start + COPY_BLOCK_ROWS] = raw[start:start + COPY_BLOCK_ROWS]
+    store.flush()
+    del store, raw
+    part_path.unlink()
+    return path
+
+def low_confidence_mask(probs, threshold=0.5):
+    """
+    低置信度行：最大类别概率低于阈值
+
+    Returns:
+        np.ndarray of bool，形状 (n_rows,)
+    """
+    return np.asarray(probs).max(axis=-1) < threshold
@@ -0,0 +1,151 @@
+"""
+评论/弹幕文本规范化
+
+用于模型输入和去重键：去掉回复前缀、统一 B 站表情写法、压缩长串重复字符、
+统一全角/半角与空白。所有操作都是预编译正则 + pandas 字符串方法，整列一次处理，
+不再逐行调用 Python lambda；重复的原文只处理一次。
+"""
+import re
+import time
+
+import pandas as pd
+
+# 开头可选的"回复"，@用户名 (非贪婪)，中英文冒号及后续空格
+REPLY_PREFIX_PATTERN = re.compile(r'^(?:回复\s*)?@.*?[：:]\s*')
+# B 站方括号表情，如 [doge]、[笑哭]、[tv_微笑]、[热词系列_妙啊]
+EMOTE_PATTERN = re.compile(r'\[([^\[\]\s]{1,16})\]')
+# 表情系列前缀：同一个表情在不同系列里写法不同
+EMOTE_PREFIX_PATTERN = re.compile(r'^(?:tv_|小电视_|热词系列_|2233娘_|蛆音娘_)', re.IGNORECASE)
+# 同一字符连续出现 4 次及以上 (哈哈哈哈哈、66666、？？？？)
+CHAR_REPEAT_PATTERN = re.compile(r'(.)\1{3,}')
+# 2~4 个字符组成的片段连续重复 3 次及以上 (awslawslawsl、好耶好耶好耶)
+UNIT_REPEAT_PATTERN = re.compile(r'(.{2,4}?)\1{2,}')
+# 零宽字符
+ZERO_WIDTH_PATTERN = re.compile(r'[\u200b-\u200f\u2060\ufeff]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# 单个字符重复压缩后保留的次数 ("哈哈哈" 仍保留语气)
+CHAR_REPEAT_KEEP = 3
+# 重复片段压缩后保留的次数
+UNIT_REPEAT_KEEP = 2
+
+# 表情别名 -> 统一名称 (去掉系列前缀、转小写之后再查表)
+EMOTE_ALIASES = {
+    'doge_金箍': 'doge',
+    '狗头': 'doge',
+    '哭泣': '大哭',
+    '愤怒': '生气',
+    '赞': '点赞',
+    '问号': '疑惑',
+}
+
+def strip_reply_prefix(series):
+    """
+    去掉开头的 "回复 @xxx :" 或 "@xxx :" 并去除首尾空白
+
+    Args:
+        series: pd.Series of str
+
+    Returns:
+        pd.Series
+    """
+    return series.str.replace(REPLY_PREFIX_PATTERN, '', regex=True).str.strip()
+
+def _canonical_emote(match):
+    name = EMOTE_PREFIX_PATTERN.sub('', match.group(1)).lower()
+    return f"[{EMOTE_ALIASES.get(name, name)}]"
+
+def normalize_texts(texts, map_emotes=True, collapse_repeats=True, normalize_width=True):
+    """
+    规范化一列文本，作为模型输入与去重键
+
+    Args:
+        texts: pd.Series 或 list of str
+        map_emotes: bool，是否统一方括号表情写法 ([tv_doge]、[狗头] -> [doge])
+        collapse_repeats: bool，是否压缩长串重复 (哈哈哈哈哈哈 -> 哈哈哈)
+        normalize_width: bool，是否做 NFKC 规范化 (全角字母数字标点转半角)
+
+    Returns:
+        pd.Series，索引与输入一致
+    """
+    original = texts if isinstance(texts, pd.Series) else pd.Series(list(texts), dtype=object)
+    # 弹幕重复率很高，先按原文去重，只规范化不同的文本，最后按编码映射回各行
+    codes, uniques = pd.factorize(original.fillna("").astype(str))
+    series = pd.Series(uniques, dtype=object)
+
+    if normalize_width:
+        series = series.str.normalize('NFKC')
+    series = series.str.replace(ZERO_WIDTH_PATTERN, '', regex=True)
+    series = strip_reply_prefix(series)
+    if map_emotes:
+        series = series.str.replace(EMOTE_PATTERN, _canonical_emote, regex=True)
+    if collapse_repeats:
+        series = series.str.replace(CHAR_REPEAT_PATTERN, r'\1' * CHAR_REPEAT_KEEP, regex=True)
+        series = series.str.replace(UNIT_REPEAT_PATTERN, r'\1' * UNIT_REPEAT_KEEP, regex=True)
+    series = series.str.replace(WHITESPACE_PATTERN, ' ', regex=True).str.strip()
+    return pd.Series(series.to_numpy(dtype=object)[codes], index=original.index, dtype=object)
+
+def normalize_text(text, **kwargs):
+    """规范化单条文本 (参数同 normalize_texts)"""
+    return normalize_texts([text], **kwargs).iloc[0]
+
+def benchmark_normalization(texts, repeat=3):
+    """
+    对比旧的逐行清洗 (df.apply + re.sub) 与 normalize_texts 的吞吐量和去重效果
+
+    Args:
+        texts: list of str，样本文本
+        repeat: int，重复次数，取最快的一次
+
+    Returns:
+        dict，{rows, legacy_rows_per_sec, rows_per_sec, legacy_unique, unique}
+    """
+    series = pd.Series(list(texts), dtype=object)
+
+    def legacy():
+        cleaned = series.apply(lambda x: re.sub(r'^(?:回复\s*)?@.*?[：:]\s*', '', x).strip())
+        return cleaned.str.replace(r'\s+', ' ', regex=True)
+
+    def best_of(fn):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    legacy_time, legacy_result = best_of(legacy)
+    new_time, new_result = best_of(lambda: normalize_texts(series))
+
+    report = {
+        'rows': len(series),
+        'legacy_rows_per_sec': len(series) / legacy_time if legacy_time else float('inf'),
+        'rows_per_sec': len(series) / new_time if new_time else float('inf'),
+        'legacy_unique': int(legacy_result.nunique()),
+        'unique': int(new_result.nunique()),
+    }
+    print(
+        f"⚡ legacy apply: {report['legacy_rows_per_sec']:.0f} rows/s | "
+        f"normalize_texts: {report['rows_per_sec']:.0f} rows/s"
+    )
+    print(
+        f"🧮 unique model inputs: {report['legacy_unique']} -> {report['unique']} "
+        f"(duplicate rate {1 - report['legacy_unique'] / max(1, report['rows']):.1%} -> "
+        f"{1 - report['unique'] / max(1, report['rows']):.1%})"
+    )
+    return report
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    raw_dir = Path(__file__).resolve().parent.parent.parent / "data" / "raw"
+    texts = []
+    for csv_path in sorted(raw_dir.glob("*.csv")):
+        df = pd.read_csv(csv_path, encoding='utf-8-sig', on_bad_lines='skip')
+        if 'content' in df.columns:
+            texts.extend(df['content'].dropna().astype(str).tolist())
+    if not texts:
+        print(f"❌ {raw_dir} 中没有可用于测试的数据，请先运行爬虫。")
+        raise SystemExit(1)
+    benchmark_normalization(texts)
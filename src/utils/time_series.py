@@ -43,11 +43,35 @@ def calculate_sentiment_index(emotion_codes: List[int], weights: Dict = None) ->
     avg_weight = total_weight / len(emotion_codes)
     return round(avg_weight, 4)
 
+def calculate_expected_sentiment(probs: np.ndarray, weights: Dict = None) -> np.ndarray:
+    """
+    按类别概率计算每行的期望情感分 (概率加权，而不是只看 argmax)
+    
+    Args:
+        probs: np.ndarray，形状 (n, num_labels) 的概率矩阵 (可以是 load_probs 返回的内存映射)
+        weights: dict，情感权重映射（默认使用 SENTIMENT_WEIGHTS）
+        
+    Returns:
+        np.ndarray，形状 (n,) 的期望情感分 (-3.0 到 +3.0)
+        
+    示例：
+        >>> calculate_expected_sentiment(np.array([[0.5, 0, 0, 0, 0, 0, 0.5, 0]]))
+        array([0.])  # 0.5 × (-3) + 0.5 × 3
+    """
+    if weights is None:
+        weights = SENTIMENT_WEIGHTS
+    
+    probs = np.asarray(probs)
+    weight_vector = np.array([weights.get(code, 0) for code in range(probs.shape[-1])], dtype=np.float32)
+    return probs.astype(np.float32) @ weight_vector
+
 def aggregate_by_time(
     df: pd.DataFrame,
     time_column: str,
     emotion_column: str,
     freq: str = 'W',  # 'D'=日, 'W'=周, 'M'=月, 'H'=小时
+    probs: np.ndarray = None,
+    weights: Dict = None,
 ) -> pd.DataFrame:
     """
     按时间分段聚合情感指数
@@ -57,6 +81,9 @@ def aggregate_by_time(
         time_column: str，时间列名
         emotion_column: str，情感列名
         freq: str，时间频率 ('D'=日, 'W'=周, 'M'=月, 'H'=小时)
+        probs: np.ndarray (可选)，与 df 行对齐的类别概率 (见 src.utils.prob_store.load_probs)；
+            传入时按概率加权的期望情感分聚合，不再只看 emotion_column 的 argmax 标签
+        weights: dict，情感权重映射（默认使用 SENTIMENT_WEIGHTS）
         
     Returns:
         DataFrame，包含时间和情感指数等统计信息
@@ -66,9 +93,16 @@ def aggregate_by_time(
         2024-11-01       0.33             3      0.89
         2024-11-08       0.67             5      1.23
     """
+    if weights is None:
+        weights = SENTIMENT_WEIGHTS
+    
     # 确保时间列是 datetime 类型
     df = df.copy()
     df[time_column] = pd.to_datetime(df[time_column])
+    if probs is not None:
+        if len(probs) != len(df):
+            raise ValueError(f"probs 行数 ({len(probs)}) 与数据行数 ({len(df)}) 不一致")
+        df['_expected_sentiment'] = calculate_expected_sentiment(probs, weights)
     
     # 按时间分组
     grouped = df.groupby(pd.Grouper(key=time_column, freq=freq))
@@ -77,20 +111,24 @@ def aggregate_by_time(
     results = []
     for time_label, group in grouped:
         if len(group) > 0:
-            emotion_codes = group[emotion_column].tolist()
-            sentiment_index = calculate_sentiment_index(emotion_codes)
+            if probs is not None:
+                scores = group['_expected_sentiment'].tolist()
+                sentiment_index = round(float(np.mean(scores)), 4)
+            else:
+                emotion_codes = group[emotion_column].tolist()
+                sentiment_index = calculate_sentiment_index(emotion_codes, weights)
+                scores = [weights.get(code, 0) for code in emotion_codes]
             
             # 计算标准差（用于置信区间）
-            weights = [SENTIMENT_WEIGHTS.get(code, 0) for code in emotion_codes]
-            std = np.std(weights) if len(weights) > 1 else 0.0
+            std = np.std(scores) if len(scores) > 1 else 0.0
             
             results.append({
                 'time': time_label,
                 'sentiment_index': sentiment_index,
                 'count': len(group),
                 'std': round(std, 4),
-                'min': min(weights),
-                'max': max(weights),
+                'min': min(scores),
+                'max': max(scores),
             })
     
     return pd.DataFrame(results)
@@ -99,7 +137,9 @@ def aggregate_by_numeric(
     df: pd.DataFrame,
     numeric_column: str,
     emotion_column: str,
-    bin_size: float = 30.0
+    bin_size: float = 30.0,
+    probs: np.ndarray = None,
+    weights: Dict = None,
 ) -> pd.DataFrame:
     """
     按数值区间分段聚合情感指数 (例如视频进度)
@@ -109,11 +149,20 @@ def aggregate_by_numeric(
         numeric_column: str，数值列名 (如 video_time)
         emotion_column: str，情感列名
         bin_size: float，分箱大小 (默认30)
+        probs / weights: 同 aggregate_by_time
         
     Returns:
         DataFrame
     """
+    if weights is None:
+        weights = SENTIMENT_WEIGHTS
+    
     df = df.copy()
+    if probs is not None:
+        if len(probs) != len(df):
+            raise ValueError(f"probs 行数 ({len(probs)}) 与数据行数 ({len(df)}) 不一致")
+        # 在丢弃无效行之前对齐概率
+        df['_expected_sentiment'] = calculate_expected_sentiment(probs, weights)
     # 确保数值列是数字类型
     df[numeric_column] = pd.to_numeric(df[numeric_column], errors='coerce')
     df = df.dropna(subset=[numeric_column])
@@ -126,19 +175,23 @@ def aggregate_by_numeric(
     results = []
     for bin_start, group in grouped:
         if len(group) > 0:
-            emotion_codes = group[emotion_column].tolist()
-            sentiment_index = calculate_sentiment_index(emotion_codes)
+            if probs is not None:
+                scores = group['_expected_sentiment'].tolist()
+                sentiment_index = round(float(np.mean(scores)), 4)
+            else:
+                emotion_codes = group[emotion_column].tolist()
+                sentiment_index = calculate_sentiment_index(emotion_codes, weights)
+                scores = [weights.get(code, 0) for code in emotion_codes]
             
-            weights = [SENTIMENT_WEIGHTS.get(code, 0) for code in emotion_codes]
-            std = np.std(weights) if len(weights) > 1 else 0.0
+            std = np.std(scores) if len(scores) > 1 else 0.0
             
             results.append({
                 'time': bin_start, # 为了兼容 plot_timeline，这里用 time 作为 x 轴
                 'sentiment_index': sentiment_index,
                 'count': len(group),
                 'std': round(std, 4),
-                'min': min(weights),
-                'max': max(weights),
+                'min': min(scores),
+                'max': max(scores),
             })
             
     return pd.DataFrame(results).sort_values('time')
@@ -245,6 +298,7 @@ def get_sentiment_label(sentiment_index: float) -> str:
 __all__ = [
     'SENTIMENT_WEIGHTS',
     'calculate_sentiment_index',
+    'calculate_expected_sentiment',
     'aggregate_by_time',
     'calculate_confidence_interval',
     'get_sentiment_color',
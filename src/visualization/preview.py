@@ -0,0 +1,86 @@
+"""
+快速预览可视化模块
+用误差线展示分层抽样估计的情感分布与时间趋势 (见 src/analysis/preview.py)
+"""
+import matplotlib.pyplot as plt
+import matplotlib as mpl
+import numpy as np
+import pandas as pd
+
+# 设置中文字体
+mpl.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
+mpl.rcParams['axes.unicode_minus'] = False
+
+from ..utils import get_emotion_color
+
+def _plot_trend(ax, trend, x, xlabel):
+    """带 95% 置信区间误差线的趋势图"""
+    sentiments = trend['sentiment_index'].to_numpy()
+    yerr = np.vstack([sentiments - trend['lower'].to_numpy(), trend['upper'].to_numpy() - sentiments])
+    ax.axhspan(-3, 0, alpha=0.1, color='red')
+    ax.axhspan(0, 3, alpha=0.1, color='green')
+    ax.axhline(y=0, color='gray', linestyle='--', linewidth=1, alpha=0.5)
+    ax.errorbar(x, sentiments, yerr=yerr, fmt='o-', color='steelblue', ecolor='gray', capsize=3, label='估计值 ± 95% 置信区间')
+    ax.set_ylim(-3.5, 3.5)
+    ax.set_ylabel('情感指数', fontsize=12)
+    ax.set_xlabel(xlabel, fontsize=12)
+    ax.grid(axis='y', alpha=0.3, linestyle='--')
+    ax.legend(loc='upper left', fontsize=10)
+
+def plot_preview(estimate, figsize_per_row=(14, 4), title='快速预览 (抽样估计)'):
+    """
+    绘制快速预览：各情感占比与情感随时间 / 视频进度的变化，误差线为抽样误差的 95% 置信区间
+
+    Args:
+        estimate: dict，PreviewEstimator.estimate 的返回值
+        figsize_per_row: tuple，每个子图的大小
+        title: str，图表标题
+
+    Returns:
+        fig, axes：matplotlib 图表对象
+    """
+    trends = [
+        (estimate[key], xlabel)
+        for key, xlabel in (('timeline', '发布时间'), ('progress', '视频进度 (分钟)'))
+        if estimate.get(key) is not None and len(estimate[key]) > 0
+    ]
+    fig, axes = plt.subplots(1 + len(trends), 1, figsize=(figsize_per_row[0], figsize_per_row[1] * (1 + len(trends))), squeeze=False)
+    axes = axes[:, 0]
+    fig.suptitle(
+        f"{title}：{estimate['sampled']} / {estimate['total']} 条 ({estimate['fraction']:.1%})",
+        fontsize=16, fontweight='bold'
+    )
+
+    # ========== 情感分布 ==========
+    distribution = estimate['distribution']
+    percentages = distribution['proportion'].to_numpy() * 100
+    yerr = np.vstack([
+        percentages - distribution['lower'].to_numpy() * 100,
+        distribution['upper'].to_numpy() * 100 - percentages,
+    ])
+    axes[0].bar(
+        distribution['emotion'],
+        percentages,
+        yerr=yerr,
+        capsize=4,
+        color=[get_emotion_color(code) for code in distribution['label']],
+        edgecolor='black',
+        alpha=0.8,
+    )
+    for i, pct in enumerate(percentages):
+        axes[0].text(i, pct + yerr[1, i] + 0.5, f'{pct:.1f}%', ha='center', va='bottom', fontsize=9)
+    index, lower, upper = estimate['sentiment_index']
+    axes[0].set_title(f"情感指数 {index:.2f} (95% 置信区间 {lower:.2f} ~ {upper:.2f})", fontsize=12)
+    axes[0].set_ylabel('占比 (%)', fontsize=12)
+    axes[0].grid(axis='y', alpha=0.3, linestyle='--')
+
+    # ========== 时间趋势 ==========
+    for ax, (trend, xlabel) in zip(axes[1:], trends):
+        if xlabel == '发布时间':
+            _plot_trend(ax, trend, pd.to_datetime(trend['time']), xlabel)
+            ax.tick_params(axis='x', labelrotation=30)
+        else:
+            _plot_trend(ax, trend, trend['time'].to_numpy() / 60, xlabel)
+
+    plt.tight_layout()
+    return fig, axes
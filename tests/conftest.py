@@ -0,0 +1,36 @@
+"""
+测试共用的夹具：一个随机初始化的极小 BERT 情感模型 (不需要下载)
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+CHARS = "前方高能哈这个视频太厉害了感动哭我是不是来晚好耶泪目笑死经典名场面啊吧呢！？。，"
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory):
+    """(model, tokenizer)：8 分类、单层、隐藏维度 16 的随机 BERT，按字分词"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    vocab_file = tmp_path_factory.mktemp("tiny_bert") / "vocab.txt"
+    vocab_file.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *CHARS, *"0123456789"]), encoding="utf-8")
+    tokenizer = transformers.BertTokenizerFast(str(vocab_file))
+    config = transformers.BertConfig(
+        vocab_size=tokenizer.vocab_size,
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=128,
+        num_labels=8,
+        # 较大的初始化让不同文本的输出明显不同，行顺序错了测试才能发现
+        initializer_range=0.5,
+    )
+    torch.manual_seed(0)
+    model = transformers.BertForSequenceClassification(config).eval()
+    return model, tokenizer
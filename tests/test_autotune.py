@@ -0,0 +1,31 @@
+"""
+自动调优：首次校准后按主机缓存；只读缓存模式不校准、不改动线程设置
+"""
+import torch
+
+from src.analysis import autotune
+
+def test_get_tuning_calibrates_once_and_cached_mode_never_calibrates(tiny_model, tmp_path, monkeypatch):
+    model, tokenizer = tiny_model
+    monkeypatch.setattr(autotune, "AUTOTUNE_CACHE_PATH", tmp_path / "autotune.json")
+    monkeypatch.setattr(autotune, "default_thread_candidates", lambda: [1])
+    calls = []
+    calibrate = autotune.calibrate
+    monkeypatch.setattr(autotune, "calibrate", lambda *args, **kwargs: calls.append(1) or calibrate(*args, **kwargs))
+    threads = torch.get_num_threads()
+
+    try:
+        assert autotune.get_tuning(model, tokenizer, calibrate_if_missing=False) is None
+        assert calls == [] and torch.get_num_threads() == threads
+
+        tuning = autotune.get_tuning(model, tokenizer)
+        assert len(calls) == 1
+        assert tuning['intra_op_threads'] == 1
+        assert tuning['token_budget'] in {rows * tuning['max_length'] for rows in autotune.BUDGET_ROWS_CANDIDATES}
+
+        # 之后两种模式都直接读缓存
+        assert autotune.get_tuning(model, tokenizer) == tuning
+        assert autotune.get_tuning(model, tokenizer, calibrate_if_missing=False) == tuning
+        assert len(calls) == 1
+    finally:
+        torch.set_num_threads(threads)
@@ -0,0 +1,57 @@
+"""
+置信度级联：廉价模型有把握的行直接采用，其余行交给 BERT，且只把这些行交给 BERT
+"""
+import numpy as np
+
+from src.analysis import cascade
+from src.analysis.inference import get_model_fingerprint, predict_proba
+from conftest import CHARS
+
+def test_evaluate_cascade():
+    cheap_probs = np.array([[0.95, 0.05], [0.6, 0.4], [0.2, 0.8], [0.97, 0.03]], dtype=np.float32)
+    bert_labels = np.array([0, 1, 1, 1])
+    report = cascade.evaluate_cascade(cheap_probs, bert_labels, thresholds=(0.5, 0.9, 0.99))
+    # 阈值 0.5：全部由廉价模型接手，第 2、4 行不一致；0.9：只接手第 1、4 行，第 4 行不一致
+    assert [row['routed_to_bert'] for row in report] == [0.0, 0.5, 1.0]
+    assert [row['agreement'] for row in report] == [0.5, 0.75, 1.0]
+
+def test_cascade_routes_only_uncertain_rows_to_bert(tiny_model, tmp_path, monkeypatch):
+    model, tokenizer = tiny_model
+    monkeypatch.setattr(cascade, "CASCADE_MODEL_DIR", tmp_path / "cascade")
+    model_key = get_model_fingerprint(model)
+
+    texts = list(dict.fromkeys(CHARS[i % len(CHARS):i % len(CHARS) + 2 + i % 5] for i in range(400)))
+    texts += [a + b + c for a in CHARS[:8] for b in CHARS[8:16] for c in CHARS[16:20]]
+    bert_labels = predict_proba(texts, model, tokenizer, show_progress=False).argmax(axis=-1)
+
+    assert cascade.train_cascade_model(texts[:50], bert_labels[:50], model_key, 8) is None
+    cheap_model = cascade.train_cascade_model(texts, bert_labels, model_key, 8)
+    assert cheap_model is not None
+
+    calls = []
+
+    def predict_fn(batch):
+        calls.append(list(batch))
+        return predict_proba(batch, model, tokenizer, show_progress=False)
+
+    queries = texts[:60]
+    cheap_probs = cascade.cheap_predict_proba(cheap_model, queries, 8)
+    threshold = float(np.median(cheap_probs.max(axis=-1)))
+    wrapped, cache_key, loaded = cascade.wrap_with_cascade(predict_fn, model_key, 8, threshold=threshold)
+    assert loaded is not None and cache_key != model_key and str(threshold) in cache_key
+
+    stats = {}
+    probs = wrapped(queries, stats=stats)
+    uncertain = cheap_probs.max(axis=-1) < threshold
+    assert 0 < uncertain.sum() < len(queries)
+    assert calls == [[t for t, u in zip(queries, uncertain) if u]]
+    assert stats == {'texts': len(queries), 'routed_to_bert': int(uncertain.sum())}
+    np.testing.assert_allclose(probs[~uncertain], cheap_probs[~uncertain], atol=1e-6)
+    np.testing.assert_allclose(probs[uncertain], predict_proba(calls[0], model, tokenizer, show_progress=False), atol=1e-6)
+
+    # 阈值超过 1 时全部交给 BERT，结果与全量 BERT 一致
+    full = cascade.predict_proba_cascade(queries, predict_fn, cheap_model, 8, threshold=1.01)
+    np.testing.assert_allclose(full, predict_proba(queries, model, tokenizer, show_progress=False), atol=1e-6)
+
+    # 其他模型没有廉价模型时原样返回
+    assert cascade.wrap_with_cascade(predict_fn, "other-model", 8) == (predict_fn, "other-model", None)
@@ -0,0 +1,71 @@
+"""
+发现爬虫：签名被拒绝时刷新 WBI 密钥重试一次；第 1 页请求失败与无结果分开报告
+"""
+import pytest
+
+from src.crawler import discovery_crawler
+
+NAV_URL = "https://api.bilibili.com/x/web-interface/nav"
+
+class _Response:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+def _nav_payload(index):
+    return {
+        'code': -101,
+        'data': {'wbi_img': {
+            'img_url': f"https://i0.hdslb.com/bfs/wbi/{'a' * 31}{index}.png",
+            'sub_url': f"https://i0.hdslb.com/bfs/wbi/{'b' * 32}.png",
+        }},
+    }
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """按顺序返回搜索接口的响应；nav 每次调用都给出一把新密钥"""
+    calls = {'nav': 0, 'search': []}
+    search_responses = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        if url == NAV_URL:
+            calls['nav'] += 1
+            return _Response(_nav_payload(calls['nav']))
+        calls['search'].append(params['w_rid'])
+        return _Response(search_responses.pop(0))
+
+    monkeypatch.setattr(discovery_crawler.requests, "get", fake_get)
+    monkeypatch.setattr(discovery_crawler, "wait_for_rate_limit", lambda: None)
+    monkeypatch.setattr(discovery_crawler, "_wbi_cache", {'mixin_key': None, 'expire': 0})
+    return calls, search_responses
+
+def _search_result(bvids):
+    return {'code': 0, 'data': {'numPages': 1, 'result': [{'bvid': bvid, 'title': bvid} for bvid in bvids]}}
+
+def test_signature_error_refreshes_key_and_retries_once(fake_api):
+    calls, responses = fake_api
+    responses.extend([{'code': -352, 'message': '风控校验失败'}, _search_result(["BV1", "BV2"])])
+
+    records, total_pages = discovery_crawler.fetch_search_page("测试", 1)
+    assert [r['bvid'] for r in records] == ["BV1", "BV2"] and total_pages == 1
+    assert calls['nav'] == 2
+    # 重试使用新密钥重新签名
+    assert calls['search'][0] != calls['search'][1]
+
+    # 只重试一次：连续的签名错误最终按失败返回
+    responses.extend([{'code': -403, 'message': '访问权限不足'}] * 2)
+    assert discovery_crawler.fetch_search_page("测试", 1) == (None, 0)
+    assert calls['nav'] == 3
+
+def test_discover_reports_failed_first_page_separately(fake_api, capsys):
+    _, responses = fake_api
+    responses.append({'code': -412, 'message': '请求被拦截'})
+    assert discovery_crawler.discover_by_keyword("测试", max_pages=1) == []
+    assert "请求失败" in capsys.readouterr().out
+
+    responses.append(_search_result([]))
+    assert discovery_crawler.discover_by_keyword("测试", max_pages=1) == []
+    output = capsys.readouterr().out
+    assert "无结果" in output and "请求失败" not in output
@@ -0,0 +1,76 @@
+"""
+提前退出：阈值超过 1 时与完整模型一致；否则每行在第一个有把握的出口离开，其余行的结果不受批次裁剪影响
+"""
+import copy
+import random
+
+import numpy as np
+import pytest
+import torch
+import transformers
+
+from src.analysis import early_exit
+from src.analysis.inference import predict_proba
+from conftest import CHARS
+
+NUM_LAYERS = 5
+
+@pytest.fixture(scope="module")
+def deep_model(tiny_model):
+    """与 tiny_model 相同配置但有 5 层 (出口在第 2、4 层)"""
+    model, tokenizer = tiny_model
+    config = copy.deepcopy(model.config)
+    config.num_hidden_layers = NUM_LAYERS
+    torch.manual_seed(0)
+    return transformers.BertForSequenceClassification(config).eval(), tokenizer
+
+def _texts(n):
+    rng = random.Random(0)
+    return list(dict.fromkeys("".join(rng.choice(CHARS) for _ in range(rng.randint(1, 24))) for _ in range(n)))
+
+def test_early_exit_matches_per_row_exit_decisions(deep_model, tmp_path, monkeypatch):
+    model, tokenizer = deep_model
+    monkeypatch.setattr(early_exit, "EARLY_EXIT_DIR", tmp_path / "early_exit")
+    texts = _texts(300)
+
+    assert early_exit.wrap_with_early_exit(model, tokenizer) is None
+    assert early_exit.calibrate_early_exit(model, tokenizer, texts[:50]) == (None, None)
+    heads, meta = early_exit.calibrate_early_exit(model, tokenizer, texts)
+    assert sorted(heads) == meta['exit_layers'] == [2, 4]
+
+    queries = texts[:80]
+    full = predict_proba(queries, model, tokenizer, show_progress=False)
+
+    # 阈值超过 1：没有样本提前退出
+    never = early_exit.wrap_with_early_exit(model, tokenizer, threshold=1.01)
+    np.testing.assert_allclose(predict_proba(queries, never, tokenizer, show_progress=False), full, atol=1e-5)
+    assert never.average_layers() == NUM_LAYERS and never.stats['exited'] == 0
+
+    # 逐行推算出口：第一个最大概率不低于阈值的出口
+    features, _ = early_exit.collect_exit_features(model, tokenizer, queries, [2, 4])
+    head_probs = {layer: early_exit._head_probs(heads[layer], features[layer]) for layer in (2, 4)}
+    threshold = float(np.median(head_probs[2].max(axis=-1)))
+    expected = full.copy()
+    depth = np.full(len(queries), NUM_LAYERS)
+    for layer in (4, 2):
+        leaving = head_probs[layer].max(axis=-1) >= threshold
+        expected[leaving] = head_probs[layer][leaving]
+        depth[leaving] = layer
+
+    wrapped = early_exit.wrap_with_early_exit(model, tokenizer, threshold=threshold)
+    actual = predict_proba(queries, wrapped, tokenizer, show_progress=False)
+    assert 0 < wrapped.stats['exited'] < len(queries)
+    assert wrapped.stats['exited'] == int((depth < NUM_LAYERS).sum())
+    assert wrapped.average_layers() == pytest.approx(depth.mean())
+    np.testing.assert_allclose(actual, expected, atol=1e-5)
+    assert wrapped.fingerprint.endswith(f"-exit{threshold}")
+
+def test_evaluate_early_exit():
+    exit_probs = {
+        2: np.array([[0.95, 0.05], [0.6, 0.4], [0.5, 0.5]]),
+        4: np.array([[0.9, 0.1], [0.1, 0.9], [0.3, 0.7]]),
+    }
+    report = early_exit.evaluate_early_exit(exit_probs, np.array([0, 0, 1]), num_layers=6, thresholds=(0.85, 1.01))
+    # 0.85：第 1 行在第 2 层离开 (正确)，第 2 行在第 4 层离开 (错误)，第 3 行跑满 6 层
+    assert report[0] == {'threshold': 0.85, 'average_layers': 4.0, 'exited_early': 2 / 3, 'agreement': 2 / 3}
+    assert report[1] == {'threshold': 1.01, 'average_layers': 6.0, 'exited_early': 0.0, 'agreement': 1.0}
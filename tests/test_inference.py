@@ -0,0 +1,61 @@
+"""
+predict_proba 按长度分桶组批后，结果必须按输入顺序返回
+"""
+import random
+import threading
+
+import numpy as np
+import torch
+
+from src.analysis.inference import predict_proba
+from conftest import CHARS
+
+def test_predict_proba_keeps_input_order(tiny_model):
+    model, tokenizer = tiny_model
+    rng = random.Random(0)
+    texts = ["".join(rng.choice(CHARS) for _ in range(rng.randint(1, 40))) for _ in range(200)]
+
+    # 很小的 token 预算和窗口：产生大量批次，长度排序跨越多个窗口
+    probs = predict_proba(texts, model, tokenizer, token_budget=64, max_batch_size=8, window_size=50, show_progress=False)
+
+    with torch.no_grad():
+        expected = np.stack([
+            torch.softmax(model(**tokenizer(text, return_tensors="pt")).logits, dim=-1)[0].numpy()
+            for text in texts
+        ])
+    assert probs.shape == (len(texts), model.config.num_labels)
+    np.testing.assert_allclose(probs, expected, atol=1e-5)
+
+class _FailingModel:
+    """第 fail_on 次前向计算时抛出异常的模型包装"""
+
+    def __init__(self, model, fail_on):
+        self.model = model
+        self.config = model.config
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def __call__(self, **inputs):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("forward failed")
+        return self.model(**inputs)
+
+def test_predict_proba_does_not_hang_when_forward_fails(tiny_model):
+    model, tokenizer = tiny_model
+    # 正好 3 个批次：第 2 批出错时生产者已放完全部批次，正卡在放结束标记上
+    texts = [CHARS[i] * 5 for i in range(12)]
+    failing = _FailingModel(model, fail_on=2)
+    errors = []
+
+    def run():
+        try:
+            predict_proba(texts, failing, tokenizer, max_batch_size=4, prefetch_batches=1, show_progress=False)
+        except RuntimeError as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout=30)
+    assert not worker.is_alive(), "predict_proba hung after the forward pass raised"
+    assert [str(e) for e in errors] == ["forward failed"]
@@ -0,0 +1,91 @@
+"""
+推理服务的微批次调度：并发的小请求合并为一次前向计算，交互请求排在批量请求之前
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.analysis.inference import predict_proba
+from src.analysis.inference_server import MicroBatcher
+from conftest import CHARS
+
+class _GatedModel:
+    """第一次前向计算阻塞到 gate 打开，让测试先把后续请求排进队列"""
+
+    def __init__(self, model):
+        self.model = model
+        self.config = model.config
+        self.gate = threading.Event()
+
+    def __call__(self, **inputs):
+        self.gate.wait(timeout=30)
+        return self.model(**inputs)
+
+def _submit_in_thread(batcher, texts, priority, results, name):
+    def run():
+        probs = batcher.submit(texts, priority=priority, timeout=30)
+        results[name] = (probs, time.perf_counter(), batcher.stats['batches'])
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def _wait_for_requests(batcher, n):
+    deadline = time.perf_counter() + 10
+    while batcher.stats['requests'] < n:
+        assert time.perf_counter() < deadline, "requests were not queued"
+        time.sleep(0.01)
+    # 提交线程在计数之后才释放锁，稍等确保请求已入队
+    time.sleep(0.05)
+
+@pytest.fixture
+def gated_batcher(tiny_model):
+    model, tokenizer = tiny_model
+    gated = _GatedModel(model)
+    batcher = MicroBatcher(gated, tokenizer, max_batch_texts=8, max_latency_ms=1)
+    yield batcher, gated
+    gated.gate.set()
+    batcher.stop()
+
+def test_concurrent_requests_share_one_forward_pass(tiny_model, gated_batcher):
+    model, tokenizer = tiny_model
+    batcher, gated = gated_batcher
+    results = {}
+    threads = [_submit_in_thread(batcher, ["占位"], 'bulk', results, 'blocker')]
+    _wait_for_requests(batcher, 1)
+    texts = [CHARS[i:i + 3] for i in range(8)]
+    threads += [_submit_in_thread(batcher, [text], 'interactive', results, i) for i, text in enumerate(texts)]
+    _wait_for_requests(batcher, 1 + len(texts))
+
+    gated.gate.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    # 占位请求 1 批，8 个单条请求合并为 1 批
+    assert batcher.stats['batches'] == 2
+    expected = predict_proba(texts, model, tokenizer, show_progress=False)
+    np.testing.assert_allclose(np.vstack([results[i][0] for i in range(len(texts))]), expected, atol=1e-5)
+
+def test_interactive_request_jumps_ahead_of_bulk(tiny_model, gated_batcher):
+    model, tokenizer = tiny_model
+    batcher, gated = gated_batcher
+    results = {}
+    threads = [_submit_in_thread(batcher, ["占位"], 'bulk', results, 'blocker')]
+    _wait_for_requests(batcher, 1)
+    bulk_texts = [CHARS[i % len(CHARS)] * (1 + i % 5) for i in range(64)]
+    threads.append(_submit_in_thread(batcher, bulk_texts, 'bulk', results, 'bulk'))
+    _wait_for_requests(batcher, 2)
+    interactive_texts = ["好耶", "前方高能"]
+    threads.append(_submit_in_thread(batcher, interactive_texts, 'interactive', results, 'interactive'))
+    _wait_for_requests(batcher, 3)
+
+    gated.gate.set()
+    for thread in threads:
+        thread.join(timeout=30)
+    _, interactive_done, interactive_batches = results['interactive']
+    _, bulk_done, bulk_batches = results['bulk']
+    # 批量请求要分 8 批完成，交互请求在放行后的第一批里就完成
+    assert interactive_done < bulk_done
+    assert interactive_batches <= 2 < bulk_batches
+    np.testing.assert_allclose(results['bulk'][0], predict_proba(bulk_texts, model, tokenizer, show_progress=False), atol=1e-5)
+    np.testing.assert_allclose(results['interactive'][0], predict_proba(interactive_texts, model, tokenizer, show_progress=False), atol=1e-5)
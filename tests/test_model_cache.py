@@ -0,0 +1,35 @@
+"""
+冷启动缓存：追踪图 + 内存映射权重的结果必须与原模型一致，且图文件中不含权重
+"""
+import os
+
+import numpy as np
+
+from src.analysis import model_cache
+from src.analysis.inference import get_model_fingerprint, predict_proba
+from conftest import CHARS
+
+def test_compiled_model_matches_eager_model(tiny_model, tmp_path, monkeypatch):
+    model, tokenizer = tiny_model
+    monkeypatch.setattr(model_cache, "MODEL_CACHE_DIR", tmp_path / "cache")
+    source = tmp_path / "source_model"
+    source.mkdir()
+    (source / "config.json").write_text(model.config.to_json_string(), encoding="utf-8")
+
+    output_dir = model_cache.build_compiled_model(model, tokenizer, source)
+    assert output_dir is not None
+    compiled, fast_tokenizer, meta = model_cache.load_compiled_model(source)
+
+    weights_bytes = (output_dir / "model.safetensors").stat().st_size
+    assert (output_dir / "graph.pt").stat().st_size < weights_bytes
+    assert compiled.fingerprint == get_model_fingerprint(model)
+
+    texts = [CHARS[i:i + 1 + i % 13] for i in range(len(CHARS))]
+    expected, expected_embeddings = predict_proba(texts, model, tokenizer, show_progress=False, return_embeddings=True)
+    actual, actual_embeddings = predict_proba(texts, compiled, fast_tokenizer, show_progress=False, return_embeddings=True)
+    np.testing.assert_allclose(actual, expected, atol=1e-5)
+    np.testing.assert_array_equal(actual_embeddings, expected_embeddings)
+
+    # 来源模型更新后产物失效
+    os.utime(source / "config.json", (0, 0))
+    assert model_cache.load_compiled_model(source) is None
@@ -0,0 +1,66 @@
+"""
+模型注册表：命中直接返回同一实例；超出内存预算时淘汰最久未使用的模型，并从共享提供者中移除
+"""
+import copy
+
+import pytest
+import torch
+import transformers
+
+from src.analysis import model as shared_models
+from src.analysis import model_registry
+from src.analysis.inference import get_model_fingerprint
+from src.analysis.model_registry import ModelRegistry
+
+MODEL_MB = 100.0
+
+@pytest.fixture
+def model_dirs(tiny_model, tmp_path, monkeypatch):
+    """三个权重不同的 tiny 模型目录"""
+    model, tokenizer = tiny_model
+    monkeypatch.setattr(shared_models, "USE_COMPILED_CACHE", False)
+    paths = []
+    for seed in range(3):
+        torch.manual_seed(seed)
+        path = tmp_path / f"model_{seed}"
+        transformers.BertForSequenceClassification(copy.deepcopy(model.config)).save_pretrained(path)
+        tokenizer.save_pretrained(path)
+        paths.append(str(path))
+    yield paths
+    for path in paths:
+        shared_models.unload(path)
+
+def test_registry_hits_and_lru_eviction(model_dirs, tiny_model, monkeypatch):
+    a, b, c = model_dirs
+    params_mb = sum(p.numel() * p.element_size() for p in tiny_model[0].parameters()) / 2**20
+    assert model_registry._model_size_mb(tiny_model[0], None) == params_mb
+    # tiny 模型不到 0.1 MB，按每个模型 100 MB 计；预算只够同时保留两个模型
+    monkeypatch.setattr(model_registry, "_model_size_mb", lambda model, model_path: MODEL_MB)
+    registry = ModelRegistry(memory_budget_mb=MODEL_MB * 2.5)
+
+    model_a, _ = registry.get(a)
+    model_b, _ = registry.get(b)
+    assert registry.get(a)[0] is model_a
+    assert shared_models.get_model(a) is model_a
+
+    # a 刚被访问过，加载 c 时淘汰最久未使用的 b
+    registry.get(c)
+    stats = registry.stats()
+    assert [entry['path'] for entry in stats['models']] == [c, a]
+    assert (stats['loads'], stats['hits'], stats['evictions']) == (3, 1, 1)
+    assert stats['memory_used_mb'] <= stats['memory_budget_mb']
+    assert not shared_models.is_loaded(b) and shared_models.is_loaded(a)
+
+    # 被淘汰的模型可以按指纹重新加载，此时淘汰 a
+    reloaded, _ = registry.get(get_model_fingerprint(model_b))
+    assert reloaded is not model_b and get_model_fingerprint(reloaded) == get_model_fingerprint(model_b)
+    assert [entry['path'] for entry in registry.stats()['models']] == [b, c]
+
+    # 缩小预算立即淘汰，只保留最近使用的模型
+    registry.set_memory_budget(MODEL_MB * 1.5)
+    assert [entry['path'] for entry in registry.stats()['models']] == [b]
+    assert not shared_models.is_loaded(c)
+
+def test_resolve_rejects_unknown_backend():
+    with pytest.raises(ValueError, match="未知后端"):
+        ModelRegistry().resolve("huggingface", backend="tensorrt")
@@ -0,0 +1,33 @@
+"""
+near_dedup 的 SimHash 签名必须与进程无关 (不受 PYTHONHASHSEED 影响)
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+TEXTS = ["前方高能前方高能！！", "这个视频太厉害了", "哈哈哈哈哈哈哈哈", "a"]
+SCRIPT = (
+    "import sys; sys.path.insert(0, {root!r})\n"
+    "from src.analysis.near_dedup import simhash\n"
+    "print(' '.join(str(s) for s in simhash({texts!r})))\n"
+)
+
+def _signatures_with_seed(seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(root=str(PROJECT_ROOT), texts=TEXTS)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+def test_simhash_is_stable_across_hash_seeds():
+    first = _signatures_with_seed(1)
+    second = _signatures_with_seed(2)
+    assert len(first) == len(TEXTS)
+    assert first == second
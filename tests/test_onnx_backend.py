@@ -0,0 +1,57 @@
+"""
+ONNX 后端：导出的模型与 PyTorch 结果一致；没有 token_type_ids 的模型也能导出
+"""
+import numpy as np
+import pytest
+import torch
+
+from src.analysis.inference import predict_proba
+from conftest import CHARS
+
+pytest.importorskip("onnxruntime")
+
+from src.analysis.onnx_backend import OnnxSentimentModel, export_onnx_model
+
+TEXTS = [CHARS[i:i + 1 + i % 11] for i in range(len(CHARS))]
+
+def _export_and_load(model, tokenizer, output_dir, quantize):
+    onnx_path = export_onnx_model(model, tokenizer, output_dir, quantize=quantize)
+    return OnnxSentimentModel(onnx_path, model.config, fingerprint="test")
+
+def test_onnx_matches_pytorch(tiny_model, tmp_path):
+    model, tokenizer = tiny_model
+    expected = predict_proba(TEXTS, model, tokenizer, show_progress=False)
+
+    onnx_model = _export_and_load(model, tokenizer, tmp_path / "fp32", quantize=False)
+    # 导出不能改变传入模型的状态 (例如切回训练模式)
+    assert not model.training
+    assert onnx_model.input_names == {'input_ids', 'attention_mask', 'token_type_ids'}
+    np.testing.assert_allclose(predict_proba(TEXTS, onnx_model, tokenizer, show_progress=False), expected, atol=1e-4)
+
+    # int8 量化有误差，但仍是同一个模型
+    quantized = _export_and_load(model, tokenizer, tmp_path / "int8", quantize=True)
+    actual = predict_proba(TEXTS, quantized, tokenizer, show_progress=False)
+    assert np.abs(actual - expected).max() < 0.1
+
+def test_onnx_export_without_token_type_ids(tiny_model, tmp_path):
+    transformers = pytest.importorskip("transformers")
+    _, bert_tokenizer = tiny_model
+    tokenizer = transformers.BertTokenizerFast(
+        tokenizer_object=bert_tokenizer.backend_tokenizer,
+        model_input_names=["input_ids", "attention_mask"],
+    )
+    assert 'token_type_ids' not in tokenizer(["好耶"])
+    config = transformers.DistilBertConfig(
+        vocab_size=bert_tokenizer.vocab_size, dim=16, n_layers=1, n_heads=2, hidden_dim=32,
+        max_position_embeddings=128, num_labels=8, initializer_range=0.5,
+    )
+    torch.manual_seed(0)
+    model = transformers.DistilBertForSequenceClassification(config).eval()
+
+    onnx_model = _export_and_load(model, tokenizer, tmp_path / "distilbert", quantize=False)
+    assert onnx_model.input_names == {'input_ids', 'attention_mask'}
+    np.testing.assert_allclose(
+        predict_proba(TEXTS, onnx_model, tokenizer, show_progress=False),
+        predict_proba(TEXTS, model, tokenizer, show_progress=False),
+        atol=1e-4,
+    )
@@ -0,0 +1,57 @@
+"""
+预测缓存：重复文本只推理一次，命中缓存不再调用模型；超过上限时淘汰最久未访问的条目
+"""
+import numpy as np
+
+from src.analysis import prediction_cache
+from src.analysis.inference import get_model_fingerprint, predict_proba, predict_proba_deduplicated
+from src.analysis.prediction_cache import PredictionCache, hash_text
+
+def test_deduplicated_prediction_uses_cache(tiny_model, tmp_path):
+    model, tokenizer = tiny_model
+    texts = ["前方高能", "好耶", "前方高能", "泪目", "好耶", "前方高能"]
+    model_key = get_model_fingerprint(model)
+    calls = []
+
+    def predict_fn(batch):
+        calls.append(list(batch))
+        return predict_proba(batch, model, tokenizer, show_progress=False)
+
+    expected = predict_proba(texts, model, tokenizer, show_progress=False)
+    with PredictionCache(tmp_path / "cache.sqlite") as cache:
+        first = predict_proba_deduplicated(texts, predict_fn, 8, cache=cache, model_key=model_key)
+        assert calls == [["前方高能", "好耶", "泪目"]]
+        np.testing.assert_allclose(first, expected, atol=1e-6)
+
+        # 已缓存的文本不再推理，新文本只推理一次；缓存以 float16 存储
+        second = predict_proba_deduplicated(texts + ["笑死", "笑死"], predict_fn, 8, cache=cache, model_key=model_key)
+        assert calls[1:] == [["笑死"]]
+        np.testing.assert_allclose(second[:len(texts)], expected, atol=1e-3)
+
+        # 模型指纹不同时不会误命中
+        predict_proba_deduplicated(["好耶"], predict_fn, 8, cache=cache, model_key=model_key + "-other")
+        assert calls[2:] == [["好耶"]]
+
+def test_eviction_drops_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1000))
+    monkeypatch.setattr(prediction_cache.time, "time", lambda: next(clock))
+    probs = np.eye(4, dtype=np.float32)
+
+    with PredictionCache(tmp_path / "cache.sqlite", max_entries=10) as cache:
+        old = [hash_text(f"旧{i}") for i in range(4)]
+        cache.put_many("m", old, probs)
+        cache.put_many("m", [hash_text(f"中{i}") for i in range(4)], probs)
+        # 访问一次最早写入的前两条，让它们变成最近使用
+        assert len(cache.get_many("m", old[:2])) == 2
+        cache.put_many("m", [hash_text(f"新{i}") for i in range(4)], probs)
+
+        # 12 条超过上限 10，淘汰到 9 条：删掉最久未访问的 old[2:] 与一条 "中"
+        assert len(cache) == 9
+        assert set(cache.get_many("m", old)) == set(old[:2])
+        np.testing.assert_array_equal(cache.get_many("m", old[:1])[old[0]], probs[0])
+
+    # 重新打开后容量检查从精确计数开始
+    with PredictionCache(tmp_path / "cache.sqlite", max_entries=10) as cache:
+        assert len(cache) == 9
+        cache.put_many("m", [hash_text("再来一条")], probs[:1])
+        assert len(cache) == 10
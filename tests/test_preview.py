@@ -0,0 +1,103 @@
+"""
+快速预览：抽样顺序的任意前缀都近似等比例分层；全量样本的估计与全量结果一致且误差为 0；
+逐轮扩大样本时已推理过的文本不再送入模型
+"""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis import run_prediction
+from src.analysis.inference import predict_proba
+from src.analysis.preview import PreviewEstimator, refinement_sizes
+from src.utils.time_series import SENTIMENT_WEIGHTS
+from conftest import CHARS
+
+def _danmaku_frame(n_rows, seed=0):
+    rng = random.Random(seed)
+    # 时间高度集中在前两天，弹幕集中在视频开头，各层大小差别很大
+    days = [0] * (n_rows // 2) + [1] * (n_rows // 4) + [rng.randint(2, 9) for _ in range(n_rows - n_rows // 2 - n_rows // 4)]
+    return pd.DataFrame({
+        'real_time': [pd.Timestamp("2024-11-01") + pd.Timedelta(days=d, seconds=rng.randint(0, 86399)) for d in days],
+        'video_time': [rng.expovariate(1 / 60) for _ in range(n_rows)],
+        'content': ["".join(rng.choice(CHARS[:12]) for _ in range(rng.randint(1, 3))) for _ in range(n_rows)],
+    })
+
+def test_order_prefixes_are_proportional_stratified_samples():
+    df = _danmaku_frame(3000)
+    estimator = PreviewEstimator(df)
+    order = estimator.order()
+    np.testing.assert_array_equal(np.sort(order), np.arange(len(df)))
+
+    stratum_sizes = np.bincount(estimator.strata)
+    for size in (100, 500, 2000):
+        counts = np.bincount(estimator.strata[order[:size]], minlength=len(stratum_sizes))
+        # 每层的样本数与等比例分配最多相差 2 行
+        assert np.abs(counts - stratum_sizes * size / len(df)).max() <= 2
+
+def test_full_sample_estimate_equals_full_result():
+    df = _danmaku_frame(1000)
+    labels = np.random.default_rng(0).integers(0, len(SENTIMENT_WEIGHTS), size=len(df))
+    estimator = PreviewEstimator(df)
+    order = estimator.order()
+
+    estimate = estimator.estimate(order, labels[order])
+    assert estimate['fraction'] == 1.0
+    distribution = estimate['distribution']
+    expected = np.bincount(labels, minlength=len(distribution)) / len(df)
+    np.testing.assert_allclose(distribution['proportion'], expected.round(4))
+    np.testing.assert_allclose(distribution['lower'], distribution['proportion'])
+    np.testing.assert_allclose(distribution['upper'], distribution['proportion'])
+
+    scores = pd.Series(labels).map(SENTIMENT_WEIGHTS)
+    index, lower, upper = estimate['sentiment_index']
+    assert index == pytest.approx(scores.mean(), abs=1e-4) and lower == upper == index
+    daily = scores.groupby(df['real_time'].dt.floor('D')).mean()
+    timeline = estimate['timeline'].set_index('time')
+    np.testing.assert_allclose(timeline['sentiment_index'], daily.round(4), atol=1e-4)
+    np.testing.assert_allclose(timeline['upper'] - timeline['lower'], 0, atol=1e-4)
+
+    # 部分样本的区间覆盖全量值
+    partial = estimator.estimate(order[:200], labels[order[:200]])
+    _, lower, upper = partial['sentiment_index']
+    assert partial['sampled'] == 200 and lower < scores.mean() < upper
+
+def test_refinement_sizes():
+    assert refinement_sizes(50000) == [2000, 8000, 32000, 50000]
+    assert refinement_sizes(500) == [500]
+    assert refinement_sizes(500, preview_size=100, growth=2) == [100, 200, 400, 500]
+
+def test_preview_rounds_dedupe_and_match_full_prediction(tiny_model):
+    model, tokenizer = tiny_model
+    df = _danmaku_frame(600)
+    seen = []
+
+    def predict_fn(texts):
+        seen.extend(texts)
+        return predict_proba(texts, model, tokenizer, show_progress=False)
+
+    previews = []
+    preview_df = df.copy()
+    probs = run_prediction.predict_dataframe_with_preview(
+        preview_df, predict_fn, 8, on_preview=previews.append, preview_size=50
+    )
+    assert [p['sampled'] for p in previews] == refinement_sizes(len(df), 50)
+    assert previews[-1]['fraction'] == 1.0
+    # 每个不同文本在所有轮次中只推理一次
+    assert len(seen) == len(set(seen)) == run_prediction.normalize_texts(df['content']).nunique()
+
+    full_df = df.copy()
+    expected = run_prediction.predict_dataframe(full_df, predict_fn, 8)
+    np.testing.assert_allclose(probs, expected, atol=1e-6)
+    pd.testing.assert_series_equal(preview_df['predicted_label_id'], full_df['predicted_label_id'])
+    last = previews[-1]['distribution']
+    np.testing.assert_allclose(last['proportion'], (np.bincount(expected.argmax(axis=-1), minlength=8) / len(df)).round(4))
+
+    # on_preview 返回 False 时停止：不返回结果，也不修改 df
+    stopped_df = df.copy()
+    calls = []
+    assert run_prediction.predict_dataframe_with_preview(
+        stopped_df, predict_fn, 8, on_preview=lambda estimate: calls.append(estimate) or False, preview_size=50
+    ) is None
+    assert len(calls) == 1 and 'predicted_label_id' not in stopped_df.columns
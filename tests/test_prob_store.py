@@ -0,0 +1,65 @@
+"""
+概率存储：float16 内存映射读写；流式追加的原始字节文件转换后与一次性写入一致
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis import run_prediction
+from src.utils import prob_store
+from conftest import CHARS
+
+def _random_probs(n_rows, num_labels=8, seed=0):
+    logits = np.random.default_rng(seed).normal(size=(n_rows, num_labels))
+    return (np.exp(logits) / np.exp(logits).sum(axis=-1, keepdims=True)).astype(np.float32)
+
+def test_save_and_load_probs(tmp_path):
+    output_path = tmp_path / "video_predict.csv"
+    probs = _random_probs(100)
+
+    path = prob_store.save_probs(output_path, probs)
+    assert path == tmp_path / "video_predict.probs.npy"
+
+    loaded = prob_store.load_probs(output_path)
+    assert isinstance(loaded, np.memmap) and loaded.dtype == np.float16 and loaded.shape == probs.shape
+    np.testing.assert_allclose(loaded, probs, atol=1e-3)
+    np.testing.assert_array_equal(prob_store.load_probs(path), loaded)
+
+    np.testing.assert_array_equal(prob_store.low_confidence_mask(loaded, 0.3), probs.max(axis=-1) < 0.3)
+    with pytest.raises(FileNotFoundError):
+        prob_store.load_probs(tmp_path / "missing.csv")
+
+def test_finalize_partial_probs(tmp_path, monkeypatch):
+    monkeypatch.setattr(prob_store, "COPY_BLOCK_ROWS", 16)
+    output_path = tmp_path / "stream.csv"
+    probs = _random_probs(50)
+    part_path = prob_store.partial_probs_path_for(output_path)
+
+    # 分块追加 (与断点续跑时追加写入相同)
+    with open(part_path, 'wb') as f:
+        f.write(probs[:20].astype(prob_store.PROBS_DTYPE).tobytes())
+    with open(part_path, 'ab') as f:
+        f.write(probs[20:].astype(prob_store.PROBS_DTYPE).tobytes())
+
+    path = prob_store.finalize_probs(output_path, 8)
+    assert not part_path.exists()
+    np.testing.assert_array_equal(np.load(path), probs.astype(np.float16))
+
+    # 没有任何行时也能生成空文件
+    open(part_path, 'wb').close()
+    assert prob_store.load_probs(prob_store.finalize_probs(output_path, 8)).shape == (0, 8)
+
+def test_pipeline_probs_align_with_output_rows(tiny_model, tmp_path):
+    model, tokenizer = tiny_model
+    input_path = tmp_path / "danmaku.csv"
+    texts = [CHARS[i % 9:i % 9 + 1 + i % 11] for i in range(30)] + ["", "前方"]
+    pd.DataFrame({'content': texts}).to_csv(input_path, index=False, encoding='utf-8-sig')
+    output_path = tmp_path / "danmaku_predict.csv"
+
+    df = run_prediction.run_prediction_pipeline(
+        input_path=input_path, output_path=output_path, model=model, tokenizer=tokenizer,
+        use_cache=False, save_probs=True,
+    )
+    probs = prob_store.load_probs(output_path)
+    assert probs.shape == (len(df), model.config.num_labels)
+    np.testing.assert_array_equal(np.asarray(probs).argmax(axis=-1), df['predicted_label_id'].to_numpy())
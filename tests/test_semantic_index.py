@@ -0,0 +1,62 @@
+"""
+语义索引：建索引 -> 读取 -> 检索，以及查询模型与建索引时不一致时报错
+"""
+import copy
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from src.analysis.inference import get_model_fingerprint, predict_proba, DEFAULT_MAX_LENGTH
+from src.analysis.semantic_index import SemanticIndex, build_index, index_exists
+from src.utils import normalize_texts
+from conftest import CHARS
+
+@pytest.fixture
+def index_path(tiny_model, tmp_path):
+    model, tokenizer = tiny_model
+    rng = random.Random(0)
+    texts = ["".join(rng.choice(CHARS) for _ in range(rng.randint(2, 15))) for _ in range(300)]
+    # 与流水线一致：句向量来自规范化后的文本
+    texts = normalize_texts(pd.Series(texts, dtype=object)).tolist()
+    _, embeddings = predict_proba(texts, model, tokenizer, show_progress=False, return_embeddings=True)
+    # CSV 的第 i 行对应 texts[i % 300]：每个文本出现两次
+    row_codes = np.arange(600) % len(texts)
+    output_path = tmp_path / "predictions.csv"
+    build_index(output_path, embeddings, row_codes, model_key=get_model_fingerprint(model, DEFAULT_MAX_LENGTH))
+    return output_path, texts
+
+def test_search_finds_the_query_text_itself(tiny_model, index_path):
+    model, tokenizer = tiny_model
+    output_path, texts = index_path
+    assert index_exists(output_path)
+    index = SemanticIndex.load(output_path)
+    assert len(index) == len(texts)
+
+    query_ids = [0, 57, 299]
+    results = index.search([texts[i] for i in query_ids], model, tokenizer, k=5)
+    for text_id, hits in zip(query_ids, results):
+        assert len(hits) == 5
+        scores = [score for _, score in hits]
+        assert scores == sorted(scores, reverse=True)
+        # 同一文本 (或编码完全相同的重复文本) 排在第一位
+        best_id, best_score = hits[0]
+        assert best_score == pytest.approx(1.0, abs=1e-3)
+        assert texts[best_id] == texts[text_id]
+        np.testing.assert_array_equal(index.rows_for(best_id), [best_id, best_id + len(texts)])
+
+def test_search_rejects_a_different_model(tiny_model, index_path):
+    model, tokenizer = tiny_model
+    output_path, texts = index_path
+    index = SemanticIndex.load(output_path)
+
+    other = copy.deepcopy(model)
+    with torch.no_grad():
+        other.classifier.weight.add_(0.1)
+    with pytest.raises(ValueError, match="不一致"):
+        index.search([texts[0]], other, tokenizer)
+    # 截断长度不同，句向量也不可比
+    with pytest.raises(ValueError, match="不一致"):
+        index.search([texts[0]], model, tokenizer, max_length=16)
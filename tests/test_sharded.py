@@ -0,0 +1,42 @@
+"""
+多进程分片推理：结果与单进程一致且行顺序不变；工作进程被杀死时主进程报错而不是永远等待
+"""
+import queue
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.analysis.inference import predict_proba
+from src.analysis.sharded import _get_result, predict_proba_sharded
+from conftest import CHARS
+
+def test_sharded_matches_single_process(tiny_model, tmp_path):
+    model, tokenizer = tiny_model
+    model_dir = tmp_path / "tiny_model"
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+
+    # 长短交错，分桶后批次顺序与输入顺序不同
+    texts = [CHARS[i % 7:i % 7 + 1 + (i * 5) % 29] for i in range(40)]
+    expected = predict_proba(texts, model, tokenizer, show_progress=False)
+    actual = predict_proba_sharded(
+        texts, model_dir, tokenizer, 8,
+        num_workers=2, threads_per_worker=1, token_budget=64, show_progress=False,
+    )
+    np.testing.assert_allclose(actual, expected, atol=1e-5)
+
+def test_get_result_detects_dead_worker():
+    dead = SimpleNamespace(exitcode=-9, pid=12345, is_alive=lambda: False)
+    alive = SimpleNamespace(exitcode=None, pid=12346, is_alive=lambda: True)
+    with pytest.raises(RuntimeError, match="died with exit code -9"):
+        _get_result(queue.Queue(), [alive, dead])
+
+    # 所有工作进程都正常退出，但结果没有收齐
+    finished = SimpleNamespace(exitcode=0, pid=12347, is_alive=lambda: False)
+    with pytest.raises(RuntimeError, match="All inference workers exited"):
+        _get_result(queue.Queue(), [finished])
+
+    results = queue.Queue()
+    results.put((0, "probs"))
+    assert _get_result(results, [alive]) == (0, "probs")
@@ -0,0 +1,80 @@
+"""
+run_prediction_streaming 的断点续跑：中途中断后重新运行，结果必须与一次跑完完全一致
+"""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis import run_prediction
+from src.analysis.checkpoint import progress_path_for
+from src.utils import prob_store
+from conftest import CHARS
+
+CHUNKSIZE = 10
+INTERRUPT_AFTER_CHUNKS = 2
+
+@pytest.fixture
+def danmaku_csv(tmp_path):
+    rng = random.Random(0)
+    texts = ["".join(rng.choice(CHARS) for _ in range(rng.randint(1, 20))) for _ in range(45)]
+    # 跨块的重复文本、清洗后为空的行
+    texts += texts[:8] + ["", "   "]
+    rng.shuffle(texts)
+    path = tmp_path / "danmaku.csv"
+    pd.DataFrame({
+        'video_time': [round(rng.uniform(0, 600), 2) for _ in texts],
+        'real_time': ["2024-11-01 12:00:00"] * len(texts),
+        'content': texts,
+    }).to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+def _run(tiny_model, input_path, output_path):
+    model, tokenizer = tiny_model
+    return run_prediction.run_prediction_streaming(
+        input_path=input_path,
+        output_path=output_path,
+        chunksize=CHUNKSIZE,
+        model=model,
+        tokenizer=tokenizer,
+        use_cache=False,
+        save_probs=True,
+    )
+
+def test_resume_matches_uninterrupted_run(tiny_model, danmaku_csv, tmp_path, monkeypatch, capsys):
+    expected_rows = _run(tiny_model, danmaku_csv, tmp_path / "full.csv")
+    expected = pd.read_csv(tmp_path / "full.csv", encoding='utf-8-sig')
+    expected_probs = np.asarray(prob_store.load_probs(tmp_path / "full.csv"))
+
+    # 第 INTERRUPT_AFTER_CHUNKS + 1 块推理时中断
+    output_path = tmp_path / "resumed.csv"
+    original = run_prediction.predict_dataframe
+    calls = {'n': 0}
+
+    def interrupted(*args, **kwargs):
+        calls['n'] += 1
+        if calls['n'] > INTERRUPT_AFTER_CHUNKS:
+            raise RuntimeError("simulated crash")
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(run_prediction, "predict_dataframe", interrupted)
+    assert _run(tiny_model, danmaku_csv, output_path) is None
+    assert progress_path_for(output_path).exists()
+
+    # 模拟崩溃时写了一半的内容：续跑时应按进度清单截掉
+    with open(output_path, 'ab') as f:
+        f.write("半行,没有写完".encode('utf-8'))
+    with open(prob_store.partial_probs_path_for(output_path), 'ab') as f:
+        f.write(b"\x00" * 7)
+
+    monkeypatch.setattr(run_prediction, "predict_dataframe", original)
+    capsys.readouterr()
+    assert _run(tiny_model, danmaku_csv, output_path) == expected_rows
+    assert f"Resuming from chunk {INTERRUPT_AFTER_CHUNKS + 1}" in capsys.readouterr().out
+
+    resumed = pd.read_csv(output_path, encoding='utf-8-sig')
+    pd.testing.assert_frame_equal(resumed, expected)
+    np.testing.assert_array_equal(np.asarray(prob_store.load_probs(output_path)), expected_probs)
+    assert len(resumed) == expected_rows
+    assert not progress_path_for(output_path).exists()
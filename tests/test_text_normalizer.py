@@ -0,0 +1,45 @@
+"""
+文本规范化：回复前缀、表情别名、重复压缩、全角半角与空白，整列处理且保留原索引
+"""
+import numpy as np
+import pandas as pd
+
+from src.utils.text_normalizer import normalize_text, normalize_texts
+
+def test_normalize_texts_rules():
+    raw = pd.Series(
+        [
+            "回复 @张三 : 哈哈哈哈哈哈",
+            "@李四：[tv_doge]好耶好耶好耶好耶",
+            "[狗头][小电视_狗头][笑哭]",
+            "ＡＢＣ１２３？？？？",
+            "6666666 awslawslawsl",
+            "好​耶   \n 泪目",
+            None,
+            "回复 @张三 : 哈哈哈哈哈哈",
+        ],
+        index=[10, 11, 12, 13, 14, 15, 16, 17],
+    )
+    result = normalize_texts(raw)
+
+    assert list(result.index) == list(raw.index)
+    assert result.tolist() == [
+        "哈哈哈",
+        "[doge]好耶好耶",
+        "[doge][doge][笑哭]",
+        "ABC123???",
+        "666 awslawsl",
+        "好耶 泪目",
+        "",
+        "哈哈哈",
+    ]
+
+def test_normalize_texts_options_and_single_text():
+    assert normalize_text("[tv_doge]哈哈哈哈哈", map_emotes=False, collapse_repeats=False) == "[tv_doge]哈哈哈哈哈"
+    assert normalize_text("ＡＢＣ", normalize_width=False) == "ＡＢＣ"
+    assert normalize_texts([]).empty
+
+    # 大量重复原文时结果与逐条规范化一致
+    texts = ["回复 @a: 前方高能！！！！", "[狗头]", "普通弹幕"] * 100
+    expected = [normalize_text(t) for t in texts[:3]] * 100
+    np.testing.assert_array_equal(normalize_texts(texts).to_numpy(), np.array(expected, dtype=object))